@@ -0,0 +1,164 @@
+# batch.py
+# Plays N independent games at once as (N, 10, 10) arrays. Offline tooling
+# only (simulation, balancing, bot training); requires numpy.
+import numpy as np
+
+from battleship.game_logic import BattleshipGame
+
+NO_SHOT = 0
+INVALID = 1
+ALREADY_ATTACKED = 2
+MISS = 3
+HIT = 4
+SUNK = 5
+
+
+class BatchGame:
+    def __init__(self, count, ships=None, seed=None):
+        ships = ships if ships is not None else BattleshipGame().ships
+        self.count = count
+        self.board_size = 10
+        self.ship_names = list(ships)
+        self.ship_lengths = np.array([ships[name] for name in self.ship_names], dtype=np.int16)
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(count)
+
+        # 0 is open water, k + 1 is the k-th ship in ship_names.
+        self.ship_ids = np.zeros((count, self.board_size, self.board_size), dtype=np.int8)
+        self.shots = np.zeros((count, self.board_size, self.board_size), dtype=bool)
+        self.ship_hits = np.zeros((count, len(self.ship_names)), dtype=np.int16)
+        self.placed = np.zeros((count, len(self.ship_names)), dtype=bool)
+
+    @classmethod
+    def from_legacy(cls, fleets, ships=None):
+        # fleets is a sequence of (board, player_ships) pairs as used by
+        # BattleshipGame.
+        batch = cls(len(fleets), ships)
+        index_of = {name: i for i, name in enumerate(batch.ship_names)}
+        for game, (board, player_ships) in enumerate(fleets):
+            for name, data in player_ships.items():
+                ship_index = index_of[name]
+                for row, col in data['positions']:
+                    batch.ship_ids[game, row, col] = ship_index + 1
+                batch.ship_hits[game, ship_index] = len(data['hits'])
+                batch.placed[game, ship_index] = True
+            for row in range(batch.board_size):
+                for col in range(batch.board_size):
+                    if board[row][col] in ('X', 'O'):
+                        batch.shots[game, row, col] = True
+        return batch
+
+    def _mask(self, active):
+        if active is None:
+            return np.ones(self.count, dtype=bool)
+        return np.asarray(active, dtype=bool)
+
+    def place_ship(self, ship_index, rows, cols, orientations, active=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        orientations = np.asarray(orientations)
+        horizontal = orientations == 'H'
+        vertical = orientations == 'V'
+
+        steps = np.arange(self.ship_lengths[ship_index])
+        cell_rows = rows[:, None] + steps[None, :] * vertical[:, None]
+        cell_cols = cols[:, None] + steps[None, :] * horizontal[:, None]
+        in_bounds = ((cell_rows >= 0) & (cell_rows < self.board_size) &
+                     (cell_cols >= 0) & (cell_cols < self.board_size)).all(axis=1)
+        cell_rows = np.where(in_bounds[:, None], cell_rows, 0)
+        cell_cols = np.where(in_bounds[:, None], cell_cols, 0)
+
+        empty = (self.ship_ids[self.games[:, None], cell_rows, cell_cols] == 0).all(axis=1)
+        ok = self._mask(active) & (horizontal | vertical) & in_bounds & empty & ~self.placed[:, ship_index]
+
+        placed_games = self.games[ok]
+        self.ship_ids[placed_games[:, None], cell_rows[ok], cell_cols[ok]] = ship_index + 1
+        self.placed[ok, ship_index] = True
+        return ok
+
+    def auto_place_ships(self, active=None):
+        active = self._mask(active)
+        for ship_index, length in enumerate(self.ship_lengths):
+            pending = active & ~self.placed[:, ship_index]
+            while pending.any():
+                orientations = np.where(self.rng.random(self.count) < 0.5, 'H', 'V')
+                horizontal = orientations == 'H'
+                rows = np.where(horizontal,
+                                self.rng.integers(0, self.board_size, self.count),
+                                self.rng.integers(0, self.board_size - length + 1, self.count))
+                cols = np.where(horizontal,
+                                self.rng.integers(0, self.board_size - length + 1, self.count),
+                                self.rng.integers(0, self.board_size, self.count))
+                pending &= ~self.place_ship(ship_index, rows, cols, orientations, pending)
+
+    def attack(self, rows, cols, active=None):
+        # Returns (codes, sunk_ship, game_over): one result code per game,
+        # the index of the ship sunk by this shot (or -1) and the game-over
+        # flag after the shot.
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        active = self._mask(active)
+
+        valid = (rows >= 0) & (rows < self.board_size) & (cols >= 0) & (cols < self.board_size)
+        safe_rows = np.where(valid, rows, 0)
+        safe_cols = np.where(valid, cols, 0)
+
+        target = active & valid
+        already = target & self.shots[self.games, safe_rows, safe_cols]
+        fresh = target & ~already
+        ships = self.ship_ids[self.games, safe_rows, safe_cols].astype(np.int64) - 1
+        hit = fresh & (ships >= 0)
+
+        self.shots[self.games[fresh], safe_rows[fresh], safe_cols[fresh]] = True
+        hit_games = self.games[hit]
+        hit_ships = ships[hit]
+        self.ship_hits[hit_games, hit_ships] += 1
+
+        sunk = np.zeros(self.count, dtype=bool)
+        sunk[hit_games] = self.ship_hits[hit_games, hit_ships] == self.ship_lengths[hit_ships]
+
+        codes = np.full(self.count, NO_SHOT, dtype=np.int8)
+        codes[active & ~valid] = INVALID
+        codes[already] = ALREADY_ATTACKED
+        codes[fresh & ~hit] = MISS
+        codes[hit] = HIT
+        codes[sunk] = SUNK
+        sunk_ship = np.where(sunk, ships, -1)
+        return codes, sunk_ship, self.check_game_over()
+
+    def check_game_over(self):
+        afloat = self.placed & (self.ship_hits < self.ship_lengths)
+        return self.placed.any(axis=1) & ~afloat.any(axis=1)
+
+    def result_strings(self, codes, sunk_ship):
+        # The same strings BattleshipGame.attack returns, for comparisons.
+        labels = {INVALID: "Invalid coordinates", ALREADY_ATTACKED: "Already attacked",
+                  MISS: "Miss", HIT: "Hit", NO_SHOT: None}
+        results = []
+        for code, ship_index in zip(codes.tolist(), sunk_ship.tolist()):
+            if code == SUNK:
+                results.append(f"Hit and sunk {self.ship_names[ship_index]}!")
+            else:
+                results.append(labels[code])
+        return results
+
+    def board(self, game):
+        board = [['.' for _ in range(self.board_size)] for _ in range(self.board_size)]
+        ids = self.ship_ids[game]
+        shots = self.shots[game]
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                ship = ids[row, col]
+                if shots[row, col]:
+                    board[row][col] = 'X' if ship else 'O'
+                elif ship:
+                    board[row][col] = self.ship_names[ship - 1][0]
+        return board
+
+
+if __name__ == '__main__':
+    batch = BatchGame(4, seed=7)
+    batch.auto_place_ships()
+    print(batch.board(0)[0])
+    codes, sunk_ship, game_over = batch.attack([0, 1, 2, 3], [0, 1, 2, 3])
+    print(batch.result_strings(codes, sunk_ship), game_over)
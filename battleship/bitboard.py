@@ -0,0 +1,169 @@
+# bitboard.py
+BOARD_SIZE = 10
+CELL_COUNT = BOARD_SIZE * BOARD_SIZE
+FULL_MASK = (1 << CELL_COUNT) - 1
+CELL_BITS = [1 << index for index in range(CELL_COUNT)]
+
+
+def cell_bit(row, col):
+    return CELL_BITS[row * BOARD_SIZE + col]
+
+
+def ship_mask(length, start_row, start_col, orientation):
+    if orientation == 'H':
+        if not (0 <= start_row < BOARD_SIZE and 0 <= start_col and start_col + length <= BOARD_SIZE):
+            return 0
+        return ((1 << length) - 1) << (start_row * BOARD_SIZE + start_col)
+    if orientation == 'V':
+        if not (0 <= start_col < BOARD_SIZE and 0 <= start_row and start_row + length <= BOARD_SIZE):
+            return 0
+        mask = 0
+        for row in range(start_row, start_row + length):
+            mask |= cell_bit(row, start_col)
+        return mask
+    return 0
+
+
+def mask_cells(mask):
+    while mask:
+        low = mask & -mask
+        index = low.bit_length() - 1
+        yield divmod(index, BOARD_SIZE)
+        mask ^= low
+
+
+class Fleet:
+    # `attacked` is hits | misses and `remaining` is occupancy & ~hits, both
+    # kept up to date so that attack and game-over checks are single ANDs.
+    __slots__ = ('occupancy', 'hits', 'misses', 'attacked', 'remaining', 'ship_masks')
+
+    def __init__(self):
+        self.occupancy = 0
+        self.hits = 0
+        self.misses = 0
+        self.attacked = 0
+        self.remaining = 0
+        self.ship_masks = {}
+
+    @classmethod
+    def from_legacy(cls, board, ships):
+        fleet = cls()
+        for name, data in ships.items():
+            mask = 0
+            for row, col in data['positions']:
+                mask |= cell_bit(row, col)
+            fleet.ship_masks[name] = mask
+            fleet.occupancy |= mask
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                if board[row][col] == 'X':
+                    fleet.hits |= cell_bit(row, col)
+                elif board[row][col] == 'O':
+                    fleet.misses |= cell_bit(row, col)
+        fleet.attacked = fleet.hits | fleet.misses
+        fleet.remaining = fleet.occupancy & ~fleet.hits
+        return fleet
+
+    def is_sunk(self, name):
+        return not self.ship_masks[name] & self.remaining
+
+    def sunk_ships(self):
+        return [name for name, mask in self.ship_masks.items() if not mask & self.remaining]
+
+    def to_board(self):
+        board = [['.' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        for name, mask in self.ship_masks.items():
+            for row, col in mask_cells(mask):
+                board[row][col] = name[0]
+        for row, col in mask_cells(self.hits):
+            board[row][col] = 'X'
+        for row, col in mask_cells(self.misses):
+            board[row][col] = 'O'
+        return board
+
+    def opponent_view(self):
+        board = [['.' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        for row, col in mask_cells(self.hits):
+            board[row][col] = 'X'
+        for row, col in mask_cells(self.misses):
+            board[row][col] = 'O'
+        return board
+
+    def to_ships(self):
+        ships = {}
+        for name, mask in self.ship_masks.items():
+            ships[name] = {
+                'positions': list(mask_cells(mask)),
+                'hits': list(mask_cells(mask & self.hits)),
+            }
+        return ships
+
+
+class BitboardGame:
+    def __init__(self):
+        self.board_size = BOARD_SIZE
+        self.ships = {
+            "AircraftCarrier": 5,
+            "Battleship": 4,
+            "Cruiser": 3,
+            "Submarine": 3,
+            "PatrolBoat": 2
+        }
+
+    def new_fleet(self):
+        return Fleet()
+
+    def place_ship(self, fleet, ship_name, ship_length, start_row, start_col, orientation):
+        mask = ship_mask(ship_length, start_row, start_col, orientation)
+        if not mask or mask & fleet.occupancy:
+            return False
+        fleet.occupancy |= mask
+        fleet.remaining |= mask
+        fleet.ship_masks[ship_name] = mask
+        return True
+
+    def auto_place_ships(self, fleet):
+        from battleship.placements import random_fleet
+        for ship_data in random_fleet(self.ships, fleet.occupancy):
+            self.place_ship(fleet, ship_data['name'], self.ships[ship_data['name']],
+                            ship_data['start_row'], ship_data['start_col'], ship_data['orientation'])
+
+    def ship_hit_by(self, fleet, bit):
+        for ship_name, mask in fleet.ship_masks.items():
+            if mask & bit:
+                return ship_name
+        return None
+
+    def attack(self, fleet, row, col):
+        if not (0 <= row < self.board_size and 0 <= col < self.board_size):
+            return "Invalid coordinates"
+        bit = CELL_BITS[row * BOARD_SIZE + col]
+        if fleet.attacked & bit:
+            return "Already attacked"
+        fleet.attacked |= bit
+
+        if fleet.remaining & bit:
+            fleet.hits |= bit
+            fleet.remaining ^= bit
+            ship_name = self.ship_hit_by(fleet, bit)
+            if not fleet.ship_masks[ship_name] & fleet.remaining:
+                return f"Hit and sunk {ship_name}!"
+            return "Hit"
+
+        fleet.misses |= bit
+        return "Miss"
+
+    def check_game_over(self, fleet):
+        return not fleet.remaining and fleet.occupancy != 0
+
+
+if __name__ == '__main__':
+    game = BitboardGame()
+    fleet = game.new_fleet()
+    game.auto_place_ships(fleet)
+    for row in fleet.to_board():
+        print(" ".join(row))
+
+    print("\nAttacking at (0,0):")
+    print(game.attack(fleet, 0, 0))
+    print("Game over:", game.check_game_over(fleet))
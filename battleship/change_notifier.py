@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from collections import deque
+
+CHANGE_LOG_LENGTH = 32
+
+
+class ChangeNotifier:
+    def __init__(self, log_length=CHANGE_LOG_LENGTH):
+        self.lock = threading.Lock()
+        self.waiters = {}
+        self.log_length = log_length
+
+    def changed(self, game, changes=()):
+        self.record(game, changes)
+        self.notify(game.game_id)
+
+    def record(self, game, changes=()):
+        # Bumps the version without waking anyone, for callers that have to
+        # persist the game before waiters may read it.
+        with self.lock:
+            game.version += 1
+            if game.change_log is None:
+                game.change_log = deque(maxlen=self.log_length)
+            game.change_log.append((game.version, tuple(changes)))
+
+    def notify(self, game_id):
+        with self.lock:
+            callbacks = self.waiters.pop(game_id, None)
+        self._wake(callbacks)
+
+    def observed(self, game_id, version):
+        # Wakes the waiters that are behind `version`, for changes made by
+        # another process and seen through a shared store.
+        with self.lock:
+            waiting = self.waiters.get(game_id)
+            if not waiting:
+                return
+            callbacks = [callback for callback, since in waiting.items() if since < version]
+            for callback in callbacks:
+                del waiting[callback]
+            if not waiting:
+                del self.waiters[game_id]
+        self._wake(callbacks)
+
+    def watched_games(self):
+        with self.lock:
+            return list(self.waiters)
+
+    def changes_since(self, game, since):
+        # Returns the current version and the set of changes made after
+        # `since`, or None for the changes when the log no longer reaches back.
+        with self.lock:
+            version = game.version
+            if since is None or since > version:
+                return version, None
+            merged = set()
+            expected = since + 1
+            for entry_version, changes in game.change_log or ():
+                if entry_version <= since:
+                    continue
+                if entry_version != expected:
+                    return version, None
+                merged.update(changes)
+                expected += 1
+            if expected != version + 1:
+                return version, None
+            return version, merged
+
+    def removed(self, game_id):
+        self.notify(game_id)
+
+    def _wake(self, callbacks):
+        if not callbacks:
+            return
+        for callback in callbacks:
+            try:
+                callback()
+            except RuntimeError:
+                # The waiting event loop has already been closed.
+                pass
+
+    def _add_waiter(self, game, since, callback):
+        with self.lock:
+            if game.version > since:
+                return False
+            self.waiters.setdefault(game.game_id, {})[callback] = since
+            return True
+
+    def _remove_waiter(self, game_id, callback):
+        with self.lock:
+            callbacks = self.waiters.get(game_id)
+            if callbacks is not None:
+                callbacks.pop(callback, None)
+                if not callbacks:
+                    del self.waiters[game_id]
+
+    def wait(self, game, since, timeout):
+        event = threading.Event()
+        wake = event.set
+        if not self._add_waiter(game, since, wake):
+            return
+        try:
+            event.wait(timeout)
+        finally:
+            self._remove_waiter(game.game_id, wake)
+
+    async def wait_async(self, game, since, timeout):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        if not self._add_waiter(game, since, wake):
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._remove_waiter(game.game_id, wake)
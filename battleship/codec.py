@@ -0,0 +1,222 @@
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Body formats of the HTTP API by media type, each an (encode, decode) pair
+# between objects and bytes. JSON is the default. Responses are only sent
+# as MessagePack when the msgpack package is installed: the small encoder
+# below is about four times slower than json.dumps, so without the package
+# it only reads MessagePack request bodies, for compatibility.
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+CODECS = {}
+# The types negotiate() may pick for a response.
+RESPONSE_TYPES = set()
+
+
+class CodecError(ValueError):
+    pass
+
+
+def register_codec(media_type, encode, decode, respond=True):
+    CODECS[media_type] = (encode, decode)
+    if respond:
+        RESPONSE_TYPES.add(media_type)
+
+
+def media_type_of(header):
+    return header.split(';', 1)[0].strip().lower()
+
+
+def negotiate(accept):
+    # The response type the Accept header prefers, JSON if it names none.
+    best, best_quality = JSON, 0.0
+    for item in (accept or '').split(','):
+        media_type, *params = item.split(';')
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in RESPONSE_TYPES and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def encode(media_type, obj):
+    return CODECS[media_type][0](obj)
+
+
+def decode(media_type, data):
+    try:
+        return CODECS[media_type][1](data)
+    except CodecError:
+        raise
+    except (ValueError, TypeError, IndexError, struct.error) as e:
+        raise CodecError(f"Invalid {media_type} body: {e}") from e
+
+
+def encode_json(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def decode_json(data):
+    return json.loads(data)
+
+
+# Built-in MessagePack, covering the types json can carry plus bytes.
+def pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj <= 0xffff:
+            out += struct.pack('>BB', 0xcc, obj) if obj <= 0xff else struct.pack('>BH', 0xcd, obj)
+        elif 0 <= obj <= 0xffffffffffffffff:
+            out += struct.pack('>BI', 0xce, obj) if obj <= 0xffffffff else struct.pack('>BQ', 0xcf, obj)
+        elif -0x80000000 <= obj < 0:
+            out += struct.pack('>Bi', 0xd2, obj)
+        elif -0x8000000000000000 <= obj < 0:
+            out += struct.pack('>Bq', 0xd3, obj)
+        else:
+            raise CodecError(f"Integer out of range: {obj}")
+    elif isinstance(obj, float):
+        out += struct.pack('>Bd', 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        size = len(data)
+        if size < 0x20:
+            out.append(0xa0 | size)
+        elif size <= 0xff:
+            out += struct.pack('>BB', 0xd9, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xda, size)
+        else:
+            out += struct.pack('>BI', 0xdb, size)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size <= 0xff:
+            out += struct.pack('>BB', 0xc4, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xc5, size)
+        else:
+            out += struct.pack('>BI', 0xc6, size)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x90 | size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xdc, size)
+        else:
+            out += struct.pack('>BI', 0xdd, size)
+        for item in obj:
+            pack(item, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 0x10:
+            out.append(0x80 | size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xde, size)
+        else:
+            out += struct.pack('>BI', 0xdf, size)
+        for key, value in obj.items():
+            pack(key, out)
+            pack(value, out)
+    else:
+        raise CodecError(f"Cannot encode {type(obj).__name__}")
+
+
+# Fixed-size formats by type byte: struct format and whether the value is
+# a length of raw bytes (1), a string (2), an array (3) or a map (4) to
+# read next rather than the value itself (0).
+FIXED = {
+    0xc4: ('>B', 1), 0xc5: ('>H', 1), 0xc6: ('>I', 1),
+    0xca: ('>f', 0), 0xcb: ('>d', 0),
+    0xcc: ('>B', 0), 0xcd: ('>H', 0), 0xce: ('>I', 0), 0xcf: ('>Q', 0),
+    0xd0: ('>b', 0), 0xd1: ('>h', 0), 0xd2: ('>i', 0), 0xd3: ('>q', 0),
+    0xd9: ('>B', 2), 0xda: ('>H', 2), 0xdb: ('>I', 2),
+    0xdc: ('>H', 3), 0xdd: ('>I', 3),
+    0xde: ('>H', 4), 0xdf: ('>I', 4),
+}
+CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+
+def unpack(data, offset):
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if 0xa0 <= code <= 0xbf:
+        end = offset + (code & 0x1f)
+        return str(data[offset:end], 'utf-8'), end
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if code in CONSTANTS:
+        return CONSTANTS[code], offset
+    if 0x80 <= code <= 0x8f:
+        kind, size = 4, code & 0x0f
+    elif 0x90 <= code <= 0x9f:
+        kind, size = 3, code & 0x0f
+    elif code in FIXED:
+        fmt, kind = FIXED[code]
+        size = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+        if kind == 0:
+            return size, offset
+    else:
+        raise CodecError(f"Unsupported type byte 0x{code:02x}")
+    if kind in (1, 2):
+        if offset + size > len(data):
+            raise CodecError("Truncated body")
+        value = bytes(data[offset:offset + size])
+        return (value.decode('utf-8') if kind == 2 else value), offset + size
+    if kind == 3:
+        items = []
+        for _ in range(size):
+            item, offset = unpack(data, offset)
+            items.append(item)
+        return items, offset
+    mapping = {}
+    for _ in range(size):
+        key, offset = unpack(data, offset)
+        mapping[key], offset = unpack(data, offset)
+    return mapping, offset
+
+
+def encode_msgpack(obj):
+    out = bytearray()
+    pack(obj, out)
+    return bytes(out)
+
+
+def decode_msgpack(data):
+    obj, offset = unpack(data, 0)
+    if offset > len(data):
+        raise CodecError("Truncated body")
+    if offset < len(data):
+        raise CodecError("Trailing bytes after body")
+    return obj
+
+
+register_codec(JSON, encode_json, decode_json)
+if msgpack is not None:
+    register_codec(MSGPACK, msgpack.packb, lambda data: msgpack.unpackb(data, strict_map_key=False))
+else:
+    register_codec(MSGPACK, encode_msgpack, decode_msgpack, respond=False)
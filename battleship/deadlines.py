@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeadlineScheduler:
+    # One pending deadline per key. Rescheduling or cancelling only marks the
+    # old heap entry dead; dead entries are dropped when they reach the top or
+    # when they outnumber the live ones.
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+
+    def schedule(self, key, when, callback, *args):
+        with self.condition:
+            old = self.entries.get(key)
+            if old is not None:
+                if old[0] == when:
+                    return
+                old[3] = None
+            entry = [when, next(self.counter), key, callback, args]
+            self.entries[key] = entry
+            heapq.heappush(self.heap, entry)
+            self._compact()
+            if self.heap[0] is entry:
+                self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                entry[3] = None
+
+    def pending(self, key):
+        with self.condition:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _compact(self):
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[3] is not None]
+            heapq.heapify(self.heap)
+
+    def _drop_dead(self):
+        while self.heap and self.heap[0][3] is None:
+            heapq.heappop(self.heap)
+
+    def pop_due(self, now=None):
+        due = []
+        with self.condition:
+            now = self.clock() if now is None else now
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                if entry[3] is None:
+                    continue
+                del self.entries[entry[2]]
+                due.append((entry[3], entry[4]))
+        return due
+
+    def wait(self, max_wait):
+        # Sleeps until the earliest deadline, a new earlier deadline, or
+        # max_wait seconds, whichever comes first.
+        with self.condition:
+            self._drop_dead()
+            timeout = max_wait
+            if self.heap:
+                timeout = min(max_wait, self.heap[0][0] - self.clock())
+            if timeout > 0:
+                self.condition.wait(timeout)
@@ -1,5 +1,5 @@
 # game_logic.py
-import random
+from battleship.placements import board_occupancy, random_fleet
 
 class BattleshipGame:
     def __init__(self):
@@ -40,23 +40,11 @@ class BattleshipGame:
         return True
 
     def auto_place_ships(self, player_board, player_ships):
-        for ship_name, ship_length in self.ships.items():
-            placed = False
-            while not placed:
-                orientation = random.choice(['H', 'V'])
-                if orientation == 'H':
-                    start_row = random.randint(0, self.board_size - 1)
-                    start_col = random.randint(0, self.board_size - ship_length)
-                else:
-                    start_row = random.randint(0, self.board_size - ship_length)
-                    start_col = random.randint(0, self.board_size - 1)
-                
-                temp_board = [row[:] for row in player_board]
-                temp_ships = {}
-
-                if self.place_ship(temp_board, temp_ships, ship_name, ship_length, start_row, start_col, orientation):
-                    self.place_ship(player_board, player_ships, ship_name, ship_length, start_row, start_col, orientation)
-                    placed = True
+        fleet = random_fleet(self.ships, board_occupancy(player_board))
+        for ship_data in fleet:
+            self.place_ship(player_board, player_ships, ship_data['name'], self.ships[ship_data['name']],
+                            ship_data['start_row'], ship_data['start_col'], ship_data['orientation'])
+        return fleet
 
 
     def attack(self, opponent_board, opponent_ships, row, col):
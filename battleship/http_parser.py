@@ -0,0 +1,117 @@
+import logging
+
+# Limits on what a client may send before we give up on the connection.
+MAX_HEAD_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+RECV_SIZE = 64 * 1024
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'version', 'headers', 'body', 'head')
+
+    def __init__(self, method, path, query, version, headers, body, head):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+        self.body = body
+        # The request line and headers as text, for logging.
+        self.head = head
+
+    @property
+    def target(self):
+        return f"{self.path}?{self.query}" if self.query else self.path
+
+    @property
+    def keep_alive(self):
+        return self.headers.get('connection', 'keep-alive').lower() != 'close'
+
+
+def parse_head(head):
+    lines = head.split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[0] or not parts[1]:
+        raise BadRequest(f"Malformed request line: {lines[0][:100]!r}")
+    method, target, version = parts
+    path, _, query = target.partition('?')
+    headers = {}
+    for line in lines[1:]:
+        key, sep, value = line.partition(':')
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return method.upper(), path, query, version, headers
+
+
+class RequestParser:
+    # Collects bytes from a connection in one buffer and cuts complete
+    # requests off its front as they arrive. The end of the head is looked
+    # for only in bytes not yet scanned, the head is decoded once and the
+    # body is copied out once, so a request costs the same however many
+    # reads it arrives in. Bytes after a request stay for the next one.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.pending = None
+
+    def feed(self, data):
+        self.buffer += data
+
+    def __bool__(self):
+        return bool(self.buffer)
+
+    def next_request(self):
+        # Returns the next complete request, or None until more bytes arrive.
+        if self.pending is None:
+            end = self.buffer.find(b'\r\n\r\n', self.scanned)
+            if end < 0:
+                if len(self.buffer) > MAX_HEAD_BYTES:
+                    raise BadRequest("Request head too large")
+                self.scanned = max(0, len(self.buffer) - 3)
+                return None
+            head = self.buffer[:end].decode('utf-8', errors='ignore')
+            method, path, query, version, headers = parse_head(head)
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise BadRequest(f"Invalid Content-Length: {headers['content-length']!r}")
+            if length < 0 or length > MAX_BODY_BYTES:
+                raise BadRequest(f"Unacceptable Content-Length: {length}")
+            self.pending = (method, path, query, version, headers, head, end + 4, length)
+        method, path, query, version, headers, head, start, length = self.pending
+        if len(self.buffer) < start + length:
+            return None
+        with memoryview(self.buffer) as view:
+            body = bytes(view[start:start + length])
+        del self.buffer[:start + length]
+        self.scanned = 0
+        self.pending = None
+        return Request(method, path, query, version, headers, body, head)
+
+
+def receive_request(connection, parser, view):
+    # Reads from a blocking socket into `view` until the parser has a whole
+    # request; None once the peer has closed the connection.
+    while True:
+        request = parser.next_request()
+        if request is not None:
+            return request
+        received = connection.recv_into(view)
+        if not received:
+            if parser:
+                logging.info(f"Connection closed with {len(parser.buffer)} bytes of an unfinished request")
+            return None
+        parser.feed(view[:received])
+
+
+def parse_request(data):
+    parser = RequestParser()
+    parser.feed(data)
+    request = parser.next_request()
+    if request is None:
+        raise BadRequest("Incomplete request")
+    return request
@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from battleship.records import ENGINE, Game
+
+# Journal records: crc32 and length of the payload, then the payload: an
+# opcode, the game id, the game version after the event and the event's own
+# fields. Replaying them through the Game methods rebuilds the game, so a
+# move costs a dozen bytes instead of a copy of the board.
+RECORD_HEADER = struct.Struct('<IH')
+EVENT_HEADER = struct.Struct('<BI')
+
+OPCODES = {
+    'create': 1,
+    'join': 2,
+    'place': 3,
+    'attack': 4,
+    'timeout': 5,
+    'pause': 6,
+    'resume': 7,
+    'forfeit': 8,
+    'reconnect': 9,
+    'remove': 10,
+}
+EVENTS = {code: name for name, code in OPCODES.items()}
+SHIP_NAMES = list(ENGINE.ships)
+FSYNC_INTERVAL = 0.05
+SNAPSHOT_EVERY = 10000
+
+
+def pack_str(value):
+    data = value.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def unpack_str(payload, offset):
+    length, = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    return payload[offset:offset + length].decode('utf-8'), offset + length
+
+
+def encode_event(game_id, version, event):
+    name, *fields = event
+    parts = [EVENT_HEADER.pack(OPCODES[name], version), pack_str(game_id)]
+    if name == 'create':
+        names, is_quick_match = fields
+        parts.append(struct.pack('<BB', len(names), is_quick_match))
+        parts.extend(pack_str(player_name) for player_name in names)
+    elif name == 'join':
+        parts.append(pack_str(fields[0]))
+    elif name == 'place':
+        player_number, ships = fields
+        parts.append(struct.pack('<BB', player_number, len(ships)))
+        for ship_data in ships:
+            parts.append(struct.pack('<BBBB', SHIP_NAMES.index(ship_data['name']), ship_data['start_row'],
+                                     ship_data['start_col'], ship_data['orientation'] == 'V'))
+    elif name == 'attack':
+        # Every off-board shot plays out the same way, so they all share -1.
+        player_number, row, col = fields
+        on_board = 0 <= row < ENGINE.board_size and 0 <= col < ENGINE.board_size
+        parts.append(struct.pack('<Bbb', player_number, row if on_board else -1, col if on_board else -1))
+    elif name in ('pause', 'resume', 'reconnect'):
+        parts.append(struct.pack('<B', fields[0]))
+    payload = b''.join(parts)
+    return RECORD_HEADER.pack(zlib.crc32(payload), len(payload)) + payload
+
+
+def decode_event(payload):
+    code, version = EVENT_HEADER.unpack_from(payload)
+    game_id, offset = unpack_str(payload, EVENT_HEADER.size)
+    name = EVENTS[code]
+    if name == 'create':
+        count, is_quick_match = struct.unpack_from('<BB', payload, offset)
+        offset += 2
+        names = []
+        for _ in range(count):
+            player_name, offset = unpack_str(payload, offset)
+            names.append(player_name)
+        event = (name, names, bool(is_quick_match))
+    elif name == 'join':
+        event = (name, unpack_str(payload, offset)[0])
+    elif name == 'place':
+        player_number, count = struct.unpack_from('<BB', payload, offset)
+        offset += 2
+        ships = []
+        for _ in range(count):
+            index, row, col, vertical = struct.unpack_from('<BBBB', payload, offset)
+            offset += 4
+            ships.append({'name': SHIP_NAMES[index], 'start_row': row, 'start_col': col,
+                          'orientation': 'V' if vertical else 'H'})
+        event = (name, player_number, ships)
+    elif name == 'attack':
+        event = (name, *struct.unpack_from('<Bbb', payload, offset))
+    elif name in ('pause', 'resume', 'reconnect'):
+        event = (name, struct.unpack_from('<B', payload, offset)[0])
+    else:
+        event = (name,)
+    return game_id, version, event
+
+
+def read_segment(path):
+    # Yields decoded events and stops at the first torn or corrupt record,
+    # which can only be the unsynced tail of the last segment.
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        crc, length = RECORD_HEADER.unpack_from(data, offset)
+        payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            logging.warning(f"Journal {path} ends with a damaged record at byte {offset}")
+            return
+        yield decode_event(payload)
+        offset += RECORD_HEADER.size + length
+
+
+def apply_event(games, game_id, version, event):
+    name, *fields = event
+    game = games.get(game_id)
+    if name == 'create':
+        if game is None:
+            games[game_id] = Game(game_id, *fields)
+        return
+    if name == 'remove':
+        games.pop(game_id, None)
+        return
+    if game is None or version <= game.version:
+        return
+
+    if name == 'join':
+        game.add_player(fields[0])
+    elif name == 'place':
+        game.place_fleet(*fields)
+    elif name == 'attack':
+        game.attack(*fields)
+    elif name == 'timeout':
+        game.time_out_turn()
+    elif name == 'pause':
+        game.pause(fields[0])
+    elif name == 'resume':
+        game.resume(fields[0])
+    elif name == 'forfeit':
+        game.forfeit_disconnected()
+    elif name == 'reconnect':
+        game.players[fields[0]].connected = True
+    game.version = version
+
+
+class Journal:
+    # Segment N holds the events after snapshot N. Appends only fill the
+    # file buffer; a flusher thread writes and fsyncs every FSYNC_INTERVAL,
+    # so many events share one fsync, and rolls a new snapshot every
+    # SNAPSHOT_EVERY events so that recovery never replays more than that.
+    def __init__(self, directory, games_source, fsync_interval=FSYNC_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.games_source = games_source
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.Lock()
+        self.segment = None
+        self.file = None
+        self.dirty = False
+        self.events_since_snapshot = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, number):
+        return os.path.join(self.directory, f"{kind}-{number:08d}.{'jsonl' if kind == 'snapshot' else 'log'}")
+
+    def _numbers(self, kind):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(kind + '-') and not name.endswith('.tmp'):
+                try:
+                    numbers.append(int(name[len(kind) + 1:].split('.')[0]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def recover(self):
+        games = {}
+        snapshots = self._numbers('snapshot')
+        start = snapshots[-1] if snapshots else 0
+        if snapshots:
+            with open(self._path('snapshot', start), encoding='utf-8') as f:
+                for line in f:
+                    game = Game.from_dict(json.loads(line))
+                    games[game.game_id] = game
+        replayed = 0
+        for number in self._numbers('journal'):
+            if number < start:
+                continue
+            for game_id, version, event in read_segment(self._path('journal', number)):
+                try:
+                    apply_event(games, game_id, version, event)
+                except (ValueError, KeyError, IndexError) as e:
+                    logging.warning(f"Skipping journal event {event[0]} for game {game_id}: {e}")
+                replayed += 1
+        logging.info(f"Recovered {len(games)} games from snapshot {start} and {replayed} journal events")
+        return games
+
+    def start(self):
+        # Writes a snapshot of the recovered state and opens the segment
+        # after it, so the next restart starts from here.
+        self.snapshot()
+        threading.Thread(target=self._flusher, daemon=True).start()
+
+    def append(self, game_id, version, event):
+        record = encode_event(game_id, version, event)
+        with self.lock:
+            self.file.write(record)
+            self.dirty = True
+            self.events_since_snapshot += 1
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def snapshot(self):
+        with self.lock:
+            number = (self.segment + 1) if self.segment is not None else (max(self._numbers('journal') + self._numbers('snapshot'), default=-1) + 1)
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+            # Events from here on go to the new segment.
+            self.file = open(self._path('journal', number), 'ab')
+            self.segment = number
+            self.dirty = False
+            self.events_since_snapshot = 0
+            games = list(self.games_source())
+
+        # Each game is read under its own lock, outside the journal's, so it
+        # is never caught between a change and that change's version bump
+        # and journal record. Events journaled after the switch above are
+        # replayed from the new segment and skipped by version when the
+        # snapshot already has them.
+        data = []
+        for game in games:
+            with game.lock:
+                data.append(game.to_dict())
+
+        temp_path = self._path('snapshot', number) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for game_data in data:
+                f.write(json.dumps(game_data) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path('snapshot', number))
+
+        for old in self._numbers('snapshot'):
+            if old < number:
+                os.remove(self._path('snapshot', old))
+        for old in self._numbers('journal'):
+            if old < number:
+                os.remove(self._path('journal', old))
+
+    def _flusher(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            try:
+                self.flush()
+                if self.events_since_snapshot >= self.snapshot_every:
+                    started = time.time()
+                    self.snapshot()
+                    logging.info(f"Wrote journal snapshot {self.segment} in {time.time() - started:.2f}s")
+            except (OSError, RuntimeError) as e:
+                # A snapshot that fails leaves the previous one and every
+                # segment after it in place, so it is simply tried again.
+                logging.error(f"Journal write failed: {e}")
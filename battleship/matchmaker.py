@@ -0,0 +1,212 @@
+import bisect
+import collections
+import logging
+import threading
+import time
+
+# Matched players whose wait is kept for the statistics.
+WAIT_SAMPLES = 1000
+# Waiting players are grouped by rating in buckets this wide. Two players
+# may be paired when their ratings are within the allowed gap of either of
+# them; the gap starts at BASE_RATING_GAP and widens the longer they wait.
+RATING_BUCKET = 50
+BASE_RATING_GAP = 100
+RATING_GAP_PER_SECOND = 10
+MAX_RATING_GAP = 800
+# How often waiting players are re-checked as their gaps widen.
+SWEEP_INTERVAL = 2
+
+
+def rating_gap(entry, now):
+    return min(BASE_RATING_GAP + RATING_GAP_PER_SECOND * (now - entry['timestamp']), MAX_RATING_GAP)
+
+
+def can_pair(entry, other, now):
+    return abs(entry['rating'] - other['rating']) <= max(rating_gap(entry, now), rating_gap(other, now))
+
+
+class MatchQueue:
+    # Waiting players in one arrival-ordered deque per rating bucket, plus an
+    # index by name and the sorted list of bucket numbers. Removing a player
+    # only drops them from the index; a bucket skips entries that are no
+    # longer indexed once they reach its front. A match only looks at the
+    # oldest player of the buckets within MAX_RATING_GAP, so it costs the
+    # same however many players are waiting.
+    def __init__(self):
+        self.buckets = {}
+        self.bucket_keys = []
+        self.by_name = {}
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def _live(self, entry):
+        return self.by_name.get(entry['name']) is entry
+
+    def add(self, entry):
+        if entry['name'] in self.by_name:
+            return False
+        self.by_name[entry['name']] = entry
+        key = int(entry['rating'] // RATING_BUCKET)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = collections.deque()
+            bisect.insort(self.bucket_keys, key)
+        bucket.append(entry)
+        if len(bucket) > 2 * len(self.by_name) + 64:
+            self.buckets[key] = collections.deque(entry for entry in bucket if self._live(entry))
+        return True
+
+    def remove(self, name, timestamp=None):
+        entry = self.by_name.get(name)
+        if entry is None or (timestamp is not None and entry['timestamp'] != timestamp):
+            return False
+        del self.by_name[name]
+        return True
+
+    def _front(self, key):
+        bucket = self.buckets[key]
+        while bucket and not self._live(bucket[0]):
+            bucket.popleft()
+        if not bucket:
+            del self.buckets[key]
+            del self.bucket_keys[bisect.bisect_left(self.bucket_keys, key)]
+            return None
+        return bucket[0]
+
+    def _pop_front(self, key):
+        entry = self.buckets[key].popleft()
+        del self.by_name[entry['name']]
+        return entry
+
+    def oldest(self):
+        fronts = [entry for entry in map(self._front, list(self.bucket_keys)) if entry is not None]
+        return min(fronts, key=lambda entry: entry['timestamp'], default=None)
+
+    def pop_match(self, entry, now):
+        # Takes the waiting player closest in rating that can be paired with
+        # `entry`, which is not in the queue itself.
+        home = int(entry['rating'] // RATING_BUCKET)
+        reach = MAX_RATING_GAP // RATING_BUCKET + 1
+        low = bisect.bisect_left(self.bucket_keys, home - reach)
+        high = bisect.bisect_right(self.bucket_keys, home + reach)
+        for key in sorted(self.bucket_keys[low:high], key=lambda key: abs(key - home)):
+            other = self._front(key)
+            if other is not None and can_pair(entry, other, now):
+                return self._pop_front(key)
+        return None
+
+    def pop_pairs(self, now):
+        # Pairs whoever can be paired now, oldest player of each bucket
+        # first; each pair is returned in arrival order.
+        pairs = []
+        for key in list(self.bucket_keys):
+            while key in self.buckets:
+                entry = self._front(key)
+                if entry is None:
+                    break
+                self._pop_front(key)
+                other = self.pop_match(entry, now)
+                if other is None:
+                    # Back to the front of its bucket, which pop_match may
+                    # have dropped as empty.
+                    self.by_name[entry['name']] = entry
+                    if key not in self.buckets:
+                        self.buckets[key] = collections.deque()
+                        bisect.insort(self.bucket_keys, key)
+                    self.buckets[key].appendleft(entry)
+                    break
+                pairs.append((entry, other) if entry['timestamp'] <= other['timestamp'] else (other, entry))
+        return pairs
+
+
+class Matchmaker:
+    # Pairs quick match players by rating. The queue itself is kept by the
+    # game store, so processes sharing a store match from one line. A new
+    # player is matched straight away if someone suitable is waiting;
+    # otherwise a sweep every SWEEP_INTERVAL pairs players whose gaps have
+    # widened enough, and on_match creates their game.
+    def __init__(self, store, deadlines, timeout, on_match):
+        self.store = store
+        self.deadlines = deadlines
+        self.timeout = timeout
+        self.on_match = on_match
+        self.lock = threading.Lock()
+        self.waits = collections.deque(maxlen=WAIT_SAMPLES)
+        self.matched = 0
+        self.expired = 0
+        self.cancelled = 0
+
+    def _paired(self, pairs, now):
+        for pair in pairs:
+            for paired in pair:
+                self.deadlines.cancel(('queue', paired['name']))
+                self.waits.append(now - paired['timestamp'])
+            self.matched += 1
+
+    def _start_games(self, pairs):
+        return [(player1, player2, self.on_match(player1, player2)) for player1, player2 in pairs]
+
+    def join(self, player_name):
+        # Returns None if the player is already queued, otherwise the games
+        # started as (player1, player2, game_id).
+        now = time.time()
+        entry = {'name': player_name, 'timestamp': now, 'rating': self.store.rating(player_name)[0]}
+        with self.lock:
+            if self.store.queue_contains(player_name):
+                return None
+            other = self.store.queue_match(entry, now)
+            if other is not None:
+                pairs = [(other, entry)]
+                self._paired(pairs, now)
+            else:
+                if not self.store.queue_add(entry):
+                    return None
+                pairs = []
+                self.deadlines.schedule(('queue', player_name), now + self.timeout, self.expire, entry)
+                if not self.deadlines.pending(('matchmaking',)):
+                    self.deadlines.schedule(('matchmaking',), now + SWEEP_INTERVAL, self.sweep)
+        return self._start_games(pairs)
+
+    def sweep(self):
+        now = time.time()
+        with self.lock:
+            pairs = self.store.queue_pop_pairs(now)
+            self._paired(pairs, now)
+            if self.store.queue_depth():
+                self.deadlines.schedule(('matchmaking',), now + SWEEP_INTERVAL, self.sweep)
+        self._start_games(pairs)
+
+    def cancel(self, player_name):
+        with self.lock:
+            if not self.store.queue_remove(player_name):
+                return False
+            self.deadlines.cancel(('queue', player_name))
+            self.cancelled += 1
+        return True
+
+    def waiting(self, player_name):
+        return self.store.queue_contains(player_name)
+
+    def expire(self, entry):
+        with self.lock:
+            if self.store.queue_remove(entry['name'], entry['timestamp']):
+                self.expired += 1
+                logging.info(f"Removed {entry['name']} from quick match queue (timeout)")
+
+    def stats(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            oldest = self.store.queue_oldest()
+            return {
+                'queue_depth': self.store.queue_depth(),
+                'longest_waiting': time.time() - oldest['timestamp'] if oldest else 0,
+                'matches_made': self.matched,
+                'expired': self.expired,
+                'cancelled': self.cancelled,
+                'average_wait': sum(waits) / len(waits) if waits else 0,
+                'p95_wait': waits[int(len(waits) * 0.95)] if waits else 0,
+            }
@@ -0,0 +1,127 @@
+# placements.py
+import random
+
+from battleship.bitboard import BOARD_SIZE, ship_mask
+
+ORIENTATIONS = ('H', 'V')
+
+
+def build_placement_tables():
+    placements = {}
+    masks = {}
+    covering = {}
+    for length in range(1, BOARD_SIZE + 1):
+        placements[length] = []
+        covering[length] = [0] * (BOARD_SIZE * BOARD_SIZE)
+        for orientation in ORIENTATIONS:
+            for row in range(BOARD_SIZE):
+                for col in range(BOARD_SIZE):
+                    mask = ship_mask(length, row, col, orientation)
+                    if mask:
+                        bit = 1 << len(placements[length])
+                        placements[length].append((mask, row, col, orientation))
+                        masks[(length, row, col, orientation)] = mask
+                        for cell in cells_of(mask):
+                            covering[length][cell] |= bit
+    return placements, masks, covering
+
+
+def cells_of(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# PLACEMENTS[length] lists every in-bounds placement as (mask, row, col,
+# orientation); PLACEMENT_MASKS maps (length, row, col, orientation) to its
+# mask for constant-time validation. PLACEMENTS_COVERING[length][cell] has
+# bit i set when PLACEMENTS[length][i] covers that cell.
+PLACEMENTS, PLACEMENT_MASKS, PLACEMENTS_COVERING = build_placement_tables()
+ALL_PLACEMENTS = {length: (1 << len(placements)) - 1 for length, placements in PLACEMENTS.items()}
+
+
+def board_occupancy(board):
+    flat = ''.join(map(''.join, board))
+    occupancy = 0
+    if flat.count('.') != len(flat):
+        for index, cell in enumerate(flat):
+            if cell != '.':
+                occupancy |= 1 << index
+    return occupancy
+
+
+def nth_set_bit(bits, n):
+    # Position of the n-th (from 0) set bit, halving the range each step.
+    position = 0
+    width = bits.bit_length()
+    while width > 1:
+        half = width >> 1
+        low = bits & ((1 << half) - 1)
+        count = low.bit_count()
+        if n < count:
+            bits = low
+            width = half
+        else:
+            n -= count
+            bits >>= half
+            position += half
+            width -= half
+    return position
+
+
+def random_placement(ship_length, taken, rng=random):
+    # Every placement that touches a taken cell is struck from the set of
+    # all placements, and one of the rest is drawn uniformly, so there are
+    # no retries and the work is bounded by the number of taken cells.
+    covering = PLACEMENTS_COVERING[ship_length]
+    blocked = 0
+    for cell in cells_of(taken):
+        blocked |= covering[cell]
+    legal = ALL_PLACEMENTS[ship_length] & ~blocked
+    if not legal:
+        return None
+    return PLACEMENTS[ship_length][nth_set_bit(legal, rng.randrange(legal.bit_count()))]
+
+
+def random_fleet(ships, occupancy=0, rng=random):
+    # Starts over only when the ships already placed leave no room at all
+    # for a later one.
+    while True:
+        taken = occupancy
+        fleet = []
+        for ship_name, ship_length in ships.items():
+            placement = random_placement(ship_length, taken, rng)
+            if placement is None:
+                break
+            mask, row, col, orientation = placement
+            taken |= mask
+            fleet.append({'name': ship_name, 'start_row': row, 'start_col': col, 'orientation': orientation})
+        else:
+            return fleet
+
+
+def validate_fleet(fleet, ships):
+    if not isinstance(fleet, list) or len(fleet) != len(ships):
+        return False, f"Expected {len(ships)} ships"
+
+    taken = 0
+    seen = set()
+    for ship_data in fleet:
+        if not isinstance(ship_data, dict):
+            return False, "Invalid ship entry"
+        name = ship_data.get('name')
+        if not isinstance(name, str) or name not in ships or name in seen:
+            return False, f"Unknown or duplicate ship: {name}"
+        seen.add(name)
+
+        row, col = ship_data.get('start_row'), ship_data.get('start_col')
+        if type(row) is not int or type(col) is not int:
+            return False, f"{name} has invalid coordinates"
+        mask = PLACEMENT_MASKS.get((ships[name], row, col, ship_data.get('orientation')))
+        if mask is None:
+            return False, f"{name} is out of bounds"
+        if mask & taken:
+            return False, f"{name} overlaps another ship"
+        taken |= mask
+    return True, None
@@ -0,0 +1,22 @@
+# Elo ratings by player name. New players move faster until they have
+# played PROVISIONAL_GAMES, so a rating settles after a handful of games.
+DEFAULT_RATING = 1500.0
+K_FACTOR = 24
+PROVISIONAL_K_FACTOR = 48
+PROVISIONAL_GAMES = 10
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def k_factor(games_played):
+    return PROVISIONAL_K_FACTOR if games_played < PROVISIONAL_GAMES else K_FACTOR
+
+
+def rate_game(winner, loser):
+    # Takes and returns (rating, games_played) for both players.
+    (winner_rating, winner_games), (loser_rating, loser_games) = winner, loser
+    gain = 1 - expected_score(winner_rating, loser_rating)
+    return ((winner_rating + k_factor(winner_games) * gain, winner_games + 1),
+            (loser_rating - k_factor(loser_games) * gain, loser_games + 1))
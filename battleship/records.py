@@ -0,0 +1,326 @@
+# records.py
+import json
+import operator
+import threading
+import time
+from collections import deque
+
+from battleship.bitboard import BOARD_SIZE, BitboardGame, Fleet
+from battleship.change_notifier import CHANGE_LOG_LENGTH
+
+ENGINE = BitboardGame()
+# Shared by every fleet that has not been placed yet; tuples so that nothing
+# can write into it.
+EMPTY_BOARD = tuple(('.',) * BOARD_SIZE for _ in range(BOARD_SIZE))
+# A row of the JSON-encoded view and the ', ' after it. Every cell encodes
+# as one character in quotes, so cell (row, col) always sits at the same
+# offset and can be overwritten in place.
+VIEW_ROW_WIDTH = len(json.dumps(['.'] * BOARD_SIZE)) + 2
+
+
+def encode_view(board):
+    return bytearray(json.dumps([[cell if cell in ('X', 'O') else '.' for cell in row] for row in board]).encode('ascii'))
+
+
+def view_offset(row, col):
+    return 3 + row * VIEW_ROW_WIDTH + col * 5
+
+
+EMPTY_VIEW = bytes(encode_view(EMPTY_BOARD))
+# Picks the cells out of an encoded view as a row-major string.
+COMPACT_VIEW_CELLS = operator.itemgetter(*(view_offset(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)))
+
+
+def compact_board(board):
+    return ''.join(map(''.join, board))
+
+# Legal phase changes; anything else is a bug in the caller.
+PHASE_TRANSITIONS = {
+    'waiting_room': ('placing_ships',),
+    'placing_ships': ('playing',),
+    'playing': ('paused', 'game_over'),
+    'paused': ('playing', 'game_over'),
+    'game_over': (),
+}
+
+
+def opponent_of(player_number):
+    return 2 if player_number == 1 else 1
+
+
+class FleetState:
+    # The bitboard fleet decides attacks; `board` is the same fleet as the
+    # char grid clients see, `fog` what the opponent sees and `view` that
+    # again already encoded as JSON. All three are patched cell by cell
+    # instead of rebuilt and stay unallocated until the fleet is placed.
+    __slots__ = ('fleet', 'board', 'fog', 'view', 'sunk_ships')
+
+    def __init__(self):
+        self.fleet = None
+        self.board = EMPTY_BOARD
+        self.fog = EMPTY_BOARD
+        self.view = EMPTY_VIEW
+        self.sunk_ships = []
+
+    def place(self, ships):
+        fleet = Fleet()
+        for ship_data in ships:
+            name = ship_data['name']
+            ENGINE.place_ship(fleet, name, ENGINE.ships[name], ship_data['start_row'], ship_data['start_col'], ship_data['orientation'])
+        self.fleet = fleet
+        self.board = fleet.to_board()
+        self.fog = fleet.opponent_view()
+        self.view = bytearray(EMPTY_VIEW)
+        self.sunk_ships = []
+
+    def receive_attack(self, row, col):
+        result = ENGINE.attack(self.fleet, row, col)
+        if result == "Miss":
+            self.board[row][col] = 'O'
+            self.fog[row][col] = 'O'
+            self.view[view_offset(row, col)] = ord('O')
+        elif result.startswith("Hit"):
+            self.board[row][col] = 'X'
+            self.fog[row][col] = 'X'
+            self.view[view_offset(row, col)] = ord('X')
+            if result != "Hit":
+                self.sunk_ships.append(result[len("Hit and sunk "):-1])
+        return result
+
+    def all_sunk(self):
+        return self.fleet is not None and ENGINE.check_game_over(self.fleet)
+
+    def opponent_view(self):
+        return self.fog
+
+    def compact_view(self):
+        return bytes(COMPACT_VIEW_CELLS(self.view))
+
+    def to_dict(self):
+        if self.fleet is None:
+            return {'ship_masks': {}, 'hits': 0, 'misses': 0, 'sunk_ships': []}
+        return {
+            'ship_masks': dict(self.fleet.ship_masks),
+            'hits': self.fleet.hits,
+            'misses': self.fleet.misses,
+            'sunk_ships': list(self.sunk_ships),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        if not data['ship_masks']:
+            return state
+        fleet = Fleet()
+        for name, mask in data['ship_masks'].items():
+            fleet.ship_masks[name] = mask
+            fleet.occupancy |= mask
+        fleet.hits = data['hits']
+        fleet.misses = data['misses']
+        fleet.attacked = fleet.hits | fleet.misses
+        fleet.remaining = fleet.occupancy & ~fleet.hits
+        state.fleet = fleet
+        state.board = fleet.to_board()
+        state.fog = fleet.opponent_view()
+        state.view = encode_view(state.board)
+        state.sunk_ships = list(data['sunk_ships'])
+        return state
+
+
+class PlayerSlot:
+    __slots__ = ('name', 'ships_placed', 'connected', 'last_activity', 'placed_ships_data', 'pending_polls')
+
+    def __init__(self, name):
+        self.name = name
+        self.ships_placed = False
+        self.connected = True
+        self.last_activity = time.time()
+        self.placed_ships_data = []
+        self.pending_polls = 0
+
+    def touch(self):
+        self.last_activity = time.time()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'ships_placed': self.ships_placed,
+            'connected': self.connected,
+            'last_activity': self.last_activity,
+            'placed_ships_data': self.placed_ships_data,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        player = cls(data['name'])
+        player.ships_placed = data['ships_placed']
+        player.connected = data['connected']
+        player.last_activity = data['last_activity']
+        player.placed_ships_data = data['placed_ships_data']
+        return player
+
+
+class Game:
+    # `lock` is held from a change to the game until its version is bumped
+    # and the event journaled, so that a snapshot never sees one without the
+    # other.
+    __slots__ = ('game_id', 'players', 'fleets', 'turn', 'phase', 'status_message', 'turn_start_time',
+                 'is_quick_match', 'winner_name', 'pause_start_time', 'disconnected_player_num',
+                 'game_end_time', 'version', 'change_log', 'lock')
+
+    def __init__(self, game_id, player_names, is_quick_match=False):
+        self.game_id = game_id
+        self.players = {number: PlayerSlot(name) for number, name in enumerate(player_names, start=1)}
+        self.fleets = {1: FleetState(), 2: FleetState()}
+        self.turn = 1
+        if len(self.players) == 2:
+            self.phase = 'placing_ships'
+            self.status_message = 'Quick match found! Place your ships.' if is_quick_match else 'Place your ships.'
+        else:
+            self.phase = 'waiting_room'
+            self.status_message = 'Waiting for opponent to join...'
+        self.turn_start_time = 0
+        self.is_quick_match = is_quick_match
+        self.winner_name = None
+        self.pause_start_time = None
+        self.disconnected_player_num = None
+        self.game_end_time = None
+        self.version = 0
+        self.change_log = None
+        self.lock = threading.RLock()
+
+    def player_name(self, player_number):
+        player = self.players.get(player_number)
+        return player.name if player else None
+
+    def player_connected(self, player_number):
+        player = self.players.get(player_number)
+        return player.connected if player else False
+
+    def find_player(self, name):
+        for player_number, player in self.players.items():
+            if player.name == name:
+                return player_number
+        return None
+
+    def _set_phase(self, phase):
+        if phase not in PHASE_TRANSITIONS[self.phase]:
+            raise ValueError(f"Game {self.game_id} cannot go from {self.phase} to {phase}")
+        self.phase = phase
+
+    def add_player(self, name):
+        self._set_phase('placing_ships')
+        self.players[2] = PlayerSlot(name)
+        self.status_message = f"{name} has joined! Place your ships."
+        return 2
+
+    def place_fleet(self, player_number, ships):
+        self.fleets[player_number].place(ships)
+        player = self.players[player_number]
+        player.ships_placed = True
+        player.placed_ships_data = ships
+        if len(self.players) == 2 and all(p.ships_placed for p in self.players.values()):
+            self._set_phase('playing')
+            self.turn_start_time = time.time()
+            self.status_message = f"Game on! It's {self.players[1].name}'s turn."
+            return True
+        return False
+
+    def attack(self, player_number, row, col):
+        opponent_number = opponent_of(player_number)
+        result = self.fleets[opponent_number].receive_attack(row, col)
+        if self.fleets[opponent_number].all_sunk():
+            self.finish(player_number, f"Game Over! {self.players[player_number].name} wins!")
+        else:
+            self.turn = opponent_number
+            self.turn_start_time = time.time()
+            self.status_message = f"It's {self.players[opponent_number].name}'s turn."
+        return result
+
+    def time_out_turn(self):
+        timed_out = self.players[self.turn].name
+        self.turn = opponent_of(self.turn)
+        self.turn_start_time = time.time()
+        self.status_message = f"{timed_out}'s turn timed out. It's now {self.players[self.turn].name}'s turn."
+
+    def pause(self, player_number):
+        self._set_phase('paused')
+        player = self.players[player_number]
+        player.connected = False
+        self.pause_start_time = time.time()
+        self.disconnected_player_num = player_number
+        self.status_message = f"{player.name} has disconnected. Reconnection window open."
+
+    def resume(self, player_number):
+        self._set_phase('playing')
+        player = self.players[player_number]
+        player.connected = True
+        player.touch()
+        self.turn_start_time = time.time()
+        self.status_message = f"{player.name} has reconnected. Resuming game."
+        self.pause_start_time = None
+        self.disconnected_player_num = None
+
+    def forfeit_disconnected(self):
+        winner_number = opponent_of(self.disconnected_player_num)
+        if winner_number in self.players:
+            winner_name = self.players[winner_number].name
+            self.finish(winner_number, f"Game Over! {winner_name} wins by opponent disconnect!")
+        else:
+            self.finish(None, "Game Over! Player disconnected.")
+
+    def finish(self, winner_number, status_message):
+        self._set_phase('game_over')
+        if winner_number is not None:
+            self.winner_name = self.players[winner_number].name
+        self.status_message = status_message
+        self.game_end_time = time.time()
+
+    def restart_clocks(self, now):
+        # After recovery nobody can have been active, so every timer starts
+        # over and players get a full window to reconnect.
+        for player in self.players.values():
+            player.last_activity = now
+            player.pending_polls = 0
+        if self.phase == 'playing':
+            self.turn_start_time = now
+        elif self.phase == 'paused':
+            self.pause_start_time = now
+        elif self.phase == 'game_over':
+            self.game_end_time = now
+
+    def to_dict(self):
+        return {
+            'game_id': self.game_id,
+            'players': {number: player.to_dict() for number, player in self.players.items()},
+            'fleets': {number: fleet.to_dict() for number, fleet in self.fleets.items()},
+            'turn': self.turn,
+            'phase': self.phase,
+            'status_message': self.status_message,
+            'turn_start_time': self.turn_start_time,
+            'is_quick_match': self.is_quick_match,
+            'winner_name': self.winner_name,
+            'pause_start_time': self.pause_start_time,
+            'disconnected_player_num': self.disconnected_player_num,
+            'game_end_time': self.game_end_time,
+            'version': self.version,
+            'change_log': [[version, [list(change) for change in changes]] for version, changes in self.change_log or ()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Accepts to_dict() output as well as its JSON round trip, where the
+        # integer player keys have become strings.
+        game = cls.__new__(cls)
+        game.game_id = data['game_id']
+        game.players = {int(number): PlayerSlot.from_dict(player) for number, player in data['players'].items()}
+        game.fleets = {int(number): FleetState.from_dict(fleet) for number, fleet in data['fleets'].items()}
+        for field in ('turn', 'phase', 'status_message', 'turn_start_time', 'is_quick_match', 'winner_name',
+                      'pause_start_time', 'disconnected_player_num', 'game_end_time', 'version'):
+            setattr(game, field, data[field])
+        game.change_log = None
+        game.lock = threading.RLock()
+        if data.get('change_log'):
+            game.change_log = deque(((version, tuple(tuple(change) for change in changes)) for version, changes in data['change_log']),
+                                    maxlen=CHANGE_LOG_LENGTH)
+        return game
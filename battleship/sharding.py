@@ -0,0 +1,105 @@
+import random
+import threading
+from array import array
+
+# A room code, read as a number, modulo the shard count is the index of the
+# backend that owns the game. server.py only hands out codes of its own
+# shard and server_manager.py routes on the same rule, so no lookup table is
+# shared between them.
+
+
+def parse_shard(value):
+    index, count = (int(part) for part in value.split('/'))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard {value} is out of range")
+    return index, count
+
+
+def shard_of(game_id, shard_count):
+    try:
+        return int(game_id) % shard_count
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_codes(shard_index, shard_count, length):
+    # Every room code of the given length that belongs to the shard.
+    return [str(code).zfill(length) for code in range(shard_index, 10 ** length, shard_count)]
+
+
+class RoomCodesExhausted(Exception):
+    pass
+
+
+class RoomCodeAllocator:
+    # Hands out the unused room codes of one shard in random order. `free`
+    # holds the unused slots (code // shard_count) with the next one to hand
+    # out at the end, and `where` the index of each slot in `free`, so that
+    # allocating, reserving and releasing a code are all O(1) swaps however
+    # many rooms are open. Request threads and the housekeeping thread share
+    # one allocator, so each method holds the lock for the whole swap.
+    def __init__(self, shard_index=0, shard_count=1, length=4, rng=random):
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.length = length
+        self.rng = rng
+        slots = (10 ** length - shard_index + shard_count - 1) // shard_count
+        self.free = array('I', range(slots))
+        rng.shuffle(self.free)
+        self.where = array('I', bytes(4 * slots))
+        for index, slot in enumerate(self.free):
+            self.where[slot] = index
+        self.size = slots
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    def _slot(self, code):
+        if len(code) != self.length or shard_of(code, self.shard_count) != self.shard_index:
+            return None
+        return int(code) // self.shard_count
+
+    def _code(self, slot):
+        return str(slot * self.shard_count + self.shard_index).zfill(self.length)
+
+    def _is_free(self, slot):
+        index = self.where[slot]
+        return index < len(self.free) and self.free[index] == slot
+
+    def allocate(self):
+        with self.lock:
+            if not self.free:
+                raise RoomCodesExhausted(f"All {self.size} room codes are in use")
+            return self._code(self.free.pop())
+
+    def reserve(self, code):
+        # Marks a code that is already in use, e.g. by a recovered game.
+        slot = self._slot(code)
+        if slot is None:
+            return False
+        with self.lock:
+            if not self._is_free(slot):
+                return False
+            index, last = self.where[slot], self.free[-1]
+            self.free[index] = last
+            self.where[last] = index
+            self.free.pop()
+            return True
+
+    def release(self, code):
+        # Puts the code back at a random position so that it is not simply
+        # the next one handed out.
+        slot = self._slot(code)
+        if slot is None:
+            return False
+        with self.lock:
+            if self._is_free(slot):
+                return False
+            self.free.append(slot)
+            self.where[slot] = len(self.free) - 1
+            index = self.rng.randrange(len(self.free))
+            other = self.free[index]
+            self.free[index], self.free[-1] = slot, other
+            self.where[slot], self.where[other] = index, len(self.free) - 1
+            return True
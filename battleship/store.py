@@ -0,0 +1,521 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from battleship.matchmaker import MAX_RATING_GAP, MatchQueue
+from battleship.ratings import DEFAULT_RATING, rate_game
+from battleship.records import Game
+from battleship.sharding import RoomCodeAllocator, RoomCodesExhausted, shard_codes
+
+
+class VersionConflict(Exception):
+    pass
+
+
+class GameStore(ABC):
+    # Every save follows exactly one ChangeNotifier.record(), so a game read
+    # at version v is saved as v + 1 and loses to any other writer that got
+    # there first. Player activity is kept apart from the game itself because
+    # it is written on every request and must not conflict with moves.
+    # create, save and delete also keep the player name and quick match
+    # indexes in step with the games, so lookups by name never scan.
+    shared = False
+
+    @abstractmethod
+    def get(self, game_id):
+        ...
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    @abstractmethod
+    def create(self, game):
+        ...
+
+    @abstractmethod
+    def save(self, game):
+        ...
+
+    @abstractmethod
+    def delete(self, game_id):
+        ...
+
+    @abstractmethod
+    def games(self):
+        ...
+
+    @abstractmethod
+    def versions(self, game_ids):
+        ...
+
+    @abstractmethod
+    def player_games(self, player_name):
+        # {game_id: player_number} for every game the name plays in.
+        ...
+
+    @abstractmethod
+    def quick_match_ids(self):
+        ...
+
+    @abstractmethod
+    def touch(self, game, player_number):
+        ...
+
+    @abstractmethod
+    def poll_started(self, game_id, player_number):
+        ...
+
+    @abstractmethod
+    def poll_finished(self, game_id, player_number):
+        ...
+
+    @abstractmethod
+    def queue_add(self, entry):
+        # False if the name is already queued.
+        ...
+
+    @abstractmethod
+    def queue_contains(self, name):
+        ...
+
+    @abstractmethod
+    def queue_match(self, entry, now):
+        # Takes a waiting player that can be paired with `entry`, if any.
+        ...
+
+    @abstractmethod
+    def queue_pop_pairs(self, now):
+        # Takes every pair of waiting players that can be paired now.
+        ...
+
+    @abstractmethod
+    def queue_remove(self, name, timestamp=None):
+        ...
+
+    @abstractmethod
+    def queue_depth(self):
+        ...
+
+    @abstractmethod
+    def queue_oldest(self):
+        ...
+
+    @abstractmethod
+    def rating(self, player_name):
+        # (rating, games_played)
+        ...
+
+    @abstractmethod
+    def record_result(self, winner_name, loser_name):
+        ...
+
+    @abstractmethod
+    def room_codes(self, shard_index, shard_count, length):
+        # The allocator new games take their room codes from.
+        ...
+
+
+class InMemoryGameStore(GameStore):
+    # Hands out the live Game objects, so changes are visible as soon as they
+    # are made and save() only has to notice games deleted in the meantime.
+    def __init__(self):
+        self.games_by_id = {}
+        self.games_by_player = {}
+        self.quick_matches = set()
+        self.lock = threading.Lock()
+        self.queue = MatchQueue()
+        self.ratings = {}
+
+    def _index(self, game):
+        for player_number, player in game.players.items():
+            self.games_by_player.setdefault(player.name, {})[game.game_id] = player_number
+        if game.is_quick_match:
+            self.quick_matches.add(game.game_id)
+
+    def _unindex(self, game):
+        for player in game.players.values():
+            slots = self.games_by_player.get(player.name)
+            if slots is not None:
+                slots.pop(game.game_id, None)
+                if not slots:
+                    del self.games_by_player[player.name]
+        self.quick_matches.discard(game.game_id)
+
+    def get(self, game_id):
+        return self.games_by_id.get(game_id)
+
+    def __contains__(self, game_id):
+        return game_id in self.games_by_id
+
+    def create(self, game):
+        with self.lock:
+            if game.game_id in self.games_by_id:
+                return False
+            self.games_by_id[game.game_id] = game
+            self._index(game)
+        return True
+
+    def save(self, game):
+        with self.lock:
+            if self.games_by_id.get(game.game_id) is not game:
+                raise VersionConflict(f"Game {game.game_id} was removed")
+            self._index(game)
+
+    def delete(self, game_id):
+        with self.lock:
+            game = self.games_by_id.pop(game_id, None)
+            if game is None:
+                return False
+            self._unindex(game)
+        return True
+
+    def games(self):
+        return list(self.games_by_id.values())
+
+    def versions(self, game_ids):
+        return {game_id: self.games_by_id[game_id].version for game_id in game_ids if game_id in self.games_by_id}
+
+    def player_games(self, player_name):
+        return dict(self.games_by_player.get(player_name, {}))
+
+    def quick_match_ids(self):
+        return list(self.quick_matches)
+
+    def touch(self, game, player_number):
+        game.players[player_number].touch()
+
+    def poll_started(self, game_id, player_number):
+        game = self.games_by_id.get(game_id)
+        if game is not None and player_number in game.players:
+            game.players[player_number].pending_polls += 1
+
+    def poll_finished(self, game_id, player_number):
+        game = self.games_by_id.get(game_id)
+        if game is not None and player_number in game.players:
+            player = game.players[player_number]
+            player.pending_polls -= 1
+            player.touch()
+
+    def queue_add(self, entry):
+        return self.queue.add(entry)
+
+    def queue_contains(self, name):
+        return name in self.queue
+
+    def queue_match(self, entry, now):
+        return self.queue.pop_match(entry, now)
+
+    def queue_pop_pairs(self, now):
+        return self.queue.pop_pairs(now)
+
+    def queue_remove(self, name, timestamp=None):
+        return self.queue.remove(name, timestamp)
+
+    def queue_depth(self):
+        return len(self.queue)
+
+    def queue_oldest(self):
+        return self.queue.oldest()
+
+    def rating(self, player_name):
+        return self.ratings.get(player_name, (DEFAULT_RATING, 0))
+
+    def record_result(self, winner_name, loser_name):
+        with self.lock:
+            self.ratings[winner_name], self.ratings[loser_name] = rate_game(self.rating(winner_name), self.rating(loser_name))
+
+    def room_codes(self, shard_index, shard_count, length):
+        return RoomCodeAllocator(shard_index, shard_count, length)
+
+
+class SqliteGameStore(GameStore):
+    # Shared by every server process on the host. WAL mode lets readers run
+    # alongside the single writer; each thread gets its own connection.
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        db = self._db()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS activity (
+                game_id TEXT NOT NULL,
+                player_number INTEGER NOT NULL,
+                last_activity REAL NOT NULL,
+                pending_polls INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (game_id, player_number)
+            );
+            CREATE TABLE IF NOT EXISTS players (
+                player_name TEXT NOT NULL,
+                game_id TEXT NOT NULL,
+                player_number INTEGER NOT NULL,
+                is_quick_match INTEGER NOT NULL,
+                PRIMARY KEY (player_name, game_id)
+            );
+            CREATE INDEX IF NOT EXISTS players_by_game ON players (game_id);
+            CREATE INDEX IF NOT EXISTS quick_match_players ON players (game_id) WHERE is_quick_match;
+            CREATE TABLE IF NOT EXISTS quick_match_queue (
+                name TEXT PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                rating REAL NOT NULL DEFAULT 1500
+            );
+            CREATE INDEX IF NOT EXISTS queue_by_time ON quick_match_queue (timestamp);
+            CREATE INDEX IF NOT EXISTS queue_by_rating ON quick_match_queue (rating);
+            CREATE TABLE IF NOT EXISTS room_codes (
+                shard_count INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                in_use INTEGER NOT NULL DEFAULT 0,
+                sort_key INTEGER NOT NULL,
+                PRIMARY KEY (shard_count, code)
+            );
+            CREATE INDEX IF NOT EXISTS free_room_codes ON room_codes (shard_count, shard, sort_key) WHERE NOT in_use;
+            CREATE TABLE IF NOT EXISTS ratings (
+                player_name TEXT PRIMARY KEY,
+                rating REAL NOT NULL,
+                games_played INTEGER NOT NULL
+            );
+        """)
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _load(self, data, activity):
+        game = Game.from_dict(json.loads(data))
+        for player_number, last_activity, pending_polls in activity:
+            player = game.players.get(player_number)
+            if player is not None:
+                player.last_activity = last_activity
+                player.pending_polls = pending_polls
+        return game
+
+    def get(self, game_id):
+        db = self._db()
+        row = db.execute("SELECT data FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        activity = db.execute("SELECT player_number, last_activity, pending_polls FROM activity WHERE game_id = ?", (game_id,)).fetchall()
+        return self._load(row[0], activity)
+
+    def __contains__(self, game_id):
+        return self._db().execute("SELECT 1 FROM games WHERE game_id = ?", (game_id,)).fetchone() is not None
+
+    def _save_activity(self, db, game):
+        db.executemany(
+            "INSERT INTO activity (game_id, player_number, last_activity) VALUES (?, ?, ?) "
+            "ON CONFLICT (game_id, player_number) DO UPDATE SET last_activity = MAX(last_activity, excluded.last_activity)",
+            [(game.game_id, number, player.last_activity) for number, player in game.players.items()])
+
+    def _save_players(self, db, game):
+        db.executemany(
+            "INSERT OR IGNORE INTO players (player_name, game_id, player_number, is_quick_match) VALUES (?, ?, ?, ?)",
+            [(player.name, game.game_id, number, game.is_quick_match) for number, player in game.players.items()])
+
+    def create(self, game):
+        with self._transaction() as db:
+            cursor = db.execute("INSERT OR IGNORE INTO games (game_id, version, data) VALUES (?, ?, ?)",
+                                (game.game_id, game.version, json.dumps(game.to_dict())))
+            if cursor.rowcount != 1:
+                return False
+            db.execute("DELETE FROM activity WHERE game_id = ?", (game.game_id,))
+            db.execute("DELETE FROM players WHERE game_id = ?", (game.game_id,))
+            self._save_activity(db, game)
+            self._save_players(db, game)
+        return True
+
+    def save(self, game):
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE games SET version = ?, data = ? WHERE game_id = ? AND version = ?",
+                                (game.version, json.dumps(game.to_dict()), game.game_id, game.version - 1))
+            if cursor.rowcount != 1:
+                raise VersionConflict(f"Game {game.game_id} changed since version {game.version - 1}")
+            self._save_activity(db, game)
+            self._save_players(db, game)
+
+    def delete(self, game_id):
+        with self._transaction() as db:
+            cursor = db.execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+            db.execute("DELETE FROM activity WHERE game_id = ?", (game_id,))
+            db.execute("DELETE FROM players WHERE game_id = ?", (game_id,))
+            # The code is free again for whichever process hands it out next.
+            db.execute("UPDATE room_codes SET in_use = 0, sort_key = random() WHERE code = ?", (game_id,))
+        return cursor.rowcount == 1
+
+    def games(self):
+        db = self._db()
+        activity = {}
+        for game_id, player_number, last_activity, pending_polls in db.execute("SELECT game_id, player_number, last_activity, pending_polls FROM activity"):
+            activity.setdefault(game_id, []).append((player_number, last_activity, pending_polls))
+        return [self._load(data, activity.get(game_id, ())) for game_id, data in db.execute("SELECT game_id, data FROM games")]
+
+    def versions(self, game_ids):
+        game_ids = list(game_ids)
+        placeholders = ','.join('?' * len(game_ids))
+        rows = self._db().execute(f"SELECT game_id, version FROM games WHERE game_id IN ({placeholders})", game_ids)
+        return dict(rows.fetchall())
+
+    def player_games(self, player_name):
+        rows = self._db().execute("SELECT game_id, player_number FROM players WHERE player_name = ?", (player_name,))
+        return dict(rows.fetchall())
+
+    def quick_match_ids(self):
+        rows = self._db().execute("SELECT DISTINCT game_id FROM players WHERE is_quick_match")
+        return [game_id for game_id, in rows]
+
+    def touch(self, game, player_number):
+        game.players[player_number].touch()
+        self._db().execute("UPDATE activity SET last_activity = MAX(last_activity, ?) WHERE game_id = ? AND player_number = ?",
+                           (game.players[player_number].last_activity, game.game_id, player_number))
+
+    def poll_started(self, game_id, player_number):
+        self._db().execute("UPDATE activity SET pending_polls = pending_polls + 1 WHERE game_id = ? AND player_number = ?",
+                           (game_id, player_number))
+
+    def poll_finished(self, game_id, player_number):
+        self._db().execute("UPDATE activity SET pending_polls = MAX(pending_polls - 1, 0), last_activity = MAX(last_activity, ?) "
+                           "WHERE game_id = ? AND player_number = ?", (time.time(), game_id, player_number))
+
+    def queue_add(self, entry):
+        cursor = self._db().execute("INSERT OR IGNORE INTO quick_match_queue (name, timestamp, rating) VALUES (?, ?, ?)",
+                                    (entry['name'], entry['timestamp'], entry['rating']))
+        return cursor.rowcount == 1
+
+    def _queue_rows(self, db, query, params=()):
+        return [{'name': name, 'timestamp': timestamp, 'rating': rating}
+                for name, timestamp, rating in db.execute(f"SELECT name, timestamp, rating FROM quick_match_queue {query}", params)]
+
+    def queue_contains(self, name):
+        return self._db().execute("SELECT 1 FROM quick_match_queue WHERE name = ?", (name,)).fetchone() is not None
+
+    def queue_match(self, entry, now):
+        queue = MatchQueue()
+        with self._transaction() as db:
+            for other in self._queue_rows(db, "WHERE rating BETWEEN ? AND ? ORDER BY timestamp",
+                                          (entry['rating'] - MAX_RATING_GAP, entry['rating'] + MAX_RATING_GAP)):
+                queue.add(other)
+            other = queue.pop_match(entry, now)
+            if other is not None:
+                db.execute("DELETE FROM quick_match_queue WHERE name = ?", (other['name'],))
+        return other
+
+    def queue_pop_pairs(self, now):
+        # Pairs with the same rules as the in-memory queue, over a copy of
+        # the whole table.
+        queue = MatchQueue()
+        with self._transaction() as db:
+            for entry in self._queue_rows(db, "ORDER BY timestamp"):
+                queue.add(entry)
+            pairs = queue.pop_pairs(now)
+            db.executemany("DELETE FROM quick_match_queue WHERE name = ?", [(entry['name'],) for pair in pairs for entry in pair])
+        return pairs
+
+    def queue_remove(self, name, timestamp=None):
+        if timestamp is None:
+            cursor = self._db().execute("DELETE FROM quick_match_queue WHERE name = ?", (name,))
+        else:
+            cursor = self._db().execute("DELETE FROM quick_match_queue WHERE name = ? AND timestamp = ?", (name, timestamp))
+        return cursor.rowcount == 1
+
+    def queue_depth(self):
+        return self._db().execute("SELECT COUNT(*) FROM quick_match_queue").fetchone()[0]
+
+    def queue_oldest(self):
+        rows = self._queue_rows(self._db(), "ORDER BY timestamp LIMIT 1")
+        return rows[0] if rows else None
+
+    def rating(self, player_name):
+        row = self._db().execute("SELECT rating, games_played FROM ratings WHERE player_name = ?", (player_name,)).fetchone()
+        return tuple(row) if row else (DEFAULT_RATING, 0)
+
+    def record_result(self, winner_name, loser_name):
+        with self._transaction() as db:
+            rows = dict((name, (rating, games)) for name, rating, games in db.execute(
+                "SELECT player_name, rating, games_played FROM ratings WHERE player_name IN (?, ?)", (winner_name, loser_name)))
+            winner, loser = rate_game(rows.get(winner_name, (DEFAULT_RATING, 0)), rows.get(loser_name, (DEFAULT_RATING, 0)))
+            db.executemany("INSERT OR REPLACE INTO ratings (player_name, rating, games_played) VALUES (?, ?, ?)",
+                           [(winner_name, *winner), (loser_name, *loser)])
+
+    def room_codes(self, shard_index, shard_count, length):
+        return SqliteRoomCodes(self, shard_index, shard_count, length)
+
+
+class SqliteRoomCodes:
+    # The room codes of one shard as rows in the shared store, so that every
+    # process serving the shard takes codes from, and gives them back to, the
+    # same pool. A code stays in use while any game holds it; delete() frees
+    # it in the same transaction that removes the game, whichever process
+    # does that.
+    def __init__(self, store, shard_index, shard_count, length):
+        self.store = store
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.length = length
+        codes = shard_codes(shard_index, shard_count, length)
+        self.size = len(codes)
+        with store._transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO room_codes (shard_count, code, shard, sort_key) VALUES (?, ?, ?, random())",
+                           [(shard_count, code, shard_index) for code in codes])
+            db.execute("UPDATE room_codes SET in_use = 1 WHERE shard_count = ? AND shard = ? AND NOT in_use "
+                       "AND code IN (SELECT game_id FROM games)", (shard_count, shard_index))
+
+    def __len__(self):
+        return self.store._db().execute("SELECT COUNT(*) FROM room_codes WHERE shard_count = ? AND shard = ? AND in_use",
+                                        (self.shard_count, self.shard_index)).fetchone()[0]
+
+    def allocate(self):
+        # Free codes are taken in the random order of their sort keys, which
+        # are drawn again whenever a code is freed.
+        with self.store._transaction() as db:
+            row = db.execute("SELECT code FROM room_codes WHERE shard_count = ? AND shard = ? AND NOT in_use "
+                             "ORDER BY sort_key LIMIT 1", (self.shard_count, self.shard_index)).fetchone()
+            if row is None:
+                raise RoomCodesExhausted(f"All {self.size} room codes are in use")
+            db.execute("UPDATE room_codes SET in_use = 1 WHERE shard_count = ? AND code = ?", (self.shard_count, row[0]))
+        return row[0]
+
+    def reserve(self, code):
+        with self.store._transaction() as db:
+            cursor = db.execute("UPDATE room_codes SET in_use = 1 WHERE shard_count = ? AND shard = ? AND code = ? AND NOT in_use",
+                                (self.shard_count, self.shard_index, code))
+        return cursor.rowcount == 1
+
+    def release(self, code):
+        # A code some game still holds is left alone; delete() frees it.
+        with self.store._transaction() as db:
+            cursor = db.execute("UPDATE room_codes SET in_use = 0, sort_key = random() WHERE shard_count = ? AND code = ? "
+                                "AND in_use AND code NOT IN (SELECT game_id FROM games)", (self.shard_count, code))
+        return cursor.rowcount == 1
+
+
+def open_store(spec):
+    # 'memory' or 'sqlite:<path>'.
+    if spec == 'memory':
+        return InMemoryGameStore()
+    if spec.startswith('sqlite:') and len(spec) > len('sqlite:'):
+        return SqliteGameStore(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown game store '{spec}'")
@@ -0,0 +1,80 @@
+# Plays the same games on the scalar BattleshipGame and the numpy BatchGame,
+# checks that every attack result and game-over flag agrees, and compares
+# throughput. Run from the repository root: python -m benchmarks.bench_batch [games]
+import random
+import sys
+import time
+
+import numpy as np
+
+from battleship.batch import BatchGame
+from battleship.game_logic import BattleshipGame
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    random.seed(3)
+    engine = BattleshipGame()
+
+    start = time.perf_counter()
+    fleets = []
+    for _ in range(count):
+        board = [['.' for _ in range(10)] for _ in range(10)]
+        ships = {}
+        engine.auto_place_ships(board, ships)
+        fleets.append((board, ships))
+    scalar_place_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    BatchGame(count, seed=3).auto_place_ships()
+    batch_place_time = time.perf_counter() - start
+
+    batch = BatchGame.from_legacy(fleets)
+    # Shot sequences include out-of-range and repeated cells on purpose.
+    shots = np.random.default_rng(3).integers(-1, 11, size=(400, count, 2))
+
+    scalar_results = []
+    start = time.perf_counter()
+    finished = [False] * count
+    for turn in range(len(shots)):
+        turn_results = []
+        for game, (board, ships) in enumerate(fleets):
+            if finished[game]:
+                turn_results.append((None, True))
+                continue
+            row, col = int(shots[turn, game, 0]), int(shots[turn, game, 1])
+            result = engine.attack(board, ships, row, col)
+            finished[game] = engine.check_game_over(ships)
+            turn_results.append((result, finished[game]))
+        scalar_results.append(turn_results)
+    scalar_attack_time = time.perf_counter() - start
+
+    batch_results = []
+    start = time.perf_counter()
+    game_over = batch.check_game_over()
+    for turn in range(len(shots)):
+        codes, sunk_ship, game_over_after = batch.attack(shots[turn, :, 0], shots[turn, :, 1], active=~game_over)
+        batch_results.append((codes, sunk_ship, game_over_after))
+        game_over = game_over_after
+    batch_attack_time = time.perf_counter() - start
+
+    for turn, (codes, sunk_ship, game_over_after) in enumerate(batch_results):
+        expected = scalar_results[turn]
+        actual = list(zip(batch.result_strings(codes, sunk_ship), game_over_after.tolist()))
+        if actual != expected:
+            print(f"MISMATCH on turn {turn}")
+            sys.exit(1)
+    for game in range(count):
+        if batch.board(game) != fleets[game][0]:
+            print(f"MISMATCH in final board of game {game}")
+            sys.exit(1)
+
+    print(f"{count} games, {len(shots)} turns: all results and boards match")
+    print(f"placement: scalar {scalar_place_time:.3f}s, batch {batch_place_time:.3f}s "
+          f"({scalar_place_time / batch_place_time:.1f}x)")
+    print(f"attacks:   scalar {scalar_attack_time:.3f}s, batch {batch_attack_time:.3f}s "
+          f"({scalar_attack_time / batch_attack_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
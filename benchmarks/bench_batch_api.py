@@ -0,0 +1,57 @@
+# Time for a client to read the state of several games over loopback: one
+# request per game, the same requests pipelined, and a single /api/batch.
+# Needs pygame for the client module.
+# Run from the repository root: python -m benchmarks.bench_batch_api [games] [rounds]
+import contextlib
+import io
+import logging
+import sys
+import time
+
+import main
+import server
+
+
+def run():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    logging.getLogger().setLevel(logging.WARNING)
+    listener = server.Server(0)
+    listener.daemon = True
+    listener.start()
+    while listener.my_socket.getsockname()[1] == 0:
+        time.sleep(0.01)
+    port = listener.my_socket.getsockname()[1]
+
+    game_ids = [server.httpserver.create_game([f'p{i}', f'q{i}']) for i in range(games)]
+    requests = [('GET', f'/api/gamestate?game_id={game_id}&is_spectator=true', None, None) for game_id in game_ids]
+    batch = {'operations': [{'method': method, 'path': path} for method, path, payload, headers in requests]}
+    client = main.BattleshipHttpClient(port=port)
+
+    def one_by_one():
+        for request in requests:
+            client._send_request(*request)
+
+    def pipelined():
+        client._send_requests(requests)
+
+    def batched():
+        client._send_request('POST', '/api/batch', batch)
+
+    print(f"{rounds} rounds reading {games} game states")
+    # The client prints every connect.
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.connect()
+        timings = {}
+        for name, read in (('one by one', one_by_one), ('pipelined', pipelined), ('batch', batched)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                read()
+            timings[name] = time.perf_counter() - start
+        client.disconnect()
+    for name, elapsed in timings.items():
+        print(f"  {name:<10}  {elapsed / rounds * 1e6:8.0f} us/round  {elapsed / rounds / games * 1e6:6.0f} us/game")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,159 @@
+# Compares the list-of-lists BattleshipGame with the bitboard engine, and
+# the opponent's view rebuilt from the masks on every call with the grid
+# FleetState patches on each attack.
+# Run from the repository root: python -m benchmarks.bench_bitboard [games]
+import random
+import sys
+import time
+
+from battleship.bitboard import BitboardGame, Fleet
+from battleship.game_logic import BattleshipGame
+from battleship.records import FleetState
+
+
+def make_games(count, seed=1):
+    random.seed(seed)
+    legacy = BattleshipGame()
+    games = []
+    for _ in range(count):
+        board = [['.' for _ in range(10)] for _ in range(10)]
+        ships = {}
+        legacy.auto_place_ships(board, ships)
+        shots = [(r, c) for r in range(10) for c in range(10)]
+        random.shuffle(shots)
+        games.append((board, ships, shots))
+    return games
+
+
+def play_legacy(games):
+    engine = BattleshipGame()
+    results = []
+    start = time.perf_counter()
+    for board, ships, shots in games:
+        board = [row[:] for row in board]
+        ships = {name: {'positions': data['positions'], 'hits': []} for name, data in ships.items()}
+        for row, col in shots:
+            result = engine.attack(board, ships, row, col)
+            results.append(result)
+            if engine.check_game_over(ships):
+                break
+    return time.perf_counter() - start, results
+
+
+def play_bitboard(games):
+    engine = BitboardGame()
+    fleets = [Fleet.from_legacy(board, ships) for board, ships, _ in games]
+    results = []
+    start = time.perf_counter()
+    for fleet, (_, _, shots) in zip(fleets, games):
+        for row, col in shots:
+            result = engine.attack(fleet, row, col)
+            results.append(result)
+            if engine.check_game_over(fleet):
+                break
+    return time.perf_counter() - start, results
+
+
+def play_baseline(games, shot_counts):
+    # Same loop shape with no engine work, to subtract harness overhead.
+    results = []
+    start = time.perf_counter()
+    for (_, _, shots), count in zip(games, shot_counts):
+        for row, col in shots[:count]:
+            result = row
+            results.append(result)
+            if not result and col < 0:
+                break
+    return time.perf_counter() - start
+
+
+def time_game_over_checks(games, repeats=20):
+    # check_game_over on mid-game positions, where the list engine has to
+    # walk every ship before it can answer.
+    legacy = BattleshipGame()
+    bitboard = BitboardGame()
+    legacy_states = []
+    fleets = []
+    for board, ships, shots in games:
+        board = [row[:] for row in board]
+        ships = {name: {'positions': data['positions'], 'hits': []} for name, data in ships.items()}
+        for row, col in shots[:50]:
+            legacy.attack(board, ships, row, col)
+        legacy_states.append(ships)
+        fleets.append(Fleet.from_legacy(board, ships))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for ships in legacy_states:
+            legacy.check_game_over(ships)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for fleet in fleets:
+            bitboard.check_game_over(fleet)
+    bitboard_time = time.perf_counter() - start
+    return legacy_time / (repeats * len(games)), bitboard_time / (repeats * len(games))
+
+
+def time_opponent_views(games, repeats=20):
+    states = []
+    for board, ships, shots in games:
+        fleet = Fleet.from_legacy(board, ships)
+        state = FleetState.from_dict({'ship_masks': fleet.ship_masks, 'hits': 0, 'misses': 0, 'sunk_ships': []})
+        for row, col in shots[:50]:
+            state.receive_attack(row, col)
+        states.append(state)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for state in states:
+            state.fleet.opponent_view()
+    rebuilt = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for state in states:
+            state.opponent_view()
+    patched = time.perf_counter() - start
+    return rebuilt / (repeats * len(games)), patched / (repeats * len(games))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    games = make_games(count)
+
+    legacy_time, legacy_results = play_legacy(games)
+    bitboard_time, bitboard_results = play_bitboard(games)
+
+    if legacy_results != bitboard_results:
+        print("MISMATCH: engines disagree on attack results")
+        sys.exit(1)
+
+    shot_counts = []
+    for _, ships, shots in games:
+        # Each game ends on the shot that sinks the last ship.
+        cells = {cell for data in ships.values() for cell in data['positions']}
+        last = max(shots.index(cell) for cell in cells) + 1
+        shot_counts.append(last)
+    baseline_time = play_baseline(games, shot_counts)
+
+    shots = len(legacy_results)
+    legacy_net = legacy_time - baseline_time
+    bitboard_net = bitboard_time - baseline_time
+    print(f"{count} games, {shots} shots (attack + check_game_over per shot)")
+    print(f"harness overhead: {baseline_time:.3f}s")
+    print(f"list engine:      {legacy_time:.3f}s  {legacy_net / shots * 1e9:8.0f} ns/shot net")
+    print(f"bitboard engine:  {bitboard_time:.3f}s  {bitboard_net / shots * 1e9:8.0f} ns/shot net")
+    print(f"speedup:          {legacy_time / bitboard_time:.2f}x total, {legacy_net / bitboard_net:.2f}x net")
+
+    legacy_check, bitboard_check = time_game_over_checks(games)
+    print(f"check_game_over:  list {legacy_check * 1e9:.0f} ns, bitboard {bitboard_check * 1e9:.0f} ns "
+          f"({legacy_check / bitboard_check:.2f}x)")
+
+    rebuilt_view, patched_view = time_opponent_views(games)
+    print(f"opponent view:    rebuilt {rebuilt_view * 1e9:.0f} ns, patched {patched_view * 1e9:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# Size and encode time of full game states with boards as nested JSON lists
+# against the row-major strings sent to clients that ask for compact boards.
+# Run from the repository root: python -m benchmarks.bench_board_encoding [states]
+import sys
+import time
+
+import server
+from battleship.placements import random_fleet
+from battleship.records import ENGINE
+
+
+def main():
+    states = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    http = server.httpserver
+    game_id = http.create_game(['alice', 'bob'])
+    game = server.STORE.get(game_id)
+    for player_number in (1, 2):
+        game.place_fleet(player_number, random_fleet(ENGINE.ships))
+    for i in range(30):
+        game.attack(game.turn, i // 10, i % 10)
+    server.game_changed(game)
+
+    print(f"{states} full game states, encoded without the cache")
+    print(f"  {'viewer':<9}  {'encoding':<8}  {'bytes':>5}  {'us/state':>8}")
+    for viewer, player_number in (('player', 1), ('spectator', None)):
+        for board_encoding in server.BOARD_ENCODINGS:
+            start = time.perf_counter()
+            for _ in range(states):
+                server.STATE_CACHE.pop(game_id, None)
+                version, body = http.encoded_game_state(game, player_number, None, board_encoding)
+            elapsed = time.perf_counter() - start
+            print(f"  {viewer:<9}  {board_encoding:<8}  {len(body):5}  {elapsed / states * 1e6:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
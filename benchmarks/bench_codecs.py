@@ -0,0 +1,52 @@
+# Encode and decode time and size of game states in each registered body
+# format. MessagePack is timed with the msgpack package if it is installed
+# and with the built-in encoder otherwise, which the server then only uses
+# to read request bodies and never picks for responses.
+# Run from the repository root: python -m benchmarks.bench_codecs [states]
+import sys
+import time
+
+import server
+from battleship import codec
+from battleship.placements import random_fleet
+from battleship.records import ENGINE
+
+
+def main():
+    states = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    http = server.httpserver
+    game_id = http.create_game(['alice', 'bob'])
+    game = server.STORE.get(game_id)
+    for player_number in (1, 2):
+        game.place_fleet(player_number, random_fleet(ENGINE.ships))
+    for i in range(30):
+        game.attack(game.turn, i // 10, i % 10)
+    server.game_changed(game)
+    since = game.version
+    game.attack(game.turn, 5, 5)
+    server.game_changed(game, [('cell', 2 if game.turn == 1 else 1, 5, 5)])
+
+    payloads = {
+        'player': http.build_game_state(game, 1),
+        'compact': http.build_game_state(game, 1, board_encoding='compact'),
+        'spectator': http.build_game_state(game),
+        'delta': http.build_game_state(game, 1, since),
+    }
+    print(f"{states} game states per row, msgpack {'package' if codec.msgpack else 'built-in, request bodies only'}")
+    print(f"  {'state':<9}  {'format':<21}  {'bytes':>5}  {'encode us':>9}  {'decode us':>9}")
+    for name, state in payloads.items():
+        for media_type in codec.CODECS:
+            body = codec.encode(media_type, state)
+            start = time.perf_counter()
+            for _ in range(states):
+                codec.encode(media_type, state)
+            encode_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(states):
+                codec.decode(media_type, body)
+            decode_time = time.perf_counter() - start
+            print(f"  {name:<9}  {media_type:<21}  {len(body):5}  {encode_time / states * 1e6:9.1f}  {decode_time / states * 1e6:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Request parsing throughput: the old ProcessTheClient path, which joined
+# reads with += and parsed the headers twice, against RequestParser. Each
+# request arrives in reads of READ_SIZE bytes, as from a socket.
+# Run from the repository root: python -m benchmarks.bench_http_parser [requests]
+import sys
+import time
+
+from battleship.http_parser import RequestParser
+
+READ_SIZE = 4096
+
+
+def old_parse(reads):
+    # The removed receive loop and process()/get_headers_and_body.
+    reads = iter(reads)
+    request_data = b''
+    while b'\r\n\r\n' not in request_data:
+        request_data += next(reads)
+    header_part, body_part = request_data.split(b'\r\n\r\n', 1)
+    headers = {}
+    for line in header_part.split(b'\r\n')[1:]:
+        if b': ' in line:
+            key, value = line.split(b': ', 1)
+            headers[key.lower().decode('utf-8')] = value.decode('utf-8')
+    content_length = int(headers.get('content-length', 0))
+    while len(body_part) < content_length:
+        body_part += next(reads)
+    data_str = (header_part + b'\r\n\r\n' + body_part).decode('utf-8', errors='ignore')
+    parts = data_str.split('\r\n')[0].split(' ')
+    method, path = parts[0].upper().strip(), parts[1].strip()
+    head, body = data_str.split('\r\n\r\n', 1)
+    headers = {}
+    for line in head.split('\r\n')[1:]:
+        if ': ' in line:
+            key, value = line.split(': ', 1)
+            headers[key.lower()] = value
+    return method, path, headers, body
+
+
+def new_parse(reads):
+    parser = RequestParser()
+    for data in reads:
+        parser.feed(data)
+        request = parser.next_request()
+        if request is not None:
+            return request
+
+
+def make_request(body_size):
+    body = b'{"player_name": "' + b'x' * max(body_size - 20, 0) + b'"}'
+    method = b'POST' if body_size else b'GET'
+    request = (method + b' /api/gamestate?game_id=1234&player_number=1 HTTP/1.0\r\n'
+               b'Host: localhost:8889\r\nContent-Type: application/json\r\nAccept: application/json\r\n'
+               b'Content-Length: %d\r\nConnection: keep-alive\r\n\r\n' % (len(body) if body_size else 0))
+    if body_size:
+        request += body
+    return [request[i:i + READ_SIZE] for i in range(0, len(request), READ_SIZE)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"requests arriving in {READ_SIZE} byte reads")
+    print(f"  {'body':>9}  {'requests':>8}  {'old us/req':>10}  {'parser us/req':>13}  {'old MB/s':>8}  {'parser MB/s':>11}")
+    for body_size in (0, 2000, 64 * 1024, 1024 * 1024):
+        reads = make_request(body_size)
+        size = sum(map(len, reads))
+        # Fewer repetitions for the big bodies, at least a few of each.
+        runs = max(count * 2000 // max(size, 2000), 5)
+        timings = []
+        for parse in (old_parse, new_parse):
+            start = time.perf_counter()
+            for _ in range(runs):
+                parse(reads)
+            timings.append((time.perf_counter() - start) / runs)
+        old, new = timings
+        print(f"  {body_size:9}  {runs:8}  {old * 1e6:10.1f}  {new * 1e6:13.1f}  {size / old / 1e6:8.0f}  {size / new / 1e6:11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Measures the event journal: bytes written per move against a full JSON
+# copy of the game, append cost with batched fsync against an fsync per
+# event, and the time to rebuild games from a snapshot plus the log tail.
+# Run from the repository root: python -m benchmarks.bench_journal [games]
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from battleship.journal import Journal, encode_event
+from battleship.placements import random_fleet
+from battleship.records import ENGINE, Game
+
+FLEETS = (random_fleet(ENGINE.ships), random_fleet(ENGINE.ships))
+MOVES = 40
+
+
+def play(game_id):
+    # One game played to mid-battle, with the events the server journals.
+    events = [('create', ['alice'], False), ('join', 'bob')]
+    game = Game(game_id, ['alice'])
+    game.add_player('bob')
+    for player_number, ships in zip((1, 2), FLEETS):
+        game.place_fleet(player_number, ships)
+        events.append(('place', player_number, ships))
+    for i in range(MOVES):
+        row, col = divmod(i // 2, 10)
+        events.append(('attack', game.turn, row, col))
+        game.attack(game.turn, row, col)
+    return game, events
+
+
+def append_rate(directory, events, fsync_every):
+    path = os.path.join(directory, 'rate.log')
+    start = time.perf_counter()
+    with open(path, 'ab') as f:
+        for i, (game_id, version, event) in enumerate(events, 1):
+            f.write(encode_event(game_id, version, event))
+            if i % fsync_every == 0:
+                f.flush()
+                os.fsync(f.fileno())
+        f.flush()
+        os.fsync(f.fileno())
+    return (time.perf_counter() - start) / len(events)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    directory = tempfile.mkdtemp()
+    try:
+        game, events = play('0001')
+        moves = [event for event in events if event[0] == 'attack']
+        move_bytes = sum(len(encode_event('0001', i, event)) for i, event in enumerate(moves)) / len(moves)
+        print("bytes written per move")
+        print(f"  game as JSON:  {len(json.dumps(game.to_dict())):6d}")
+        print(f"  journal event: {move_bytes:6.0f}")
+
+        sample = [('0001', i, events[i % len(events)]) for i in range(2000)]
+        single = append_rate(directory, sample[:200], 1)
+        batched = append_rate(directory, sample, 500)
+        print("append cost")
+        print(f"  fsync per event: {single * 1e6:8.1f} us/event")
+        print(f"  batched fsync:   {batched * 1e6:8.1f} us/event ({single / batched:.0f}x cheaper)")
+
+        # Half of the games are in the snapshot, the other half only in the
+        # log after it.
+        half = count // 2
+        games = {f'{i:04d}': play(f'{i:04d}')[0] for i in range(half)}
+        journal = Journal(os.path.join(directory, 'journal'), lambda: list(games.values()),
+                          snapshot_every=count * (MOVES + 4))
+        journal.recover()
+        journal.start()
+        for i in range(half, count):
+            game_id = f'{i:04d}'
+            for version, event in enumerate(play(game_id)[1]):
+                journal.append(game_id, version, event)
+        journal.flush()
+
+        start = time.perf_counter()
+        recovered = Journal(os.path.join(directory, 'journal'), list).recover()
+        elapsed = time.perf_counter() - start
+        assert len(recovered) == count
+        print(f"recovery, {half} games from the snapshot and {count - half} from {MOVES + 4} events each")
+        print(f"  {elapsed:.2f}s ({elapsed / count * 1e6:.0f} us/game)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Compares a list-backed quick match queue with MatchQueue when many players
+# are waiting: duplicate checks, cancels and finding a partner within the
+# allowed rating gap for each new arrival.
+# Run from the repository root: python -m benchmarks.bench_matchmaker [waiting]
+import random
+import sys
+import time
+
+from battleship.matchmaker import MatchQueue, can_pair
+
+
+class ListQueue:
+    # The previous list with linear scans, taught to pick the closest
+    # acceptable rating.
+    def __init__(self):
+        self.queue = []
+
+    def add(self, entry):
+        for queued in self.queue:
+            if queued['name'] == entry['name']:
+                return False
+        self.queue.append(entry)
+        return True
+
+    def remove(self, name, timestamp=None):
+        for i, entry in enumerate(self.queue):
+            if entry['name'] == name and (timestamp is None or entry['timestamp'] == timestamp):
+                del self.queue[i]
+                return True
+        return False
+
+    def pop_match(self, entry, now):
+        best = None
+        for i, other in enumerate(self.queue):
+            if can_pair(entry, other, now) and (best is None or abs(other['rating'] - entry['rating']) < abs(self.queue[best]['rating'] - entry['rating'])):
+                best = i
+        return self.queue.pop(best) if best is not None else None
+
+
+def workload(queue, waiting, rng):
+    # Fill the queue, cancel every other player, then match arrivals.
+    start = time.perf_counter()
+    for i in range(waiting):
+        queue.add({'name': f'p{i}', 'timestamp': 0.0, 'rating': rng.gauss(1500, 300)})
+    for i in range(0, waiting, 2):
+        queue.remove(f'p{i}')
+    matched = 0
+    for i in range(waiting):
+        if queue.pop_match({'name': f'a{i}', 'timestamp': 0.0, 'rating': rng.gauss(1500, 300)}, 0.0) is not None:
+            matched += 1
+    return time.perf_counter() - start, matched
+
+
+def main():
+    waiting = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    list_time, list_matched = workload(ListQueue(), waiting, random.Random(1))
+    queue_time, queue_matched = workload(MatchQueue(), waiting, random.Random(1))
+    per_op = 1e9 / (waiting * 2.5)
+    print(f"{waiting} players queued, half cancelled, {waiting} arrivals matched against the rest")
+    print(f"  list:       {list_time * per_op:9.0f} ns/op ({list_matched} matched)")
+    print(f"  MatchQueue: {queue_time * per_op:9.0f} ns/op ({queue_matched} matched, {list_time / queue_time:.0f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Time per move for two clients playing over loopback: each attack and the
+# state fetch after it sent one after the other, pipelined in one write, and
+# the state returned with the attack itself. Needs pygame for the client
+# module.
+# Run from the repository root: python -m benchmarks.bench_pipelining [games]
+import contextlib
+import io
+import logging
+import sys
+import time
+
+import main
+import server
+
+
+MODES = {
+    'one by one': {'pipelining': False, 'return_state': False},
+    'pipelined': {'pipelining': True, 'return_state': False},
+    'returned': {'pipelining': False, 'return_state': True},
+}
+
+
+def play(port, options):
+    clients = [main.BattleshipHttpClient(port=port, **options) for _ in range(2)]
+    clients[0].host_game('alice')
+    clients[1].join_private_game('bob', clients[0].game_id)
+    for client in clients:
+        client.randomize_fleet()
+    targets = [[(row, col) for row in range(main.BOARD_SIZE) for col in range(main.BOARD_SIZE)] for _ in clients]
+    moves = 0
+    state = {}
+    clients[0].add_message_callback(state.update)
+    start = time.perf_counter()
+    while not state.get('game_over') and targets[1]:
+        for client, cells in zip(clients, targets):
+            client.attack(*cells.pop())
+            moves += 1
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.disconnect()
+    return elapsed, moves
+
+
+def run():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logging.getLogger().setLevel(logging.WARNING)
+    listener = server.Server(0)
+    listener.daemon = True
+    listener.start()
+    while listener.my_socket.getsockname()[1] == 0:
+        time.sleep(0.01)
+    port = listener.my_socket.getsockname()[1]
+    print(f"{games} games over loopback, attack followed by a state fetch")
+    for mode, options in MODES.items():
+        total, moves = 0.0, 0
+        for _ in range(games):
+            # The client prints every connect and disconnect.
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, played = play(port, options)
+            total += elapsed
+            moves += played
+        print(f"  {mode:<10}  {total / moves * 1e6:7.0f} us/move")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,130 @@
+# Compares the old nested-dict GAMES entries with the slotted Game records:
+# memory held per live game and the cost of a housekeeping-style scan.
+# Run from the repository root: python -m benchmarks.bench_records [games]
+import sys
+import time
+import tracemalloc
+
+from battleship.game_logic import BattleshipGame
+from battleship.placements import random_fleet
+from battleship.records import Game
+
+LEGACY = BattleshipGame()
+FLEETS = (random_fleet(LEGACY.ships), random_fleet(LEGACY.ships))
+# Fixed timestamps so that both scans see exactly the same due work no matter
+# how long building the games took.
+CREATED = time.time()
+
+
+def dict_game(game_id):
+    # The shape handle_quick_match used to build by hand.
+    return {
+        'game_id': game_id,
+        'players': {
+            1: {'name': 'alice', 'ships_placed': False, 'connected': True, 'last_activity': CREATED, 'placed_ships_data': []},
+            2: {'name': 'bob', 'ships_placed': False, 'connected': True, 'last_activity': CREATED, 'placed_ships_data': []}
+        },
+        'player_boards': {1: [['.' for _ in range(10)] for _ in range(10)], 2: [['.' for _ in range(10)] for _ in range(10)]},
+        'player_ships': {1: {}, 2: {}},
+        'sunk_ships': {1: [], 2: []},
+        'turn': 1,
+        'phase': 'playing',
+        'status_message': 'Quick match found! Place your ships.',
+        'turn_start_time': 0,
+        'is_quick_match': True,
+        'version': 0
+    }
+
+
+def record_game(game_id):
+    game = Game(game_id, ['alice', 'bob'], is_quick_match=True)
+    game.phase = 'playing'
+    for player in game.players.values():
+        player.last_activity = CREATED
+    return game
+
+
+def placed_dict_game(game_id):
+    game = dict_game(game_id)
+    for player_number, ships in zip((1, 2), FLEETS):
+        for ship_data in ships:
+            LEGACY.place_ship(game['player_boards'][player_number], game['player_ships'][player_number], ship_data['name'],
+                              LEGACY.ships[ship_data['name']], ship_data['start_row'], ship_data['start_col'], ship_data['orientation'])
+        game['players'][player_number]['ships_placed'] = True
+        game['players'][player_number]['placed_ships_data'] = ships
+    return game
+
+
+def placed_record_game(game_id):
+    game = Game(game_id, ['alice', 'bob'], is_quick_match=True)
+    for player_number, ships in zip((1, 2), FLEETS):
+        game.place_fleet(player_number, ships)
+    game.turn_start_time = 0
+    for player in game.players.values():
+        player.last_activity = CREATED
+    return game
+
+
+def measure_memory(factory, count):
+    tracemalloc.start()
+    games = {str(i): factory(str(i)) for i in range(count)}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / count, games
+
+
+def scan_dicts(games, rounds):
+    start = time.perf_counter()
+    now = CREATED + 10
+    due = 0
+    for _ in range(rounds):
+        for game in games.values():
+            if game['phase'] == 'playing' and now - game.get('turn_start_time', 0) > 60:
+                due += 1
+            for player in game['players'].values():
+                if player.get('pending_polls'):
+                    continue
+                if player['connected'] and now - player.get('last_activity', 0) > 5:
+                    due += 1
+    return time.perf_counter() - start, due
+
+
+def scan_records(games, rounds):
+    start = time.perf_counter()
+    now = CREATED + 10
+    due = 0
+    for _ in range(rounds):
+        for game in games.values():
+            if game.phase == 'playing' and now - game.turn_start_time > 60:
+                due += 1
+            for player in game.players.values():
+                if player.pending_polls:
+                    continue
+                if player.connected and now - player.last_activity > 5:
+                    due += 1
+    return time.perf_counter() - start, due
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rounds = 5
+
+    for label, dict_factory, record_factory in (('before placement', dict_game, record_game),
+                                                 ('fleets placed', placed_dict_game, placed_record_game)):
+        dict_bytes, dict_games = measure_memory(dict_factory, count)
+        record_bytes, record_games = measure_memory(record_factory, count)
+        print(f"{count} games in memory, {label}")
+        print(f"  nested dicts: {dict_bytes:8.0f} bytes/game")
+        print(f"  records:      {record_bytes:8.0f} bytes/game ({dict_bytes / record_bytes:.1f}x smaller)")
+
+    dict_time, dict_due = scan_dicts(dict_games, rounds)
+    record_time, record_due = scan_records(record_games, rounds)
+    assert dict_due == record_due
+    per_game = 1e9 / (count * rounds)
+    print(f"housekeeping scan, {rounds} rounds")
+    print(f"  nested dicts: {dict_time * per_game:6.0f} ns/game")
+    print(f"  records:      {record_time * per_game:6.0f} ns/game ({dict_time / record_time:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Time to pick a free room code as the rooms fill up: drawing random codes
+# until one is unused, as server.py used to, against RoomCodeAllocator.
+# Run from the repository root: python -m benchmarks.bench_room_codes [length]
+import random
+import sys
+import time
+
+from battleship.sharding import RoomCodeAllocator
+
+OCCUPANCY = (0.5, 0.9, 0.99, 0.999)
+SAMPLES = 2000
+
+
+def retry_code(used, length, rng):
+    while True:
+        code = str(rng.randrange(10 ** length)).zfill(length)
+        if code not in used:
+            return code
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    size = 10 ** length
+    rng = random.Random(1)
+    print(f"{size} room codes, ns per code picked")
+    print(f"  {'occupancy':>9}  {'random retry':>12}  {'allocator':>9}")
+    for occupancy in OCCUPANCY:
+        allocator = RoomCodeAllocator(length=length, rng=rng)
+        used = {allocator.allocate() for _ in range(int(size * occupancy))}
+        samples = min(SAMPLES, size - len(used))
+
+        start = time.perf_counter()
+        for _ in range(samples):
+            retry_code(used, length, rng)
+        retry_time = time.perf_counter() - start
+
+        # Each code is released again right away so that occupancy stays
+        # put; the allocator column includes that release.
+        start = time.perf_counter()
+        for _ in range(samples):
+            allocator.release(allocator.allocate())
+        allocator_time = time.perf_counter() - start
+        print(f"  {occupancy:9.1%}  {retry_time / samples * 1e9:12.0f}  {allocator_time / samples * 1e9:9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Cost of answering a game state poll when nothing has changed: building and
+# encoding the state every time, as server.py used to, against the cached
+# bytes and against a 304 for a client that sends its ETag. The first row is
+# also what every poll costs right after a move, once per game version.
+# Run from the repository root: python -m benchmarks.bench_state_cache [polls]
+import json
+import sys
+import time
+
+import server
+from battleship.placements import random_fleet
+from battleship.records import ENGINE
+
+
+def main():
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    http = server.httpserver
+    game_id = http.create_game(['alice', 'bob'])
+    game = server.STORE.get(game_id)
+    for player_number in (1, 2):
+        game.place_fleet(player_number, random_fleet(ENGINE.ships))
+    for i in range(30):
+        game.attack(game.turn, i // 10, i % 10)
+    server.game_changed(game)
+    params = {'game_id': game_id, 'player_number': 1, 'is_spectator': False}
+
+    start = time.perf_counter()
+    for _ in range(polls):
+        json.dumps(http.build_game_state(game, 1)).encode('utf-8')
+    rebuild = time.perf_counter() - start
+
+    # The same miss with the opponent's fogged board spliced in from the
+    # fleet's encoded view instead of being rebuilt and encoded.
+    start = time.perf_counter()
+    for _ in range(polls):
+        server.STATE_CACHE.pop(game_id, None)
+        http.encoded_game_state(game, 1)
+    spliced = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(polls):
+        http.game_state_response(params)
+    cached = time.perf_counter() - start
+
+    etag = http.game_state_response(params).split(b'ETag: ', 1)[1].split(b'\r\n', 1)[0].decode('utf-8')
+    start = time.perf_counter()
+    for _ in range(polls):
+        http.game_state_response(params, headers={'if-none-match': etag})
+    not_modified = time.perf_counter() - start
+
+    size = len(http.game_state_response(params))
+    short = len(http.game_state_response(params, headers={'if-none-match': etag}))
+    print(f"{polls} polls of an unchanged game")
+    print(f"  rebuild and encode state: {rebuild / polls * 1e6:6.1f} us/poll")
+    print(f"  encode with spliced view: {spliced / polls * 1e6:6.1f} us/poll")
+    print(f"  cached response:          {cached / polls * 1e6:6.1f} us/poll, {size} bytes")
+    print(f"  304 Not Modified:         {not_modified / polls * 1e6:6.1f} us/poll, {short} bytes")
+
+
+if __name__ == '__main__':
+    main()
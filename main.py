@@ -4,6 +4,10 @@ import json
 import time
 import socket
 import math 
+import queue
+import threading
+
+from battleship import codec
 
 WINDOW_WIDTH, WINDOW_HEIGHT = 1200, 800
 BOARD_SIZE, CELL_SIZE, BOARD_MARGIN = 10, 40, 50
@@ -23,10 +27,31 @@ SOFT_WHITE = (248, 248, 255)
 GRADIENT_START = (45, 85, 135)
 GRADIENT_END = (25, 50, 100)
 
+# The server holds a long-poll open for up to 10 seconds, so only treat the
+# connection as stale once a poll has been outstanding for noticeably longer.
+POLL_STALE_SECONDS = 15
+# Game states are requested with boards as row-major strings instead of
+# nested lists; the server falls back to lists for anything it does not know.
+BOARD_ENCODING = 'compact'
+BOARD_FIELDS = ('own_board', 'opponent_board', 'player1_board', 'player2_board')
+
+
+def decode_board(board):
+    if isinstance(board, str):
+        return [list(board[row * BOARD_SIZE:(row + 1) * BOARD_SIZE]) for row in range(BOARD_SIZE)]
+    return board
+
 class BattleshipHttpClient:
-    def __init__(self, host='localhost', port=8889):
+    def __init__(self, host='localhost', port=8889, use_event_stream=False, media_type=codec.JSON, pipelining=False, return_state=True):
         self.host = host
         self.port = port
+        self.use_event_stream = use_event_stream
+        self.pipelining = pipelining
+        # Actions ask for the game state in their own response; otherwise it
+        # is fetched after them, pipelined if enabled.
+        self.return_state = return_state
+        # Request and response bodies; the event stream is always JSON.
+        self.media_type = media_type
         self.game_id = None
         self.player_number = None
         self.player_name = None
@@ -34,6 +59,17 @@ class BattleshipHttpClient:
         self.last_successful_poll = time.time()
         self.sock = None 
         self.is_spectator = False 
+        self.state_version = None
+        self.state_game_id = None
+        self.poll_sock = None
+        self.poll_thread = None
+        self.polling = False
+        self.incoming = queue.Queue()
+        # Last ETag, body and headers of each GET path; the ETag is sent back
+        # as If-None-Match.
+        self.etags = {}
+        # Server clock minus ours, for the deadlines in game states.
+        self.clock_offset = 0.0
 
     def connect(self):
         if self.sock: 
@@ -59,7 +95,80 @@ class BattleshipHttpClient:
     def add_message_callback(self, callback):
         self.message_callbacks.append(callback)
 
-    def _send_request(self, method, path, payload=None):
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.connect((self.host, self.port))
+        except Exception as e:
+            sock.close()
+            raise ConnectionError(f"Failed to connect to {self.host}:{self.port}: {e}")
+        return sock
+
+    def _exchange(self, sock, method, path, payload=None, extra_headers=None):
+        status, headers, body = self._exchange_raw(sock, method, path, payload, extra_headers)
+        return self._decode_body(headers, body)
+
+    def _decode_body(self, headers, body):
+        media_type = codec.media_type_of(headers.get('content-type', codec.JSON))
+        return codec.decode(media_type if media_type in codec.CODECS else codec.JSON, body)
+
+    def _encode_request(self, method, path, payload=None, extra_headers=None):
+        body = codec.encode(self.media_type, payload) if payload else b''
+        header_lines = ''.join(f"{key}: {value}\r\n" for key, value in (extra_headers or {}).items())
+        request = (
+            f"{method} {path} HTTP/1.0\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Content-Type: {self.media_type}\r\n"
+            f"Accept: {self.media_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"{header_lines}"
+            f"Connection: keep-alive\r\n\r\n"
+        )
+        return request.encode('utf-8') + body
+
+    def _read_response(self, sock, buffer):
+        # Reads one response; bytes of the responses after it stay in buffer.
+        while b'\r\n\r\n' not in buffer:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Server closed the connection unexpectedly.")
+            buffer += chunk
+
+        head_end = buffer.index(b'\r\n\r\n')
+        header_lines = buffer[:head_end].decode('utf-8').split('\r\n')
+        status = int(header_lines[0].split(' ')[1])
+        headers = {}
+        for line in header_lines[1:]:
+            if ': ' in line:
+                key, value = line.split(': ', 1)
+                headers[key.lower()] = value
+        if 'x-server-time' in headers:
+            self.clock_offset = float(headers['x-server-time']) - time.time()
+
+        end = head_end + 4 + int(headers.get('content-length', 0))
+        while len(buffer) < end:
+            chunk = sock.recv(max(end - len(buffer), 4096))
+            if not chunk:
+                raise ConnectionError("Incomplete response from server.")
+            buffer += chunk
+        body = bytes(buffer[head_end + 4:end])
+        del buffer[:end]
+
+        self.last_successful_poll = time.time()
+        return status, headers, body
+
+    def _exchange_raw(self, sock, method, path, payload=None, extra_headers=None):
+        sock.sendall(self._encode_request(method, path, payload, extra_headers))
+        return self._read_response(sock, bytearray())
+
+    def _send_request(self, method, path, payload=None, extra_headers=None):
+        responses = self._send_requests([(method, path, payload, extra_headers)])
+        return responses[0] if responses else None
+
+    def _send_requests(self, requests):
+        # Writes all requests at once and reads the responses in order, so a
+        # batch costs one round trip. Takes (method, path, payload,
+        # extra_headers) tuples; None if the connection failed.
         if not self.sock:
             try:
                 self.connect()
@@ -68,74 +177,76 @@ class BattleshipHttpClient:
                 self._notify_listeners({'type': 'disconnect_error', 'message': f'Connection lost: {e}'})
                 return None
 
+        paths = ', '.join(path for method, path, payload, extra_headers in requests)
         try:
-            body = json.dumps(payload) if payload else ''
-            request = (
-                f"{method} {path} HTTP/1.0\r\n"
-                f"Host: {self.host}:{self.port}\r\n"
-                f"Content-Type: application/json\r\n"
-                f"Content-Length: {len(body)}\r\n"
-                f"Connection: keep-alive\r\n\r\n"
-                f"{body}"
-            )
-            self.sock.sendall(request.encode('utf-8'))
-
-            response_data = b''
-            while b'\r\n\r\n' not in response_data:
-                chunk = self.sock.recv(4096)
-                if not chunk:
-                    raise ConnectionError("Server closed the connection unexpectedly.")
-                response_data += chunk
-            
-            header_part, body_part = response_data.split(b'\r\n\r\n', 1)
-
-            headers = {}
-            for line in header_part.decode('utf-8').split('\r\n')[1:]:
-                if ': ' in line:
-                    key, value = line.split(': ', 1)
-                    headers[key.lower()] = value
-
-            content_length = int(headers.get('content-length', 0))
-            
-            while len(body_part) < content_length:
-                chunk = self.sock.recv(content_length - len(body_part))
-                if not chunk:
-                    raise ConnectionError("Incomplete response from server.")
-                body_part += chunk
-                
-            self.last_successful_poll = time.time()
-            return json.loads(body_part.decode('utf-8'))
+            data, cached = [], []
+            for method, path, payload, extra_headers in requests:
+                cached.append(self.etags.get(path) if method == 'GET' else None)
+                if cached[-1]:
+                    extra_headers = dict(extra_headers or {}, **{'If-None-Match': cached[-1][0]})
+                data.append(self._encode_request(method, path, payload, extra_headers))
+            self.sock.sendall(b''.join(data))
+
+            buffer = bytearray()
+            responses = []
+            for (method, path, payload, extra_headers), cached_response in zip(requests, cached):
+                status, headers, body = self._read_response(self.sock, buffer)
+                if status == 304 and cached_response:
+                    responses.append(self._decode_body(cached_response[2], cached_response[1]))
+                    continue
+                if method == 'GET' and 'etag' in headers:
+                    self.etags[path] = (headers['etag'], body, headers)
+                responses.append(self._decode_body(headers, body))
+            return responses
 
         except (ConnectionError, ConnectionResetError, BrokenPipeError, socket.timeout) as e:
-            print(f"HTTP request to {path} failed due to connection issue: {e}")
+            print(f"HTTP request to {paths} failed due to connection issue: {e}")
             self._notify_listeners({'type': 'disconnect_error', 'message': f'Connection lost: {e}'})
             self.disconnect() 
             return None
         except Exception as e:
-            print(f"An unexpected error occurred during request to {path}: {e}")
+            print(f"An unexpected error occurred during request to {paths}: {e}")
             self._notify_listeners({'type': 'error', 'message': f'Request failed: {e}'})
             self.disconnect()
             return None
 
+    def _send_action(self, path, payload):
+        # Returns the action's response and the game state after it, or None
+        # for the state when it still has to be fetched.
+        if self.return_state:
+            response = self._send_request('POST', f"{path}?return_state=1", payload, {'X-Board-Encoding': BOARD_ENCODING})
+            return response, response.pop('state', None) if isinstance(response, dict) else None
+        if not self.pipelining or not self._can_get_game_state():
+            return self._send_request('POST', path, payload), None
+        responses = self._send_requests([('POST', path, payload, None), self._game_state_request()])
+        return responses if responses else (None, None)
+
+    def _refresh_game_state(self, state=None):
+        if state is None:
+            return self.get_game_state()
+        self._accept_game_state(state)
+        self._notify_listeners(state)
+        return True
+
     def host_game(self, player_name):
         self.player_name = player_name
         self.is_spectator = False 
-        response = self._send_request('POST', '/api/host', {'player_name': player_name})
+        response, state = self._send_action('/api/host', {'player_name': player_name})
         if response and 'game_id' in response:
             self.game_id = response['game_id']
             self.player_number = response['player_number']
-            self.get_game_state()
+            self._refresh_game_state(state)
         else:
             self._notify_listeners({'type': 'error', 'message': 'Could not host game.'})
 
     def join_private_game(self, player_name, room_code):
         self.player_name = player_name
         self.is_spectator = False 
-        response = self._send_request('POST', '/api/join', {'player_name': player_name, 'game_id': room_code})
+        response, state = self._send_action('/api/join', {'player_name': player_name, 'game_id': room_code})
         if response and 'player_number' in response:
             self.game_id = room_code
             self.player_number = response['player_number']
-            self.get_game_state()
+            self._refresh_game_state(state)
         elif response:
             error_msg = response.get('error', 'Could not join game.')
             self._notify_listeners({'type': 'room_join_status', 'success': False, 'message': error_msg})
@@ -157,30 +268,181 @@ class BattleshipHttpClient:
 
     def place_ships(self, ships_data):
         payload = {'game_id': self.game_id, 'player_number': self.player_number, 'ships': ships_data}
-        response = self._send_request('POST', '/api/place_ships', payload)
-        if response:
+        response, state = self._send_action('/api/place_ships', payload)
+        if response and 'error' not in response:
             self._notify_listeners({'type': 'ships_placed', 'success': True})
-            self.get_game_state()
+            self._refresh_game_state(state)
+        else:
+            error_msg = response.get('error', 'Failed to place ships.') if response else 'Failed to place ships.'
+            self._notify_listeners({'type': 'ships_placed', 'success': False, 'message': error_msg})
+
+    def randomize_fleet(self):
+        payload = {'game_id': self.game_id, 'player_number': self.player_number}
+        response, state = self._send_action('/api/randomize_fleet', payload)
+        if response and 'ships' in response:
+            self._notify_listeners({'type': 'ships_placed', 'success': True, 'ships': response['ships']})
+            self._refresh_game_state(state)
         else:
-            self._notify_listeners({'type': 'ships_placed', 'success': False, 'message': 'Failed to place ships.'})
+            error_msg = response.get('error', 'Failed to place ships.') if response else 'Failed to place ships.'
+            self._notify_listeners({'type': 'ships_placed', 'success': False, 'message': error_msg})
             
     def attack(self, row, col):
         payload = {'game_id': self.game_id, 'player_number': self.player_number, 'row': row, 'col': col}
-        self._send_request('POST', '/api/attack', payload)
-        self.get_game_state()
+        response, state = self._send_action('/api/attack', payload)
+        self._refresh_game_state(state)
 
-    def get_game_state(self):
-        if not self.game_id or (self.player_number is None and not self.is_spectator): 
-            return
-        path = f"/api/gamestate?game_id={self.game_id}"
+    def _game_state_query(self):
+        query = f"game_id={self.game_id}"
         if not self.is_spectator:
-            path += f"&player_number={self.player_number}"
+            query += f"&player_number={self.player_number}"
         else:
-            path += f"&is_spectator=true" 
-            
-        response = self._send_request('GET', path)
-        if response:
-            self._notify_listeners(response)
+            query += f"&is_spectator=true" 
+        return query
+
+    def _can_get_game_state(self):
+        return bool(self.game_id) and (self.player_number is not None or self.is_spectator)
+
+    def _game_state_request(self):
+        return ('GET', f"/api/gamestate?{self._game_state_query()}", None, {'X-Board-Encoding': BOARD_ENCODING})
+
+    def get_game_state(self, wait=False):
+        if not self._can_get_game_state():
+            return False
+        path = f"/api/gamestate?{self._game_state_query()}"
+
+        if not wait:
+            response = self._send_request(*self._game_state_request())
+            if response:
+                self._accept_game_state(response)
+                self._notify_listeners(response)
+            return bool(response)
+
+        if self.state_version is not None and self.state_game_id == self.game_id:
+            path += f"&since={self.state_version}"
+        try:
+            if not self.poll_sock:
+                self.poll_sock = self._open_socket()
+            response = self._exchange(self.poll_sock, 'GET', path, extra_headers={'X-Board-Encoding': BOARD_ENCODING})
+        except Exception as e:
+            if self.polling:
+                print(f"Game state poll failed: {e}")
+                self.incoming.put({'type': 'disconnect_error', 'message': f'Connection lost: {e}'})
+            self._close_poll_socket()
+            return False
+
+        if self._accept_game_state(response):
+            self.incoming.put(response)
+        return response.get('type') == 'game_state'
+
+    def _accept_game_state(self, response):
+        version = response.get('version')
+        if version is None:
+            return True
+        known = self.state_version if self.state_game_id == self.game_id else None
+        if response.get('delta'):
+            # A delta carries absolute cell values, so it applies on top of
+            # any state at or after its base version; a gap forces a full fetch.
+            if known is None or response['since'] > known:
+                self.state_version = None
+                return False
+            if version <= known:
+                return False
+        elif known is not None and version < known:
+            return False
+        self.state_game_id = self.game_id
+        self.state_version = version
+        return True
+
+    def start_state_polling(self):
+        if self.poll_thread and self.poll_thread.is_alive():
+            return
+        self.polling = True
+        target = self._consume_game_state_stream if self.use_event_stream else self._poll_game_state
+        self.poll_thread = threading.Thread(target=target, daemon=True)
+        self.poll_thread.start()
+
+    def stop_state_polling(self):
+        self.polling = False
+        self._close_poll_socket()
+
+    def _poll_game_state(self):
+        while self.polling and self.game_id:
+            if not self.get_game_state(wait=True):
+                break
+        self.polling = False
+
+    def _consume_game_state_stream(self):
+        if not self.game_id or (self.player_number is None and not self.is_spectator):
+            self.polling = False
+            return
+        try:
+            self.poll_sock = self._open_socket()
+            request = (
+                f"GET /api/gamestate/stream?{self._game_state_query()} HTTP/1.0\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Accept: text/event-stream\r\n"
+                f"X-Board-Encoding: {BOARD_ENCODING}\r\n\r\n"
+            )
+            self.poll_sock.sendall(request.encode('utf-8'))
+            stream = self.poll_sock.makefile('rb')
+
+            status_line = stream.readline().decode('utf-8')
+            if ' 200 ' not in status_line:
+                raise ConnectionError(f"Event stream refused: {status_line.strip()}")
+            while True:
+                line = stream.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if line.lower().startswith(b'x-server-time:'):
+                    self.clock_offset = float(line.split(b':', 1)[1]) - time.time()
+
+            event, data_lines = 'message', []
+            while self.polling:
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("Event stream closed by server.")
+                line = line.decode('utf-8').rstrip('\r\n')
+                self.last_successful_poll = time.time()
+                if line.startswith(':'):
+                    continue
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data_lines.append(line[5:].strip())
+                elif not line and data_lines:
+                    data = json.loads('\n'.join(data_lines))
+                    if event == 'game_state' and self._accept_game_state(data):
+                        self.incoming.put(data)
+                    elif event == 'game_removed':
+                        break
+                    event, data_lines = 'message', []
+        except Exception as e:
+            if self.polling:
+                print(f"Game state stream failed: {e}")
+                self.incoming.put({'type': 'disconnect_error', 'message': f'Connection lost: {e}'})
+        self._close_poll_socket()
+        self.polling = False
+
+    def _close_poll_socket(self):
+        sock, self.poll_sock = self.poll_sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def dispatch_incoming(self):
+        while True:
+            try:
+                message = self.incoming.get_nowait()
+            except queue.Empty:
+                return
+            # States returned by actions are delivered straight away and may
+            # have overtaken ones the polling thread queued.
+            if message.get('type') == 'game_state' and self.state_version is not None and message.get('version', self.state_version) < self.state_version:
+                continue
+            self._notify_listeners(message)
 
     def quick_match(self, player_name):
         self.game_id = None
@@ -189,7 +451,7 @@ class BattleshipHttpClient:
         self.is_spectator = False 
         
         print(f"DEBUG: Starting quick match for {player_name}")
-        response = self._send_request('POST', '/api/quick_match', {'player_name': player_name})
+        response, state = self._send_action('/api/quick_match', {'player_name': player_name})
         print(f"DEBUG: Quick match response: {response}")
         
         if response:
@@ -201,7 +463,7 @@ class BattleshipHttpClient:
                     'type': 'quick_match_found',
                     'opponent_name': response['opponent_name']
                 })
-                self.get_game_state()
+                self._refresh_game_state(state)
             else:
                 print("DEBUG: Waiting for opponent")
                 self._notify_listeners({'type': 'quick_match_waiting'})
@@ -255,10 +517,10 @@ class BattleshipHttpClient:
         self.player_number = None 
         self.player_name = "Spectator" 
         self.is_spectator = True
-        response = self._send_request('POST', '/api/spectate', {'game_id': game_id})
+        response, state = self._send_action('/api/spectate', {'game_id': game_id})
         if response and response.get('success'):
             self._notify_listeners({'type': 'spectate_success'})
-            self.get_game_state()
+            self._refresh_game_state(state)
         else:
             self._notify_listeners({'type': 'error', 'message': 'Could not spectate game.'})
 
@@ -540,7 +802,7 @@ class BattleshipGUI:
         self.timer_font = pygame.font.Font(None, 48)
         self.scoreboard_font = pygame.font.Font(None, 22)
 
-        self.client = BattleshipHttpClient(host="localhost", port=8888)
+        self.client = BattleshipHttpClient(host="localhost", port=8888, use_event_stream=True, pipelining=True)
         self.client.add_message_callback(self.handle_server_message)
         
         self.POLL_GAME_STATE_EVENT = pygame.USEREVENT + 1
@@ -568,7 +830,8 @@ class BattleshipGUI:
         self.opponent_name = ""
         self.current_turn_player_name = None
         self.room_code = ""
-        self.turn_time_remaining = 0
+        self.turn_deadline = None
+        self.reconnect_deadline = None
         self.opponent_connected = True
         self.own_sunk_ships = []
         self.opponent_sunk_ships = []
@@ -597,6 +860,12 @@ class BattleshipGUI:
         if msg_type == 'game_state':
             self.disconnected = False
             self.game_phase = message.get('game_phase', self.game_phase)
+            if message.get('board_encoding') == 'compact':
+                for field in BOARD_FIELDS:
+                    if field in message:
+                        message[field] = decode_board(message[field])
+            if message.get('delta'):
+                self.apply_board_patches(message.get('board_patches', {}))
 
             if self.client.is_spectator:
                 self.spectate_board_p1 = message.get('player1_board', self.spectate_board_p1)
@@ -619,7 +888,8 @@ class BattleshipGUI:
 
             self.status_message = message.get('status_message', self.status_message)
             self.current_turn_player_name = message.get('current_turn_player_name')
-            self.turn_time_remaining = message.get('turn_time_remaining', self.turn_time_remaining)
+            self.turn_deadline = message.get('turn_deadline')
+            self.reconnect_deadline = message.get('reconnect_deadline')
             self.opponent_connected = message.get('opponent_connected', self.opponent_connected)
 
             if self.client.game_id:
@@ -643,6 +913,19 @@ class BattleshipGUI:
             
         elif msg_type == 'ships_placed' and message['success']:
             self.status_message = "Ships placed! Waiting for opponent..."
+            if 'ships' in message:
+                self.placed_ships = message['ships']
+                for ship in self.ships_to_place:
+                    ship['placed'] = True
+                self.current_ship_index = len(self.ships_to_place)
+
+        elif msg_type == 'ships_placed':
+            self.status_message = message.get('message', 'Failed to place ships.')
+            self.own_board = [['.' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+            self.placed_ships = []
+            for ship in self.ships_to_place:
+                ship['placed'] = False
+            self.current_ship_index = 0
         
         elif msg_type == 'error':
             self.status_message = message.get('message', 'An unknown error occurred.')
@@ -686,10 +969,25 @@ class BattleshipGUI:
             self.status_message = "Successfully joined as spectator."
             self.game_phase = "spectating"
 
+    def apply_board_patches(self, board_patches):
+        boards = {
+            'own_board': self.own_board,
+            'opponent_board': self.opponent_board,
+            'player1_board': self.spectate_board_p1,
+            'player2_board': self.spectate_board_p2,
+        }
+        for field, patches in board_patches.items():
+            board = boards.get(field)
+            if board is None:
+                continue
+            for row, col, cell in patches:
+                board[row][col] = cell
+
     def run(self):
         running = True
         while running:
             mouse_pos = pygame.mouse.get_pos()
+            self.client.dispatch_incoming()
 
             if self.game_phase == "host_game":
                 self.host_game_inputs['name_input'].update()
@@ -699,7 +997,7 @@ class BattleshipGUI:
             elif self.game_phase == "quick_match":
                 self.quick_match_inputs['name_input'].update()
 
-            if self.client.game_id and time.time() - self.client.last_successful_poll > 6:
+            if self.client.game_id and time.time() - self.client.last_successful_poll > POLL_STALE_SECONDS:
                 self.disconnected = True
                 self.status_message = "Disconnected. Click to reconnect."
 
@@ -714,7 +1012,7 @@ class BattleshipGUI:
 
                 if event.type == self.POLL_GAME_STATE_EVENT:
                     if self.client.game_id and self.game_phase not in ["main_menu", "host_game", "join_game", "quick_match", "spectate_list"]:
-                        self.client.get_game_state()
+                        self.client.start_state_polling()
                     elif self.game_phase == "quick_match_waiting":
                         current_time = time.time()
                         if current_time - self.quick_match_last_check >= 2:
@@ -747,6 +1045,8 @@ class BattleshipGUI:
                 elif self.game_phase == "placing_ships":
                     if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
                         self.ship_orientation = 'V' if self.ship_orientation == 'H' else 'H'
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_a and self.current_ship_index < len(self.ships_to_place):
+                        self.client.randomize_fleet()
                     elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                         self.place_ship(mouse_pos)
                 elif self.game_phase == "playing":
@@ -905,7 +1205,7 @@ class BattleshipGUI:
         self.spectate_list_back_button = EnhancedButton(50, 50, 100, 40, "Back", DEEP_GRAY, SILVER, self.go_to_main_menu) 
 
 
-    def go_to_main_menu(self): self.game_phase = "main_menu"; self.reset_game_state(); self.client = BattleshipHttpClient(); self.client.add_message_callback(self.handle_server_message)
+    def go_to_main_menu(self): self.client.stop_state_polling(); self.game_phase = "main_menu"; self.reset_game_state(); self.client = BattleshipHttpClient(self.client.host, self.client.port, self.client.use_event_stream, self.client.media_type, self.client.pipelining); self.client.add_message_callback(self.handle_server_message)
     def go_to_host_game(self): self.game_phase = "host_game"; self.status_message = "Enter your name to host a game."
     def go_to_join_game(self): self.game_phase = "join_game"; self.status_message = "Enter name and code to join or reconnect."
     def go_to_quick_match(self): 
@@ -988,14 +1288,22 @@ class BattleshipGUI:
                 cells.append((r, col))
         return True, cells
 
+    def server_time(self):
+        return time.time() + self.client.clock_offset
+
     def draw_status(self):
-        draw_enhanced_status_panel(self.screen, self.status_message, self.game_phase, 
+        status_message = self.status_message
+        if self.reconnect_deadline is not None:
+            remaining = max(0, self.reconnect_deadline - self.server_time())
+            status_message = f"Game Paused. Waiting {int(remaining)} seconds for the other player to reconnect. Room code: {self.room_code}"
+        draw_enhanced_status_panel(self.screen, status_message, self.game_phase, 
                                    self.player_name, self.opponent_name, self.your_turn)
 
     def draw_timer_and_code(self, y_offset_timer, y_offset_code):
-        if self.turn_time_remaining is not None:
-            time_text = f"{int(self.turn_time_remaining)}"
-            color = WHITE if self.turn_time_remaining > 10 else CRIMSON 
+        if self.turn_deadline is not None:
+            remaining = max(0, self.turn_deadline - self.server_time())
+            time_text = f"{int(remaining)}"
+            color = WHITE if remaining > 10 else CRIMSON 
             timer_surface = self.timer_font.render(time_text, True, color)
             x = WINDOW_WIDTH // 2
             y = y_offset_timer
@@ -1066,7 +1374,7 @@ class BattleshipGUI:
 
 
     def draw_ship_list(self, x_offset, y_offset):
-        title_surf = self.big_font.render("Place Your Fleet (R to rotate)", True, WHITE)
+        title_surf = self.big_font.render("Place Your Fleet (R to rotate, A for random)", True, WHITE)
         self.screen.blit(title_surf, (x_offset, y_offset))
         y_offset += 50
         for i, ship in enumerate(self.ships_to_place):
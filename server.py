@@ -1,4 +1,4 @@
-import random
+import asyncio
 import socket
 import threading
 import json
@@ -6,41 +6,217 @@ import uuid
 import time
 import logging
 import sys
-from battleship.game_logic import BattleshipGame
+from battleship import codec
+from battleship.change_notifier import ChangeNotifier
+from battleship.deadlines import DeadlineScheduler
+from battleship.http_parser import RECV_SIZE, BadRequest, Request, RequestParser, receive_request
+from battleship.journal import Journal
+from battleship.matchmaker import Matchmaker
+from battleship.placements import random_fleet, validate_fleet
+from battleship.records import ENGINE, Game, compact_board, opponent_of
+from battleship.router import InvalidParameter, Param, Route, Router, parse_bool, parse_int, parse_list, parse_query
+from battleship.sharding import RoomCodeAllocator, RoomCodesExhausted, parse_shard
+from battleship.store import InMemoryGameStore, VersionConflict, open_store
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-GAMES = {}
-GAME_LOGIC = BattleshipGame()
+# Replaced from the command line to share games between server processes.
+STORE = InMemoryGameStore()
+STORE_RETRIES = 3
+STORE_WATCH_INTERVAL = 0.25
+# Set from the command line to keep a write-ahead journal of the games.
+JOURNAL = None
 TURN_TIMEOUT = 60 
 CLIENT_INACTIVITY_TIMEOUT = 5  
 RECONNECT_WINDOW_SECONDS = 60  
+LONG_POLL_TIMEOUT = 10
+SSE_HEARTBEAT_SECONDS = 10
+GAME_OVER_LINGER_SECONDS = 10
+HOUSEKEEPING_MAX_SLEEP = 60
+CHANGES = ChangeNotifier()
+DEADLINES = DeadlineScheduler()
+# Encoded game states for the current version of each game, keyed by
+# (player_number, since, board_encoding, media_type), so polls that find
+# nothing new reuse the bytes.
+STATE_CACHE = {}
+# Clients may ask for boards as one row-major string of BOARD_SIZE**2 cells
+# with an X-Board-Encoding: compact header; anything else gets the nested
+# JSON lists.
+BOARD_ENCODINGS = ('json', 'compact')
+
+# Set from the command line when running behind server_manager.py.
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+ROOM_CODE_LENGTH = 4
+# Rebuilt in main() for the shard and store being served.
+ROOM_CODES = RoomCodeAllocator(SHARD_INDEX, SHARD_COUNT, ROOM_CODE_LENGTH)
 
-QUICK_MATCH_QUEUE = []
 QUICK_MATCH_TIMEOUT = 120  
-QUICK_MATCH_LOCK = threading.Lock()  
+# Most operations one /api/batch request may carry.
+MAX_BATCH_OPERATIONS = 50
+# Per-route request counts and timings for GET /api/route_stats. Timing
+# every request costs about as much as routing it, so it is off unless
+# asked for.
+ROUTE_STATS = False
+STATE_PARAMS = (Param('game_id'), Param('player_number', int), Param('is_spectator', parse_bool, default=False))
+ACTION_PARAMS = (Param('return_state', parse_bool, default=False),)
+
+
+def parse_player_number(value):
+    player_number = parse_int(value)
+    if player_number not in (1, 2):
+        raise ValueError(value)
+    return player_number
+
+
+GAME_ID = Param('game_id', required=True)
+PLAYER_NAME = Param('player_name', required=True)
+PLAYER_NUMBER = Param('player_number', parse_player_number, required=True)
+
+
+class HeldResponse:
+    def __init__(self, game_id, player_number=None):
+        self.game_id = game_id
+        self.player_number = player_number
+
+    def _begin(self):
+        if self.player_number is not None:
+            STORE.poll_started(self.game_id, self.player_number)
+
+    def _end(self):
+        if self.player_number is not None:
+            STORE.poll_finished(self.game_id, self.player_number)
+
+
+class PendingResponse(HeldResponse):
+    def __init__(self, game, since, respond, player_number=None, timeout=LONG_POLL_TIMEOUT):
+        super().__init__(game.game_id, player_number)
+        self.game = game
+        self.since = since
+        self.respond = respond
+        self.timeout = timeout
+
+    def wait(self):
+        self._begin()
+        try:
+            CHANGES.wait(self.game, self.since, self.timeout)
+        finally:
+            self._end()
+        return self.respond()
+
+    async def wait_async(self):
+        self._begin()
+        try:
+            await CHANGES.wait_async(self.game, self.since, self.timeout)
+        finally:
+            self._end()
+        return self.respond()
+
+
+class EventStream(HeldResponse):
+    def __init__(self, head, game_id, render, player_number=None, heartbeat=SSE_HEARTBEAT_SECONDS):
+        super().__init__(game_id, player_number)
+        self.head = head
+        self.render = render
+        self.heartbeat = heartbeat
+        self.version = None
+
+    def format_event(self, event, version, data):
+        return f"event: {event}\nid: {version}\ndata: ".encode('utf-8') + data + b"\n\n"
+
+    def next_chunk(self):
+        game = STORE.get(self.game_id)
+        if game is None:
+            return self.format_event('game_removed', '', json.dumps({'game_id': self.game_id}).encode('utf-8')), None
+        if self.version is None or game.version > self.version:
+            version, body = self.render(game, self.version)
+            chunk = self.format_event('game_state', version, body)
+            self.version = version
+            return chunk, game
+        return b': keep-alive\n\n', game
+
+    def chunks(self):
+        yield self.head
+        self._begin()
+        try:
+            while True:
+                chunk, game = self.next_chunk()
+                yield chunk
+                if game is None:
+                    return
+                CHANGES.wait(game, self.version, self.heartbeat)
+        finally:
+            self._end()
+
+    async def chunks_async(self):
+        yield self.head
+        self._begin()
+        try:
+            while True:
+                chunk, game = self.next_chunk()
+                yield chunk
+                if game is None:
+                    return
+                await CHANGES.wait_async(game, self.version, self.heartbeat)
+        finally:
+            self._end()
+
+
+def response_status(response):
+    # Held responses are answered with a 200 once the game changes.
+    if isinstance(response, bytes):
+        return int(response[9:12])
+    return 200
+
 
 class BattleshipHttpServer:
 
     def __init__(self):
         self.sessions = {}
+        # The response media type negotiated for the request being processed
+        # and, for a POST with return_state=1, its payload and headers.
+        self.local = threading.local()
         self.types = {
             '.pdf': 'application/pdf',
             '.jpg': 'image/jpeg',
             '.txt': 'text/plain',
             '.html': 'text/html'
         }
-
-    def response(self, code=200, message='OK', body=None, headers={}):
+        self.router = Router([
+            Route('GET', '/api/gamestate', self.handle_game_state, STATE_PARAMS + (Param('since', int),), request=True),
+            Route('GET', '/api/gamestate/stream', self.game_state_stream, STATE_PARAMS, request=True),
+            Route('GET', '/api/quick_matches', self.handle_get_quick_matches),
+            Route('GET', '/api/quick_match_stats', self.handle_quick_match_stats),
+            Route('GET', '/api/route_stats', self.handle_route_stats),
+            Route('POST', '/api/host', self.handle_host, ACTION_PARAMS, (Param('player_name', default='Player 1'),)),
+            Route('POST', '/api/batch', self.handle_batch, ACTION_PARAMS, (Param('operations', parse_list, required=True),), request=True),
+            Route('POST', '/api/quick_match', self.handle_quick_match, ACTION_PARAMS, (PLAYER_NAME,)),
+            Route('POST', '/api/cancel_quick_match', self.handle_cancel_quick_match, ACTION_PARAMS, (PLAYER_NAME,)),
+            Route('POST', '/api/check_quick_match', self.handle_check_quick_match, ACTION_PARAMS, (PLAYER_NAME,)),
+            Route('POST', '/api/join', self.handle_join_or_reconnect, ACTION_PARAMS, (GAME_ID, PLAYER_NAME)),
+            Route('POST', '/api/reconnect', self.handle_join_or_reconnect, ACTION_PARAMS, (GAME_ID, PLAYER_NAME)),
+            Route('POST', '/api/spectate', self.handle_spectate_game, ACTION_PARAMS, (GAME_ID,)),
+            Route('POST', '/api/place_ships', self.handle_place_ships, ACTION_PARAMS,
+                  (GAME_ID, PLAYER_NUMBER, Param('ships', parse_list, required=True)), game=True),
+            Route('POST', '/api/attack', self.handle_attack, ACTION_PARAMS,
+                  (GAME_ID, PLAYER_NUMBER, Param('row', parse_int, required=True), Param('col', parse_int, required=True)), game=True),
+            Route('POST', '/api/randomize_fleet', self.handle_randomize_fleet, ACTION_PARAMS, (GAME_ID, PLAYER_NUMBER), game=True),
+        ], stats=ROUTE_STATS)
+
+    def response(self, code=200, message='OK', body=None, headers={}, media_type=None):
+        if media_type is None:
+            media_type = getattr(self.local, 'media_type', codec.JSON)
+        if code == 200 and isinstance(body, dict) and getattr(self.local, 'state_for', None) is not None:
+            return self.response_with_state(body, headers, media_type)
         body_bytes = b''
         if body:
             if not isinstance(body, bytes):
-                body_bytes = json.dumps(body).encode('utf-8')
+                body_bytes = codec.encode(media_type, body)
             else:
                 body_bytes = body
         
         final_headers = {
-            "Content-Type": "application/json",
+            "Content-Type": media_type,
             "Server": "BattleshipHTTP/1.0",
             "Connection": "keep-alive",
         }
@@ -54,500 +230,694 @@ class BattleshipHttpServer:
         header_block = "\r\n".join(header_lines)
         return f"{header_block}\r\n\r\n".encode('utf-8') + body_bytes
 
-    def get_headers_and_body(self, data):
+    def response_with_state(self, body, headers, media_type):
+        # Adds the caller's view of the game the response is about, so that
+        # a client does not have to fetch it right after every action.
+        (payload, request_headers), self.local.state_for = self.local.state_for, None
+        game_id = body.get('game_id', payload.get('game_id'))
+        game = STORE.get(game_id) if game_id else None
+        if game is None:
+            return self.response(200, 'OK', body, headers, media_type)
         try:
-            parts = data.split('\r\n\r\n', 1)
-            header_part = parts[0]
-            body = parts[1] if len(parts) > 1 else ''
-            headers = {}
-            header_lines = header_part.split('\r\n')[1:]
-            for line in header_lines:
-                if ': ' in line:
-                    key, value = line.split(': ', 1)
-                    headers[key.lower()] = value
-            return headers, body
-        except Exception as e:
-            logging.error(f"Error parsing headers and body: {e}")
-            return {}, ''
-
-    def process(self, data_str):
+            player_number = int(body.get('player_number', payload.get('player_number')))
+        except (TypeError, ValueError):
+            player_number = None
+        if player_number not in game.players:
+            player_number = None
+        board_encoding = negotiate_board_encoding(request_headers)
+        if media_type != codec.JSON:
+            body = dict(body, state=self.build_game_state(game, player_number, None, None, board_encoding))
+            return self.response(200, 'OK', body, headers, media_type)
+        version, state = self.encoded_game_state(game, player_number, None, board_encoding)
+        encoded = codec.encode(media_type, body)[:-1] + (b', "state": ' if body else b'"state": ')
+        return self.response(200, 'OK', encoded + state + b'}', headers, media_type)
+
+    def process(self, request):
+        self.local.media_type = codec.negotiate(request.headers.get('accept'))
+        self.local.state_for = None
+        route = self.router.match(request.method, request.path)
+        if route is None:
+            allowed = self.router.allowed(request.path)
+            if allowed:
+                return self.response(405, 'Method Not Allowed', {'error': f'Use {" or ".join(allowed)} for {request.path}'}, {'Allow': ', '.join(allowed)})
+            return self.response(404, 'Not Found', {'error': 'Endpoint not found'})
+        if not self.router.stats_enabled:
+            return self.run_route(route, request)
+        started = time.perf_counter()
+        response = self.run_route(route, request)
+        self.router.record(route, started, response_status(response))
+        return response
+
+    def run_route(self, route, request):
         try:
-            request_line = data_str.split('\r\n')[0]
-            parts = request_line.split(' ')
-            method = parts[0].upper().strip()
-            path = parts[1].strip()
-            
-            headers, body = self.get_headers_and_body(data_str)
-
-            if method == 'GET':
-                return self.http_get(path, headers)
-            elif method == 'POST':
-                return self.http_post(path, headers, body)
-            else:
-                return self.response(400, 'Bad Request', {'error': 'Unsupported method'})
+            # Handlers read the game afresh each time, so a request that lost
+            # an optimistic write to another process can simply run again.
+            for attempt in range(STORE_RETRIES):
+                try:
+                    return self.dispatch(route, request)
+                except VersionConflict as e:
+                    logging.info(f"Retrying {request.method} {request.path}: {e}")
+            return self.response(409, 'Conflict', {'error': 'Game was changed concurrently, please retry'})
+        except RoomCodesExhausted as e:
+            logging.error(f"Cannot create a game: {e}")
+            return self.response(503, 'Service Unavailable', {'error': 'No free rooms, please try again later'})
         except Exception as e:
             logging.error(f"Error processing request: {e}")
             return self.response(500, 'Internal Server Error', {'error': 'Failed to process request'})
 
-    def http_get(self, path, headers):
-        if path.startswith('/api/gamestate'):
-            params = {}
-            if '?' in path:
-                query_string = path.split('?')[1]
-                try:
-                    params = dict(qc.split("=") for qc in query_string.split("&"))
-                except ValueError:
-                    return self.response(400, 'Bad Request', {'error': 'Malformed query string'})
-
-            game_id = params.get('game_id')
-            player_number_str = params.get('player_number')
-            is_spectator = params.get('is_spectator') == 'true' 
-
-            if not game_id or game_id not in GAMES:
-                return self.response(404, 'Not Found', {'error': 'Game not found'})
-            
-            game = GAMES[game_id]
-
-            if not is_spectator and player_number_str:
-                player_number = int(player_number_str)
-                if player_number in game['players']:
-                    game['players'][player_number]['last_activity'] = time.time()
-            elif is_spectator: 
-                pass 
-
-            current_status_message = game['status_message'] 
-
-            if game['phase'] == 'paused':
-                pause_start = game.get('pause_start_time', 0)
-                elapsed = time.time() - pause_start
-                time_remaining = max(0, RECONNECT_WINDOW_SECONDS - elapsed)
-
-                current_status_message = f"Game Paused. Waiting {int(time_remaining)} seconds for the other player to reconnect. Room code: {game['game_id']}"
-
-            if is_spectator:
-                state_for_spectator = {
-                    'type': 'game_state',
-                    'game_phase': game['phase'],
-                    'player1_name': game['players'].get(1, {}).get('name'),
-                    'player2_name': game['players'].get(2, {}).get('name'),
-                    'player1_board': game['player_boards'][1],
-                    'player2_board': game['player_boards'][2],
-                    'current_turn_player_name': game['players'].get(game['turn'], {}).get('name'),
-                    'status_message': current_status_message,
-                    'game_over': game['phase'] == 'game_over',
-                    'winner': game.get('winner_name'),
-                    'turn_time_remaining': max(0, TURN_TIMEOUT - (time.time() - game.get('turn_start_time', 0))) if game['phase'] == 'playing' else None,
-                    'player1_connected': game['players'].get(1, {}).get('connected', False),
-                    'player2_connected': game['players'].get(2, {}).get('connected', False),
-                    'player1_sunk_ships': game['sunk_ships'][1],
-                    'player2_sunk_ships': game['sunk_ships'][2]
-                }
-                return self.response(200, 'OK', state_for_spectator)
-            else:
-                if not player_number_str:
-                    return self.response(400, 'Bad Request', {'error': 'Player number is required'})
-                player_number = int(player_number_str)
-                opponent_number = 2 if player_number == 1 else 1
-
-                state_for_player = {
-                    'type': 'game_state',
-                    'game_phase': game['phase'],
-                    'your_turn': game['turn'] == player_number and game['phase'] == 'playing',
-                    'own_board': game['player_boards'][player_number],
-                    'opponent_board': self.get_opponent_view(game['player_boards'][opponent_number]),
-                    'player_name': game['players'].get(player_number, {}).get('name'),
-                    'opponent_name': game['players'].get(opponent_number, {}).get('name'),
-                    'current_turn_player_name': game['players'].get(game['turn'], {}).get('name'),
-                    'status_message': current_status_message,
-                    'game_over': game['phase'] == 'game_over',
-                    'winner': game.get('winner_name'),
-                    'turn_time_remaining': max(0, TURN_TIMEOUT - (time.time() - game.get('turn_start_time', 0))) if game['phase'] == 'playing' else None,
-                    'opponent_connected': game['players'].get(opponent_number, {}).get('connected', False),
-                    'own_sunk_ships': game['sunk_ships'][player_number],
-                    'opponent_sunk_ships': game['sunk_ships'][opponent_number],
-                    'placed_ships': game['players'].get(player_number, {}).get('placed_ships_data', [])
-                }
-                return self.response(200, 'OK', state_for_player)
-        
-        if path == '/api/quick_matches':
-            return self.handle_get_quick_matches()
-
-        return self.response(404, 'Not Found', {'error': 'Endpoint not found'})
-    
-    def get_opponent_view(self, real_board):
-        view_board = [['.' for _ in range(10)] for _ in range(10)]
-        for r in range(10):
-            for c in range(10):
-                if real_board[r][c] in ['X', 'O']:
-                    view_board[r][c] = real_board[r][c]
-        return view_board
-
-    def http_post(self, path, headers, body):
+    def dispatch(self, route, request):
+        query = parse_query(request.query)
         try:
-            payload = json.loads(body) if body else {}
-        except json.JSONDecodeError:
-            return self.response(400, 'Bad Request', {'error': 'Invalid JSON in request body'})
-
-        if path == '/api/host':
-            return self.handle_host(payload)
-
-        if path == '/api/quick_match':
-            return self.handle_quick_match(payload)
-            
-        if path == '/api/cancel_quick_match':
-            return self.handle_cancel_quick_match(payload)
-            
-        if path == '/api/check_quick_match':
-            return self.handle_check_quick_match(payload)
-
-        if path == '/api/reconnect' or path == '/api/join':
-            return self.handle_join_or_reconnect(payload)
-
-        if path == '/api/spectate':
-            return self.handle_spectate_game(payload)
-            
-        game_id = payload.get('game_id')
-        if not game_id or game_id not in GAMES:
+            params = route.parse(query)
+        except InvalidParameter as e:
+            return self.response(400, 'Bad Request', {'error': str(e)})
+        if route.method == 'GET':
+            args = [params]
+        else:
+            # Bodies in a format we do not know are read as JSON, as they always were.
+            media_type = codec.media_type_of(request.headers.get('content-type', codec.JSON))
+            if media_type not in codec.CODECS:
+                media_type = codec.JSON
+            try:
+                payload = codec.decode(media_type, request.body) if request.body else {}
+            except codec.CodecError:
+                return self.response(400, 'Bad Request', {'error': f'Invalid {media_type} request body'})
+            if not isinstance(payload, dict):
+                return self.response(400, 'Bad Request', {'error': 'Request body must be an object'})
+            try:
+                body = route.parse_body(payload)
+            except InvalidParameter as e:
+                return self.response(400, 'Bad Request', {'error': str(e)})
+            if params.get('return_state'):
+                self.local.state_for = (body, request.headers)
+            args = [body]
+        if route.game:
+            game = STORE.get(args[0]['game_id'])
+            if game is None:
+                return self.response(404, 'Not Found', {'error': 'Game not found'})
+            args.append(game)
+            if route.request:
+                args.append(request)
+            with game.lock:
+                return route.handler(*args)
+        if route.request:
+            args.append(request)
+        return route.handler(*args)
+
+    def handle_game_state(self, params, request):
+        since = params['since']
+        if since is None:
+            return self.game_state_response(params, headers=request.headers)
+
+        game = STORE.get(params['game_id']) if params['game_id'] else None
+        if game is None or game.version != since:
+            return self.game_state_response(params, since, game, request.headers)
+
+        player_number = None
+        if not params['is_spectator'] and params['player_number'] in game.players:
+            player_number = params['player_number']
+        return PendingResponse(game, since, lambda: self.game_state_response(params, since, headers=request.headers), player_number)
+
+    def handle_quick_match_stats(self, params):
+        return self.response(200, 'OK', MATCHMAKER.stats())
+
+    def handle_route_stats(self, params):
+        if not self.router.stats_enabled:
+            return self.response(404, 'Not Found', {'error': 'Route stats are disabled'})
+        return self.response(200, 'OK', self.router.stats())
+
+    def game_state_response(self, params, since=None, game=None, headers={}):
+        game_id = params.get('game_id')
+        player_number = params.get('player_number')
+        is_spectator = params.get('is_spectator')
+
+        if game is None and game_id:
+            game = STORE.get(game_id)
+        if game is None:
             return self.response(404, 'Not Found', {'error': 'Game not found'})
-        
-        if path == '/api/place_ships':
-            return self.handle_place_ships(payload, GAMES[game_id])
-
-        if path == '/api/attack':
-            return self.handle_attack(payload, GAMES[game_id])
-
-        return self.response(404, 'Not Found', {'error': 'API endpoint not found'})
-    
-    def generate_numeric_room_code(self, length=4):
-        while True:
-            code = ''.join(random.choices('0123456789', k=length))
-            if code not in GAMES:
-                return code
+        if not is_spectator and player_number is None:
+            return self.response(400, 'Bad Request', {'error': 'Player number is required'})
+
+        if is_spectator:
+            player_number = None
+        elif player_number in game.players:
+            STORE.touch(game, player_number)
+
+        board_encoding = negotiate_board_encoding(headers)
+        # Negotiated here rather than in process() because a held poll is
+        # answered outside of it.
+        media_type = codec.negotiate(headers.get('accept'))
+        version, body = self.encoded_game_state(game, player_number, since, board_encoding, media_type)
+        # Every change bumps the version and times are sent as deadlines, so
+        # the version, board encoding and media type identify the body for a
+        # given URL.
+        etag = str(version)
+        if board_encoding != 'json':
+            etag += f"-{board_encoding}"
+        if media_type != codec.JSON:
+            etag += f"-{media_type.rsplit('/', 1)[-1]}"
+        response_headers = {'ETag': f'"{etag}"', 'X-Server-Time': f"{time.time():.3f}", 'Vary': 'Accept, X-Board-Encoding'}
+        if board_encoding != 'json':
+            response_headers['X-Board-Encoding'] = board_encoding
+        if headers.get('if-none-match') == response_headers['ETag']:
+            return self.response(304, 'Not Modified', headers=response_headers, media_type=media_type)
+        return self.response(200, 'OK', body, response_headers, media_type)
+
+    def encoded_game_state(self, game, player_number=None, since=None, board_encoding='json', media_type=codec.JSON):
+        version = game.version
+        cached = STATE_CACHE.get(game.game_id)
+        if cached is None or cached[0] != version:
+            cached = STATE_CACHE[game.game_id] = (version, {})
+        key = (player_number, since, board_encoding, media_type)
+        body = cached[1].get(key)
+        if body is None and media_type != codec.JSON:
+            body = codec.encode(media_type, self.build_game_state(game, player_number, since, None, board_encoding))
+            cached[1][key] = body
+        elif body is None:
+            # Fogged boards come already encoded from the fleet and are
+            # spliced in after the rest of the state.
+            encoded = {}
+            body = json.dumps(self.build_game_state(game, player_number, since, encoded, board_encoding)).encode('utf-8')
+            if encoded:
+                body = body[:-1] + b''.join(b', "%s": %s' % (field.encode('utf-8'), view) for field, view in encoded.items()) + b'}'
+            cached[1][key] = body
+        return version, body
+
+    def game_state_stream(self, params, request):
+        game_id = params['game_id']
+        is_spectator = params['is_spectator']
+
+        game = STORE.get(game_id) if game_id else None
+        if game is None:
+            return self.response(404, 'Not Found', {'error': 'Game not found'})
+        if not is_spectator and params['player_number'] is None:
+            return self.response(400, 'Bad Request', {'error': 'Player number is required'})
+
+        player_number = None if is_spectator else params['player_number']
+        held_player = player_number if player_number in game.players else None
+        board_encoding = negotiate_board_encoding(request.headers)
+        head = self.stream_head(board_encoding)
+        return EventStream(head, game_id, lambda game, since: self.encoded_game_state(game, player_number, since, board_encoding), held_player)
+
+    def stream_head(self, board_encoding='json'):
+        header_lines = [
+            "HTTP/1.0 200 OK",
+            "Content-Type: text/event-stream",
+            "Cache-Control: no-cache",
+            "Server: BattleshipHTTP/1.0",
+            f"X-Server-Time: {time.time():.3f}",
+            "Connection: close",
+        ]
+        if board_encoding != 'json':
+            header_lines.insert(-1, f"X-Board-Encoding: {board_encoding}")
+        return ("\r\n".join(header_lines) + "\r\n\r\n").encode('utf-8')
+
+    def build_game_state(self, game, player_number=None, since=None, encoded=None, board_encoding='json'):
+        version, changes = CHANGES.changes_since(game, since)
+        current_status_message = game.status_message
+        # Countdowns are sent as server timestamps so that the state only
+        # changes with the version.
+        turn_deadline = game.turn_start_time + TURN_TIMEOUT if game.phase == 'playing' else None
+        reconnect_deadline = None
+
+        if game.phase == 'paused':
+            reconnect_deadline = game.pause_start_time + RECONNECT_WINDOW_SECONDS
+            current_status_message = f"Game Paused. Waiting for the other player to reconnect. Room code: {game.game_id}"
+
+        if player_number is None:
+            state = {
+                'type': 'game_state',
+                'version': version,
+                'game_phase': game.phase,
+                'player1_name': game.player_name(1),
+                'player2_name': game.player_name(2),
+                'current_turn_player_name': game.player_name(game.turn),
+                'status_message': current_status_message,
+                'game_over': game.phase == 'game_over',
+                'winner': game.winner_name,
+                'turn_deadline': turn_deadline,
+                'reconnect_deadline': reconnect_deadline,
+                'player1_connected': game.player_connected(1),
+                'player2_connected': game.player_connected(2),
+            }
+            boards = {'player1_board': (1, False), 'player2_board': (2, False)}
+            sunk_lists = {'player1_sunk_ships': 1, 'player2_sunk_ships': 2}
+            placements = {}
+        else:
+            opponent_number = opponent_of(player_number)
+
+            state = {
+                'type': 'game_state',
+                'version': version,
+                'game_phase': game.phase,
+                'your_turn': game.turn == player_number and game.phase == 'playing',
+                'player_name': game.player_name(player_number),
+                'opponent_name': game.player_name(opponent_number),
+                'current_turn_player_name': game.player_name(game.turn),
+                'status_message': current_status_message,
+                'game_over': game.phase == 'game_over',
+                'winner': game.winner_name,
+                'turn_deadline': turn_deadline,
+                'reconnect_deadline': reconnect_deadline,
+                'opponent_connected': game.player_connected(opponent_number),
+            }
+            boards = {'own_board': (player_number, False), 'opponent_board': (opponent_number, True)}
+            sunk_lists = {'own_sunk_ships': player_number, 'opponent_sunk_ships': opponent_number}
+            placements = {'placed_ships': player_number}
+
+        if changes is not None:
+            state['delta'] = True
+            state['since'] = since
+        compact = board_encoding == 'compact'
+        if compact:
+            state['board_encoding'] = board_encoding
+
+        for field, (owner, fogged) in boards.items():
+            fleet = game.fleets[owner]
+            board = fleet.board
+            if changes is None or ('board', owner) in changes:
+                if compact and not fogged:
+                    state[field] = compact_board(board)
+                elif compact and encoded is not None:
+                    encoded[field] = b'"%s"' % fleet.compact_view()
+                elif compact:
+                    state[field] = fleet.compact_view().decode('ascii')
+                elif not fogged:
+                    state[field] = board
+                elif encoded is not None:
+                    encoded[field] = fleet.view
+                else:
+                    state[field] = fleet.opponent_view()
+                continue
+            patches = []
+            for change in changes:
+                if change[0] == 'cell' and change[1] == owner:
+                    row, col = change[2], change[3]
+                    cell = board[row][col]
+                    if fogged and cell not in ('X', 'O'):
+                        cell = '.'
+                    patches.append([row, col, cell])
+            if patches:
+                state.setdefault('board_patches', {})[field] = patches
+
+        for field, owner in sunk_lists.items():
+            if changes is None or ('sunk', owner) in changes:
+                state[field] = game.fleets[owner].sunk_ships
+
+        for field, owner in placements.items():
+            if changes is None or ('placed', owner) in changes:
+                player = game.players.get(owner)
+                state[field] = player.placed_ships_data if player else []
+
+        return state
 
     def handle_host(self, payload):
-        player_name = payload.get('player_name', 'Player 1')
-        game_id = self.generate_numeric_room_code()
-        GAMES[game_id] = {
-            'game_id': game_id,
-            'players': {1: {'name': player_name, 'ships_placed': False, 'connected': True, 'last_activity': time.time(), 'placed_ships_data': []}},
-            'player_boards': {1: [['.' for _ in range(10)] for _ in range(10)], 2: [['.' for _ in range(10)] for _ in range(10)]},
-            'player_ships': {1: {}, 2: {}},
-            'sunk_ships': {1: [], 2: []},
-            'turn': 1,
-            'phase': 'waiting_room',
-            'status_message': 'Waiting for opponent to join...',
-            'turn_start_time': 0,
-            'is_quick_match': False 
-        }
+        player_name = payload['player_name']
+        game_id = self.create_game([player_name])
         logging.info(f"Game {game_id} hosted by {player_name}")
         return self.response(200, 'OK', {'game_id': game_id, 'player_number': 1})
 
-    def handle_join_or_reconnect(self, payload):
-        game_id = payload.get('game_id')
-        player_name = payload.get('player_name')
+    def handle_batch(self, payload, request):
+        # Runs each operation through process() as if it had been sent on
+        # its own, in order, and answers with the status and body of each.
+        operations = payload['operations']
+        if not operations:
+            return self.response(400, 'Bad Request', {'error': 'operations must be a non-empty list'})
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return self.response(400, 'Bad Request', {'error': f'At most {MAX_BATCH_OPERATIONS} operations per batch'})
+
+        media_type = self.local.media_type
+        headers = {key: request.headers[key] for key in ('accept', 'x-board-encoding') if key in request.headers}
+        headers['content-type'] = codec.JSON
+        results = [self.batch_operation(operation, headers) for operation in operations]
+        self.local.media_type = media_type
+        self.local.state_for = None
+
+        if media_type != codec.JSON:
+            return self.response(200, 'OK', {'results': [{'status': status, 'body': codec.decode(media_type, body) if body else None} for status, body in results]})
+        # Bodies are already JSON, so they are spliced in as they are.
+        return self.response(200, 'OK', b'{"results": [' + b', '.join(b'{"status": %d, "body": %s}' % (status, body or b'null') for status, body in results) + b']}')
+
+    def batch_operation(self, operation, headers):
+        if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+            return 400, codec.encode(self.local.media_type, {'error': 'Each operation needs a path'})
+        method = str(operation.get('method', 'GET')).upper()
+        path, _, query = operation['path'].partition('?')
+        if path in ('/api/batch', '/api/gamestate/stream'):
+            return 400, codec.encode(self.local.media_type, {'error': f'{path} cannot be batched'})
+        body = operation.get('body')
+        body = codec.encode(codec.JSON, body) if body is not None else b''
+        response = self.process(Request(method, path, query, 'HTTP/1.0', headers, body, ''))
+        if isinstance(response, PendingResponse):
+            # A batch is answered at once, so a poll gets the current state.
+            response = response.respond()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split(b' ', 2)[1]), body
+
+    def create_game(self, player_names, is_quick_match=False):
+        # A code is only taken already when the store and the allocator
+        # disagree, e.g. after a game was written by an older server. It goes
+        # back to the allocator, which keeps it in use while the game lasts.
+        while True:
+            game = Game(ROOM_CODES.allocate(), player_names, is_quick_match)
+            if STORE.create(game):
+                if JOURNAL is not None:
+                    JOURNAL.append(game.game_id, game.version, ('create', player_names, is_quick_match))
+                return game.game_id
+            ROOM_CODES.release(game.game_id)
 
-        if not game_id or game_id not in GAMES:
+    def handle_join_or_reconnect(self, payload):
+        game = STORE.get(payload['game_id'])
+        if game is None:
             return self.response(404, 'Not Found', {'error': 'Game not found'})
-        if not player_name:
-            return self.response(400, 'Bad Request', {'error': 'Player name is required'})
-        
-        game = GAMES[game_id]
-        
-        reconnecting_player_number = None
-        for p_num, p_data in game['players'].items():
-            if p_data['name'] == player_name:
-                reconnecting_player_number = p_num
-                break
+        with game.lock:
+            return self.join_or_reconnect(game, payload['player_name'])
+
+    def join_or_reconnect(self, game, player_name):
+        game_id = game.game_id
+        reconnecting_player_number = STORE.player_games(player_name).get(game_id)
 
         if reconnecting_player_number:
-            if game['phase'] == 'paused' and game.get('disconnected_player_num') == reconnecting_player_number:
+            reconnecting_player = game.players[reconnecting_player_number]
+            if game.phase == 'paused' and game.disconnected_player_num == reconnecting_player_number:
                 logging.info(f"Player {player_name} reconnected to game {game_id}. Resuming.")
-                game['players'][reconnecting_player_number]['connected'] = True
-                game['players'][reconnecting_player_number]['last_activity'] = time.time()
-                
-                game['phase'] = 'playing'
-                game['turn_start_time'] = time.time()
-                game['status_message'] = f"{player_name} has reconnected. Resuming game."
-                
-                if 'pause_start_time' in game: del game['pause_start_time']
-                if 'disconnected_player_num' in game: del game['disconnected_player_num']
+                game.resume(reconnecting_player_number)
+                game_changed(game, event=('resume', reconnecting_player_number))
                 
                 return self.response(200, 'OK', {'game_id': game_id, 'player_number': reconnecting_player_number, 'reconnected': True})
             
-            elif not game['players'][reconnecting_player_number]['connected']:
-                game['players'][reconnecting_player_number]['connected'] = True
-                game['players'][reconnecting_player_number]['last_activity'] = time.time()
+            elif not reconnecting_player.connected:
+                reconnecting_player.connected = True
+                reconnecting_player.touch()
                 logging.info(f"Player {player_name} reconnected to game {game_id} as player {reconnecting_player_number}")
+                game_changed(game, event=('reconnect', reconnecting_player_number))
                 return self.response(200, 'OK', {'game_id': game_id, 'player_number': reconnecting_player_number, 'reconnected': True})
             
             else: 
                  return self.response(403, 'Forbidden', {'error': 'Player is already connected to this game.'})
         else:
-            if len(game['players']) >= 2:
+            if len(game.players) >= 2:
                 return self.response(403, 'Forbidden', {'error': 'Game is full'})
             
-            player_number = 2
-            game['players'][player_number] = {'name': player_name, 'ships_placed': False, 'connected': True, 'last_activity': time.time(), 'placed_ships_data': []}
-            game['phase'] = 'placing_ships'
-            game['status_message'] = f"{player_name} has joined! Place your ships."
+            player_number = game.add_player(player_name)
             logging.info(f"{player_name} joined game {game_id} as player {player_number}")
+            game_changed(game, event=('join', player_name))
             return self.response(200, 'OK', {'game_id': game_id, 'player_number': player_number})
 
     def handle_place_ships(self, payload, game):
-        player_number = payload.get('player_number')
-        if not player_number or game['phase'] != 'placing_ships':
+        player_number = payload['player_number']
+        if game.phase != 'placing_ships':
             return self.response(400, 'Bad Request', {'error': 'Not in ship placement phase'})
         
-        ships = payload.get('ships', [])
-        board = [['.' for _ in range(10)] for _ in range(10)]
-        ships_map = {}
-        for ship_data in ships:
-            GAME_LOGIC.place_ship(board, ships_map, ship_data['name'], GAME_LOGIC.ships[ship_data['name']], ship_data['start_row'], ship_data['start_col'], ship_data['orientation'])
-        
-        game['player_boards'][player_number] = board
-        game['player_ships'][player_number] = ships_map
-        game['players'][player_number]['ships_placed'] = True
-        game['players'][player_number]['placed_ships_data'] = ships
-        logging.info(f"Player {player_number} in game {game['game_id']} placed ships.")
-
-        if len(game['players']) == 2 and all(p.get('ships_placed') for p in game['players'].values()):
-            game['phase'] = 'playing'
-            game['turn_start_time'] = time.time()
-            game['status_message'] = f"Game on! It's {game['players'][1]['name']}'s turn."
-            logging.info(f"Game {game['game_id']} starting.")
+        ships = payload['ships']
+        valid, error = validate_fleet(ships, ENGINE.ships)
+        if not valid:
+            return self.response(400, 'Bad Request', {'error': f'Invalid fleet: {error}'})
 
+        self.place_fleet(game, player_number, ships)
         return self.response(200, 'OK', {'message': 'Ships placed successfully'})
 
+    def handle_randomize_fleet(self, payload, game):
+        player_number = payload['player_number']
+        if game.phase != 'placing_ships':
+            return self.response(400, 'Bad Request', {'error': 'Not in ship placement phase'})
+
+        ships = random_fleet(ENGINE.ships)
+        self.place_fleet(game, player_number, ships)
+        return self.response(200, 'OK', {'message': 'Ships placed successfully', 'ships': ships})
+
+    def place_fleet(self, game, player_number, ships):
+        started = game.place_fleet(player_number, ships)
+        logging.info(f"Player {player_number} in game {game.game_id} placed ships.")
+        changes = [('board', player_number), ('placed', player_number)]
+
+        if started:
+            logging.info(f"Game {game.game_id} starting.")
+
+        game_changed(game, changes, ('place', player_number, ships))
+
     def handle_attack(self, payload, game):
-        player_number = payload.get('player_number')
-        if game['phase'] != 'playing' or player_number != game['turn']:
+        player_number = payload['player_number']
+        if game.phase != 'playing' or player_number != game.turn:
             return self.response(403, 'Forbidden', {'error': 'Not your turn or game not active'})
         
-        row, col = payload.get('row'), payload.get('col')
-        opponent_number = 2 if player_number == 1 else 1
-        opponent_board = game['player_boards'][opponent_number]
-        opponent_ships = game['player_ships'][opponent_number]
+        row, col = payload['row'], payload['col']
+        opponent_number = opponent_of(player_number)
 
-        result = GAME_LOGIC.attack(opponent_board, opponent_ships, row, col)
-        game['status_message'] = f"{game['players'][player_number]['name']} attacked ({row},{col}): {result}"
-        logging.info(f"Game {game['game_id']}: Player {player_number} attacks ({row},{col}). Result: {result}")
+        result = game.attack(player_number, row, col)
+        changes = [('cell', opponent_number, row, col)] if result not in ('Invalid coordinates', 'Already attacked') else []
+        logging.info(f"Game {game.game_id}: Player {player_number} attacks ({row},{col}). Result: {result}")
 
         if "sunk" in result:
-            sunk_ship_name = result.split("sunk ")[1].strip('!')
-            if sunk_ship_name not in game['sunk_ships'][opponent_number]:
-                game['sunk_ships'][opponent_number].append(sunk_ship_name)
-
-        if GAME_LOGIC.check_game_over(opponent_ships):
-            game['phase'] = 'game_over'
-            game['winner_name'] = game['players'][player_number]['name']
-            game['status_message'] = f"Game Over! {game['winner_name']} wins!"
-            logging.info(f"Game {game['game_id']} over. Winner: {game['winner_name']}")
-        else:
-            game['turn'] = opponent_number
-            game['turn_start_time'] = time.time()
-            game['status_message'] = f"It's {game['players'][opponent_number]['name']}'s turn."
+            changes.append(('sunk', opponent_number))
 
+        game_changed(game, changes, ('attack', player_number, row, col))
+        if game.phase == 'game_over':
+            logging.info(f"Game {game.game_id} over. Winner: {game.winner_name}")
+            record_result(game)
         return self.response(200, 'OK', {'result': result})
 
     def handle_quick_match(self, payload):
-        player_name = payload.get('player_name')
-        if not player_name:
-            return self.response(400, 'Bad Request', {'error': 'Player name is required'})
+        player_name = payload['player_name']
         
-        with QUICK_MATCH_LOCK:
-            games_to_clean = []
-            for game_id, game in GAMES.items():
-                if game['phase'] == 'game_over':
-                    for player_num, player_data in game['players'].items():
-                        if player_data['name'] == player_name:
-                            games_to_clean.append(game_id)
-                            break
-            
-            for game_id in games_to_clean:
-                if game_id in GAMES:
-                    del GAMES[game_id]
-                    logging.info(f"Cleaned up finished game {game_id} for player {player_name}")
-            
-            for queued_player in QUICK_MATCH_QUEUE:
-                if queued_player['name'] == player_name:
-                    return self.response(400, 'Bad Request', {'error': 'Already in quick match queue'})
-            
-            if len(QUICK_MATCH_QUEUE) >= 1:
-                player1 = QUICK_MATCH_QUEUE.pop(0)
-                player2 = {'name': player_name, 'timestamp': time.time()}
-                
-                game_id = self.generate_numeric_room_code()
-                GAMES[game_id] = {
-                    'game_id': game_id,
-                    'players': {
-                        1: {'name': player1['name'], 'ships_placed': False, 'connected': True, 'last_activity': time.time(), 'placed_ships_data': []},
-                        2: {'name': player2['name'], 'ships_placed': False, 'connected': True, 'last_activity': time.time(), 'placed_ships_data': []}
-                    },
-                    'player_boards': {1: [['.' for _ in range(10)] for _ in range(10)], 2: [['.' for _ in range(10)] for _ in range(10)]},
-                    'player_ships': {1: {}, 2: {}},
-                    'sunk_ships': {1: [], 2: []},
-                    'turn': 1,
-                    'phase': 'placing_ships',
-                    'status_message': 'Quick match found! Place your ships.',
-                    'turn_start_time': 0,
-                    'is_quick_match': True
-                }
-                
-                logging.info(f"Quick match created: {game_id} with {player1['name']} vs {player2['name']}")
-                
-                return self.response(200, 'OK', {
-                    'game_id': game_id, 
-                    'player_number': 2,
-                    'matched': True,
-                    'opponent_name': player1['name']
-                })
-            else:
-                queue_entry = {
-                    'name': player_name,
-                    'timestamp': time.time()
-                }
-                QUICK_MATCH_QUEUE.append(queue_entry)
-                logging.info(f"Player {player_name} joined quick match queue")
-                
-                return self.response(200, 'OK', {'matched': False, 'waiting': True})
+        for game_id in STORE.player_games(player_name):
+            game = STORE.get(game_id)
+            if game is not None and game.phase == 'game_over' and remove_game(game_id):
+                logging.info(f"Cleaned up finished game {game_id} for player {player_name}")
+
+        games = MATCHMAKER.join(player_name)
+        if games is None:
+            return self.response(400, 'Bad Request', {'error': 'Already in quick match queue'})
+
+        for player1, player2, game_id in games:
+            if player_name == player1['name']:
+                return self.response(200, 'OK', {'game_id': game_id, 'player_number': 1, 'matched': True, 'opponent_name': player2['name']})
+            if player_name == player2['name']:
+                return self.response(200, 'OK', {'game_id': game_id, 'player_number': 2, 'matched': True, 'opponent_name': player1['name']})
+        logging.info(f"Player {player_name} joined quick match queue")
+        return self.response(200, 'OK', {'matched': False, 'waiting': True})
 
     def handle_cancel_quick_match(self, payload):
-        player_name = payload.get('player_name')
-        if not player_name:
-            return self.response(400, 'Bad Request', {'error': 'Player name is required'})
+        player_name = payload['player_name']
         
-        with QUICK_MATCH_LOCK:
-            for i, queued_player in enumerate(QUICK_MATCH_QUEUE):
-                if queued_player['name'] == player_name:
-                    QUICK_MATCH_QUEUE.pop(i)
-                    logging.info(f"Player {player_name} cancelled quick match")
-                    return self.response(200, 'OK', {'cancelled': True})
+        if MATCHMAKER.cancel(player_name):
+            logging.info(f"Player {player_name} cancelled quick match")
+            return self.response(200, 'OK', {'cancelled': True})
         
         return self.response(404, 'Not Found', {'error': 'Not in quick match queue'})
 
     def handle_check_quick_match(self, payload):
-        player_name = payload.get('player_name')
-        if not player_name:
-            return self.response(400, 'Bad Request', {'error': 'Player name is required'})
+        player_name = payload['player_name']
         
-        with QUICK_MATCH_LOCK:
-            for queued_player in QUICK_MATCH_QUEUE:
-                if queued_player['name'] == player_name:
-                    return self.response(200, 'OK', {'matched': False, 'waiting': True})
+        if MATCHMAKER.waiting(player_name):
+            return self.response(200, 'OK', {'matched': False, 'waiting': True})
         
-        for game_id, game in GAMES.items():
-            if game.get('is_quick_match', False) and game['phase'] != 'game_over':
-                for player_num, player_data in game['players'].items():
-                    if player_data['name'] == player_name:
-                        opponent_num = 2 if player_num == 1 else 1
-                        return self.response(200, 'OK', {
-                            'matched': True,
-                            'game_id': game_id,
-                            'player_number': player_num,
-                            'opponent_name': game['players'][opponent_num]['name']
-                        })
+        for game_id, player_num in STORE.player_games(player_name).items():
+            game = STORE.get(game_id)
+            if game is not None and game.is_quick_match and game.phase != 'game_over':
+                return self.response(200, 'OK', {
+                    'matched': True,
+                    'game_id': game_id,
+                    'player_number': player_num,
+                    'opponent_name': game.player_name(opponent_of(player_num))
+                })
         
         return self.response(404, 'Not Found', {'error': 'Not in quick match queue or game'})
 
-    def handle_get_quick_matches(self):
+    def handle_get_quick_matches(self, params):
         ongoing_matches = []
-        for game_id, game in GAMES.items():
-            if game.get('is_quick_match', False) and game['phase'] != 'game_over':
-                p1_name = game['players'].get(1, {}).get('name')
-                p2_name = game['players'].get(2, {}).get('name')
+        for game_id in STORE.quick_match_ids():
+            game = STORE.get(game_id)
+            if game is not None and game.phase != 'game_over':
+                p1_name = game.player_name(1)
+                p2_name = game.player_name(2)
                 if p1_name and p2_name:
                     ongoing_matches.append({
                         'game_id': game_id,
                         'player1_name': p1_name,
                         'player2_name': p2_name,
-                        'status': game['phase']
+                        'status': game.phase
                     })
         return self.response(200, 'OK', {'matches': ongoing_matches})
 
     def handle_spectate_game(self, payload):
-        game_id = payload.get('game_id')
-        if not game_id or game_id not in GAMES:
+        game_id = payload['game_id']
+        game = STORE.get(game_id)
+        if game is None:
             return self.response(404, 'Not Found', {'error': 'Game not found'})
         
-        game = GAMES[game_id]
-        if not game.get('is_quick_match'):
+        if not game.is_quick_match:
             return self.response(403, 'Forbidden', {'error': 'Only quick matches can be spectated.'})
 
         logging.info(f"Client attempting to spectate game {game_id}")
         return self.response(200, 'OK', {'success': True, 'game_id': game_id, 'message': 'Joined as spectator'})
 
 
-def game_housekeeping():
+def negotiate_board_encoding(headers):
+    board_encoding = headers.get('x-board-encoding', 'json').strip().lower()
+    return board_encoding if board_encoding in BOARD_ENCODINGS else 'json'
+
+
+def game_changed(game, changes=(), event=None):
+    # Raises VersionConflict, before anyone is woken, when another process
+    # saved the game first. `event` is what the journal replays.
+    CHANGES.record(game, changes)
+    STORE.save(game)
+    if JOURNAL is not None and event is not None:
+        JOURNAL.append(game.game_id, game.version, event)
+    CHANGES.notify(game.game_id)
+    schedule_game_deadlines(game)
+
+
+def schedule_game_deadlines(game):
+    # Re-arms the deadlines that matter in the game's current phase and drops
+    # the rest; called after every state change.
+    game_id = game.game_id
+    if game.phase == 'playing':
+        DEADLINES.cancel(('pause', game_id))
+        DEADLINES.schedule(('turn', game_id), game.turn_start_time + TURN_TIMEOUT, turn_timed_out, game_id)
+        for player_num, player in game.players.items():
+            DEADLINES.schedule(('inactive', game_id, player_num), player.last_activity + CLIENT_INACTIVITY_TIMEOUT, player_inactive, game_id, player_num)
+        return
+
+    DEADLINES.cancel(('turn', game_id))
+    for player_num in game.players:
+        DEADLINES.cancel(('inactive', game_id, player_num))
+    if game.phase == 'paused':
+        DEADLINES.schedule(('pause', game_id), game.pause_start_time + RECONNECT_WINDOW_SECONDS, reconnect_window_closed, game_id)
+    elif game.phase == 'game_over':
+        DEADLINES.cancel(('pause', game_id))
+        DEADLINES.schedule(('cleanup', game_id), game.game_end_time + GAME_OVER_LINGER_SECONDS, finished_game_expired, game_id)
+
+
+def cancel_game_deadlines(game_id):
+    for key in (('turn', game_id), ('pause', game_id), ('cleanup', game_id), ('inactive', game_id, 1), ('inactive', game_id, 2)):
+        DEADLINES.cancel(key)
+
+
+def record_result(game):
+    # Called once, after the change that finished the game was saved.
+    winner_number = game.find_player(game.winner_name) if game.winner_name else None
+    loser_name = game.player_name(opponent_of(winner_number)) if winner_number else None
+    if loser_name is None:
+        return
+    STORE.record_result(game.winner_name, loser_name)
+    logging.info(f"Game {game.game_id}: ratings now {game.winner_name} {STORE.rating(game.winner_name)[0]:.0f}, "
+                 f"{loser_name} {STORE.rating(loser_name)[0]:.0f}")
+
+
+def quick_match_made(player1, player2):
+    game_id = httpserver.create_game([player1['name'], player2['name']], is_quick_match=True)
+    logging.info(f"Quick match created: {game_id} with {player1['name']} ({player1['rating']:.0f}) "
+                 f"vs {player2['name']} ({player2['rating']:.0f})")
+    return game_id
+
+
+def remove_game(game_id):
+    if not STORE.delete(game_id):
+        return False
+    ROOM_CODES.release(game_id)
+    cancel_game_deadlines(game_id)
+    STATE_CACHE.pop(game_id, None)
+    if JOURNAL is not None:
+        JOURNAL.append(game_id, 0, ('remove',))
+    CHANGES.removed(game_id)
+    return True
+
+
+def turn_timed_out(game_id):
+    game = STORE.get(game_id)
+    if game is None or game.phase != 'playing':
+        return
+    if time.time() - game.turn_start_time < TURN_TIMEOUT:
+        schedule_game_deadlines(game)
+        return
+    logging.info(f"Game {game_id}: {game.player_name(game.turn)}'s turn timed out.")
+    with game.lock:
+        game.time_out_turn()
+        game_changed(game, event=('timeout',))
+
+
+def player_inactive(game_id, player_num):
+    game = STORE.get(game_id)
+    if game is None or game.phase != 'playing':
+        return
+    player = game.players[player_num]
+    if not player.connected:
+        return
+    # Requests only touch last_activity, so most firings just find a newer
+    # deadline and re-arm; a held poll counts as activity until it returns.
+    deadline = player.last_activity + CLIENT_INACTIVITY_TIMEOUT
+    if player.pending_polls:
+        deadline = time.time() + CLIENT_INACTIVITY_TIMEOUT
+    if deadline > time.time():
+        DEADLINES.schedule(('inactive', game_id, player_num), deadline, player_inactive, game_id, player_num)
+        return
+    logging.info(f"Game {game_id}: Player {player.name} inactive. Pausing game.")
+    with game.lock:
+        game.pause(player_num)
+        game_changed(game, event=('pause', player_num))
+
+
+def reconnect_window_closed(game_id):
+    game = STORE.get(game_id)
+    if game is None or game.phase != 'paused':
+        return
+    logging.info(f"Game {game_id}: Reconnect window closed.")
+    with game.lock:
+        game.forfeit_disconnected()
+        game_changed(game, event=('forfeit',))
+    record_result(game)
+
+
+def finished_game_expired(game_id):
+    game = STORE.get(game_id)
+    if game is not None and game.phase == 'game_over' and remove_game(game_id):
+        logging.info(f"Removed inactive/finished game {game_id}")
+
+
+def store_watcher():
+    # Wakes this process's long polls and event streams for changes that
+    # other processes saved to a shared store, and drops the cached states
+    # of games they removed.
     while True:
-        games_to_remove = []
-        for game_id, game in list(GAMES.items()):
-            if game['phase'] == 'playing':
-                time_since_turn_start = time.time() - game.get('turn_start_time', 0)
-                if time_since_turn_start > TURN_TIMEOUT:
-                    current_player_num = game['turn']
-                    current_player_name = game['players'][current_player_num]['name']
-                    logging.info(f"Game {game_id}: {current_player_name}'s turn timed out.")
-                    
-                    game['turn'] = 2 if current_player_num == 1 else 1
-                    game['turn_start_time'] = time.time()
-                    game['status_message'] = f"{current_player_name}'s turn timed out. It's now {game['players'][game['turn']]['name']}'s turn."
-
-                for player_num, player_data in game['players'].items():
-                    if player_data['connected'] and time.time() - player_data.get('last_activity', 0) > CLIENT_INACTIVITY_TIMEOUT:
-                        player_data['connected'] = False
-                        logging.info(f"Game {game_id}: Player {player_data['name']} inactive. Pausing game.")
-                        
-                        game['phase'] = 'paused'
-                        game['pause_start_time'] = time.time()
-                        game['disconnected_player_num'] = player_num
-                        game['status_message'] = f"{player_data['name']} has disconnected. Reconnection window open."
-                        
-                        break
-            
-            elif game['phase'] == 'paused':
-                if time.time() - game.get('pause_start_time', 0) > RECONNECT_WINDOW_SECONDS:
-                    logging.info(f"Game {game_id}: Reconnect window closed.")
-                    game['phase'] = 'game_over'
-                    
-                    disconnected_player_num = game.get('disconnected_player_num')
-                    winner_num = 2 if disconnected_player_num == 1 else 1
-                    
-                    if winner_num in game['players']:
-                        winner_name = game['players'][winner_num]['name']
-                        game['winner_name'] = winner_name
-                        game['status_message'] = f"Game Over! {winner_name} wins by opponent disconnect!"
-                    else:
-                        game['status_message'] = "Game Over! Player disconnected."
-
-
-            if game['phase'] == 'game_over':
-                if 'game_end_time' not in game:
-                    game['game_end_time'] = time.time()
-                
-                if time.time() - game.get('game_end_time', 0) > 10: 
-                    games_to_remove.append(game_id)
-                    continue
-
-        for game_id in games_to_remove:
-            if game_id in GAMES:
-                del GAMES[game_id]
-                logging.info(f"Removed inactive/finished game {game_id}")
-
-        with QUICK_MATCH_LOCK:
-            current_time = time.time()
-            players_to_remove = []
-            for i, queued_player in enumerate(QUICK_MATCH_QUEUE):
-                if current_time - queued_player['timestamp'] > QUICK_MATCH_TIMEOUT:
-                    players_to_remove.append(i)
-            
-            for i in reversed(players_to_remove):  
-                removed_player = QUICK_MATCH_QUEUE.pop(i)
-                logging.info(f"Removed {removed_player['name']} from quick match queue (timeout)")
+        time.sleep(STORE_WATCH_INTERVAL)
+        game_ids = set(CHANGES.watched_games())
+        game_ids.update(list(STATE_CACHE))
+        if not game_ids:
+            continue
+        try:
+            versions = STORE.versions(game_ids)
+        except Exception as e:
+            logging.error(f"Error reading game versions: {e}")
+            continue
+        for game_id in game_ids:
+            if game_id in versions:
+                CHANGES.observed(game_id, versions[game_id])
+            else:
+                STATE_CACHE.pop(game_id, None)
+                CHANGES.removed(game_id)
 
-        time.sleep(1)
+
+def game_housekeeping():
+    # Sleeps until the next deadline instead of scanning every game, so the
+    # work done here tracks the number of expiring events.
+    while True:
+        DEADLINES.wait(HOUSEKEEPING_MAX_SLEEP)
+        for callback, args in DEADLINES.pop_due():
+            try:
+                callback(*args)
+            except VersionConflict as e:
+                # Another process changed the game and re-armed its own
+                # deadlines for the new state.
+                logging.info(f"Skipped housekeeping callback {callback.__name__}{args}: {e}")
+            except Exception as e:
+                logging.error(f"Error in housekeeping callback {callback.__name__}{args}: {e}")
 
 
 httpserver = BattleshipHttpServer()
+# Rebuilt in main() when the store is replaced.
+MATCHMAKER = Matchmaker(STORE, DEADLINES, QUICK_MATCH_TIMEOUT, quick_match_made)
 
 class ProcessTheClient(threading.Thread):
     def __init__(self, connection, address):
@@ -557,39 +927,49 @@ class ProcessTheClient(threading.Thread):
 
     def run(self):
         self.connection.settimeout(10.0)  
+        parser = RequestParser()
+        view = memoryview(bytearray(RECV_SIZE))
+        # Responses to pipelined requests, sent together once every request
+        # already received has been answered.
+        pending = []
         
         while True:
             try:
-                request_data = b''
-                while b'\r\n\r\n' not in request_data:
-                    chunk = self.connection.recv(4096)
-                    if not chunk:
-                        break
-                    request_data += chunk
-                
-                if not request_data:
-                    break 
-
-                header_part, body_part = request_data.split(b'\r\n\r\n', 1)
-                headers = {}
-                header_lines = header_part.split(b'\r\n')
-                for line in header_lines[1:]:
-                    if b': ' in line:
-                        key, value = line.split(b': ', 1)
-                        headers[key.lower().decode('utf-8')] = value.decode('utf-8')
-
-                content_length = int(headers.get('content-length', 0))
-                
-                while len(body_part) < content_length:
-                    body_part += self.connection.recv(4096)
-
-                request_str = request_data.decode('utf-8', errors='ignore')
-                logging.info(f"Request from {self.address}:\n--- START ---\n{request_str[:500]}\n--- END ---")
+                try:
+                    request = parser.next_request()
+                    if request is None:
+                        if pending:
+                            self.connection.sendall(b''.join(pending))
+                            pending = []
+                        request = receive_request(self.connection, parser, view)
+                except BadRequest as e:
+                    logging.info(f"Bad request from {self.address}: {e}")
+                    pending.append(httpserver.response(400, 'Bad Request', {'error': str(e)}, {'Connection': 'close'}))
+                    self.connection.sendall(b''.join(pending))
+                    break
+                if request is None:
+                    break
 
-                response_bytes = httpserver.process(request_str)
-                self.connection.sendall(response_bytes)
+                logging.info(f"Request from {self.address}:\n--- START ---\n{request.head[:500]}\n--- END ---")
+
+                response_bytes = httpserver.process(request)
+                if isinstance(response_bytes, (EventStream, PendingResponse)) and pending:
+                    self.connection.sendall(b''.join(pending))
+                    pending = []
+                if isinstance(response_bytes, EventStream):
+                    stream = response_bytes.chunks()
+                    try:
+                        for chunk in stream:
+                            self.connection.sendall(chunk)
+                    finally:
+                        stream.close()
+                    break
+                if isinstance(response_bytes, PendingResponse):
+                    response_bytes = response_bytes.wait()
+                pending.append(response_bytes)
 
-                if headers.get('connection', 'keep-alive').lower() == 'close':
+                if not request.keep_alive:
+                    self.connection.sendall(b''.join(pending))
                     break
 
             except socket.timeout:
@@ -628,7 +1008,115 @@ class Server(threading.Thread):
             except Exception as e:
                 logging.error(f"Error accepting connections: {e}")
 
+class AsyncServer:
+    def __init__(self, port=8889):
+        self.port = port
+        self.connection_count = 0
+
+    async def handle_client(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        self.connection_count += 1
+
+        parser = RequestParser()
+        while True:
+            try:
+                request = parser.next_request()
+                if request is None:
+                    # Responses to pipelined requests are written together
+                    # once every request already received has been answered.
+                    await writer.drain()
+                while request is None:
+                    data = await asyncio.wait_for(reader.read(RECV_SIZE), timeout=10.0)
+                    if not data:
+                        break
+                    parser.feed(data)
+                    request = parser.next_request()
+                if request is None:
+                    break
+
+                logging.info(f"Request from {address}:\n--- START ---\n{request.head[:500]}\n--- END ---")
+
+                response_bytes = httpserver.process(request)
+                if isinstance(response_bytes, EventStream):
+                    stream = response_bytes.chunks_async()
+                    try:
+                        async for chunk in stream:
+                            writer.write(chunk)
+                            await writer.drain()
+                    finally:
+                        await stream.aclose()
+                    break
+                if isinstance(response_bytes, PendingResponse):
+                    await writer.drain()
+                    response_bytes = await response_bytes.wait_async()
+                writer.write(response_bytes)
+
+                if not request.keep_alive:
+                    await writer.drain()
+                    break
+
+            except BadRequest as e:
+                logging.info(f"Bad request from {address}: {e}")
+                writer.write(httpserver.response(400, 'Bad Request', {'error': str(e)}, {'Connection': 'close'}))
+                break
+            except asyncio.TimeoutError:
+                logging.info(f"Connection from {address} timed out. Closing.")
+                break
+            except (ConnectionResetError, BrokenPipeError):
+                logging.info(f"Client {address} forcefully closed the connection.")
+                break
+            except Exception as e:
+                logging.error(f"Error processing client {address}: {e}")
+                break
+
+        self.connection_count -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        logging.info(f"Connection closed for {address}")
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, '0.0.0.0', self.port, backlog=1024)
+        logging.info(f"Battleship HTTP Server (asyncio) started on port {self.port}...")
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        raise_open_file_limit()
+        asyncio.run(self.serve())
+
+
+def raise_open_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        target = hard if hard != resource.RLIM_INFINITY else 65536
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            logging.info(f"Raised open file limit from {soft} to {target}")
+        except (ValueError, OSError) as e:
+            logging.warning(f"Could not raise open file limit: {e}")
+
+
+def recover_games(journal):
+    now = time.time()
+    for game in journal.recover().values():
+        game.restart_clocks(now)
+        ROOM_CODES.reserve(game.game_id)
+        STORE.create(game)
+        schedule_game_deadlines(game)
+    journal.start()
+
+
+SERVER_MODES = ('thread', 'async')
+
 def main():
+    global SHARD_INDEX, SHARD_COUNT, ROOM_CODES, STORE, JOURNAL, MATCHMAKER
     port = 8889  
     if len(sys.argv) >= 2:
         try:
@@ -636,11 +1124,47 @@ def main():
         except ValueError:
             logging.error("Invalid port number. Using default port 8889.")
 
+    mode = 'thread'
+    if len(sys.argv) >= 3:
+        mode = sys.argv[2].lower()
+        if mode not in SERVER_MODES:
+            logging.error(f"Unknown server mode '{mode}'. Using 'thread'.")
+            mode = 'thread'
+
+    if len(sys.argv) >= 4:
+        try:
+            SHARD_INDEX, SHARD_COUNT = parse_shard(sys.argv[3])
+        except ValueError:
+            logging.error(f"Invalid shard '{sys.argv[3]}', expected <index>/<count>. Using 0/1.")
+        logging.info(f"Serving shard {SHARD_INDEX} of {SHARD_COUNT}")
+
+    if len(sys.argv) >= 5 and sys.argv[4].startswith('journal:'):
+        JOURNAL = Journal(sys.argv[4][len('journal:'):], STORE.games)
+    elif len(sys.argv) >= 5:
+        try:
+            STORE = open_store(sys.argv[4])
+            MATCHMAKER = Matchmaker(STORE, DEADLINES, QUICK_MATCH_TIMEOUT, quick_match_made)
+            logging.info(f"Using game store {sys.argv[4]}")
+        except (ValueError, OSError) as e:
+            logging.error(f"Could not open game store '{sys.argv[4]}': {e}. Using memory.")
+
+    # A shared store keeps the codes in use by every process serving the
+    # shard; otherwise they are this process's own.
+    ROOM_CODES = STORE.room_codes(SHARD_INDEX, SHARD_COUNT, ROOM_CODE_LENGTH)
+    if JOURNAL is not None:
+        recover_games(JOURNAL)
+
+    if STORE.shared:
+        threading.Thread(target=store_watcher, daemon=True).start()
+
     housekeeping_thread = threading.Thread(target=game_housekeeping, daemon=True)
     housekeeping_thread.start()
 
-    svr = Server(port)
-    svr.start()
+    if mode == 'async':
+        AsyncServer(port).run()
+    else:
+        svr = Server(port)
+        svr.start()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
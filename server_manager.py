@@ -1,77 +1,309 @@
 import asyncio
-import hashlib
+import time
 
+from battleship import codec
+from battleship.router import parse_query
+from battleship.sharding import shard_of
+
+# The position in this list is the backend's shard: start each one as
+# `python server.py <port> <mode> <index>/<count>` so that the room codes it
+# hands out route back to it.
 BACKEND_SERVERS = [
     ("127.0.0.1", 8889),
     ("127.0.0.1", 8890),
     ("127.0.0.1", 8891)
 ]
 
-sticky_sessions = {}
-
 LISTEN_PORT = 8888
 HOST = "0.0.0.0"
+QUICK_MATCH_TIMEOUT = 120
+# Routes whose answers the load balancer reads or builds itself.
+QUICK_MATCH_ROUTES = ('/api/quick_match', '/api/check_quick_match', '/api/cancel_quick_match', '/api/quick_matches')
+
+# Connections this load balancer holds open to each backend, one per client
+# connection that has used it. New games go to the backend with the fewest,
+# which follows client traffic rather than the number of games hosted.
+backend_connections = [0] * len(BACKEND_SERVERS)
+# Quick match has no room code until the match is made, so remember which
+# backend each player's queue entry lives on until their match is seen or
+# their entry is gone. Everyone still waiting is listed in queue order so
+# the next player is sent to the same backend.
+quick_match_players = {}
+waiting_players = {}
+
+
+def least_connected_backend():
+    return min(range(len(BACKEND_SERVERS)), key=lambda index: backend_connections[index])
+
+
+def query_params(path):
+    return parse_query(path.partition('?')[2])
 
-def get_sticky_server_index(client_ip):
-    ip_hash = int(hashlib.sha1(client_ip.encode('utf-8')).hexdigest(), 16)
-    return ip_hash % len(BACKEND_SERVERS)
 
-async def forward(reader, writer):
+def parse_payload(body, headers):
+    # Bodies in a format we do not know are read as JSON, as the backends do.
+    media_type = codec.media_type_of(headers.get('content-type', codec.JSON))
+    if media_type not in codec.CODECS:
+        media_type = codec.JSON
     try:
-        while True:
-            data = await reader.read(4096)
-            if not data:
-                break
-            
-            writer.write(data)
-            await writer.drain()
-    except asyncio.CancelledError:
-        pass
-    finally:
+        payload = codec.decode(media_type, body) if body else {}
+    except codec.CodecError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def prune_waiting_players():
+    now = time.time()
+    for name, (_, queued_at) in list(waiting_players.items()):
+        if now - queued_at > QUICK_MATCH_TIMEOUT:
+            del waiting_players[name]
+            quick_match_players.pop(name, None)
+    # Matched players whose client never checked back.
+    for name, (_, noted_at) in list(quick_match_players.items()):
+        if now - noted_at > QUICK_MATCH_TIMEOUT:
+            del quick_match_players[name]
+
+
+def batch_shards(payload):
+    # The shards of the games a batch's operations name, or None if one of
+    # them has to pass through the load balancer on its own.
+    shards = set()
+    operations = payload.get('operations')
+    if not isinstance(operations, list):
+        return shards
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+            continue
+        path = operation['path']
+        if path.split('?', 1)[0] in QUICK_MATCH_ROUTES:
+            return None
+        body = operation.get('body')
+        game_id = query_params(path).get('game_id') or (body.get('game_id') if isinstance(body, dict) else None)
+        shard = shard_of(game_id, len(BACKEND_SERVERS))
+        if shard is not None:
+            shards.add(shard)
+    return shards
+
+
+def choose_backend(path, payload):
+    route = path.split('?', 1)[0]
+    if route == '/api/batch':
+        # handle_client has already refused batches that span shards.
+        shards = batch_shards(payload)
+        return shards.pop() if shards else least_connected_backend()
+    if route == '/api/host':
+        return least_connected_backend()
+    if route == '/api/quick_match':
+        prune_waiting_players()
+        if waiting_players:
+            return next(iter(waiting_players.values()))[0]
+        return least_connected_backend()
+    if route in ('/api/check_quick_match', '/api/cancel_quick_match'):
+        entry = quick_match_players.get(payload.get('player_name'))
+        return least_connected_backend() if entry is None else entry[0]
+
+    game_id = query_params(path).get('game_id') or payload.get('game_id')
+    shard = shard_of(game_id, len(BACKEND_SERVERS))
+    return least_connected_backend() if shard is None else shard
+
+
+def note_quick_match(route, payload, index, status, headers, body):
+    player_name = payload.get('player_name')
+    result = parse_payload(body, headers) if status == 200 else {}
+    now = time.time()
+    if route == '/api/quick_match' and status == 200:
+        if result.get('matched'):
+            # The opponent learns of the match from their next check, which
+            # still has to reach this backend.
+            opponent_name = result.get('opponent_name')
+            waiting_players.pop(opponent_name, None)
+            if opponent_name in quick_match_players:
+                quick_match_players[opponent_name] = (quick_match_players[opponent_name][0], now)
+            quick_match_players.pop(player_name, None)
+        else:
+            quick_match_players[player_name] = (index, now)
+            waiting_players[player_name] = (index, now)
+    elif route == '/api/cancel_quick_match' and status == 200:
+        waiting_players.pop(player_name, None)
+        quick_match_players.pop(player_name, None)
+    elif route == '/api/check_quick_match' and (result.get('matched') or status == 404):
+        waiting_players.pop(player_name, None)
+        quick_match_players.pop(player_name, None)
+
+
+async def read_message(reader):
+    # Reads one HTTP message; the body is None when there is no
+    # Content-Length and the rest of the connection is the body.
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    headers = {}
+    for line in head.split(b'\r\n')[1:]:
+        if b': ' in line:
+            key, value = line.split(b': ', 1)
+            headers[key.lower().decode('utf-8')] = value.decode('utf-8')
+    if 'content-length' not in headers:
+        return head, headers, None
+    body = await reader.readexactly(int(headers['content-length']))
+    return head, headers, body
+
+
+def status_of(head):
+    try:
+        return int(head.split(b' ', 2)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def encoded_response(media_type, body, status='200 OK'):
+    body_bytes = codec.encode(media_type, body)
+    head = (f"HTTP/1.0 {status}\r\nContent-Type: {media_type}\r\nServer: BattleshipHTTP/1.0\r\n"
+            f"Connection: keep-alive\r\nContent-Length: {len(body_bytes)}\r\n\r\n")
+    return head.encode('utf-8') + body_bytes
+
+
+class BackendConnections:
+    # One keep-alive connection per backend for each client connection.
+    def __init__(self):
+        self.connections = {}
+
+    async def get(self, index):
+        if index not in self.connections:
+            host, port = BACKEND_SERVERS[index]
+            self.connections[index] = await asyncio.open_connection(host, port)
+            backend_connections[index] += 1
+        return self.connections[index]
+
+    async def drop(self, index):
+        reader, writer = self.connections.pop(index)
+        backend_connections[index] -= 1
         writer.close()
-        await writer.wait_closed()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    async def exchange(self, index, request):
+        # A reused connection may have been closed by the backend's idle
+        # timeout before it read anything, so retry once on a fresh one.
+        for attempt in range(2):
+            reused = index in self.connections
+            reader, writer = await self.get(index)
+            try:
+                writer.write(request)
+                await writer.drain()
+                response = await read_message(reader)
+            except (ConnectionError, OSError):
+                response = None
+            if response is not None:
+                return reader, response
+            await self.drop(index)
+            if not reused:
+                break
+        return None, None
+
+    async def close(self):
+        for index in list(self.connections):
+            await self.drop(index)
+
+
+async def gather_quick_matches(backends, request, media_type):
+    matches = []
+    for index in range(len(BACKEND_SERVERS)):
+        try:
+            _, response = await backends.exchange(index, request)
+        except (ConnectionError, OSError):
+            continue
+        if response is not None and response[2] is not None:
+            matches.extend(parse_payload(response[2], response[1]).get('matches', []))
+    return encoded_response(media_type, {'matches': matches})
+
 
 async def handle_client(client_reader, client_writer):
     client_addr = client_writer.get_extra_info('peername')
-    client_ip = client_addr[0]
     print(f"[LB-async] Connection from {client_addr}")
-
-    if client_ip in sticky_sessions:
-        target_server_index = sticky_sessions[client_ip]
-    else:
-        target_server_index = get_sticky_server_index(client_ip)
-        sticky_sessions[client_ip] = target_server_index
-    
-    target_host, target_port = BACKEND_SERVERS[target_server_index]
+    backends = BackendConnections()
 
     try:
-        backend_reader, backend_writer = await asyncio.open_connection(
-            target_host, target_port)
-    except Exception as e:
-        print(f"[LB-async] Error connecting to backend {target_host}:{target_port} - {e}")
-        client_writer.close()
-        await client_writer.wait_closed()
-        return
+        while True:
+            message = await read_message(client_reader)
+            if message is None:
+                break
+            head, headers, body = message
+            body = body or b''
+            request = head + body
+            path = head.split(b'\r\n', 1)[0].decode('utf-8', errors='ignore').split(' ')
+            path = path[1] if len(path) > 1 else '/'
+            route = path.split('?', 1)[0]
 
-    print(f"[LB-async] Routing {client_ip} to backend {target_host}:{target_port}")
+            if route == '/api/quick_matches':
+                client_writer.write(await gather_quick_matches(backends, request, codec.negotiate(headers.get('accept'))))
+                await client_writer.drain()
+                if headers.get('connection', 'keep-alive').lower() == 'close':
+                    break
+                continue
+
+            payload = parse_payload(body, headers)
+            if route == '/api/batch':
+                # Backends only know their own games, so a batch has to stay
+                # within one shard.
+                shards = batch_shards(payload)
+                error = None
+                if shards is None:
+                    error = 'Quick match operations cannot be batched'
+                elif len(shards) > 1:
+                    error = 'Batch operations must all be for games on the same server'
+                if error is not None:
+                    client_writer.write(encoded_response(codec.negotiate(headers.get('accept')), {'error': error}, '400 Bad Request'))
+                    await client_writer.drain()
+                    if headers.get('connection', 'keep-alive').lower() == 'close':
+                        break
+                    continue
+            index = choose_backend(path, payload)
+            try:
+                backend_reader, response = await backends.exchange(index, request)
+            except (ConnectionError, OSError) as e:
+                target_host, target_port = BACKEND_SERVERS[index]
+                print(f"[LB-async] Error connecting to backend {target_host}:{target_port} - {e}")
+                break
+            if response is None:
+                break
+            print(f"[LB-async] Routing {client_addr[0]} {route} to backend {index}")
 
-    client_to_backend = asyncio.create_task(
-        forward(client_reader, backend_writer))
-    
-    backend_to_client = asyncio.create_task(
-        forward(backend_reader, client_writer))
+            response_head, response_headers, response_body = response
+            if route in QUICK_MATCH_ROUTES:
+                note_quick_match(route, payload, index, status_of(response_head), response_headers, response_body)
 
-    done, pending = await asyncio.wait(
-        [client_to_backend, backend_to_client],
-        return_when=asyncio.FIRST_COMPLETED
-    )
+            client_writer.write(response_head)
+            if response_body is None:
+                # Streamed response (server-sent events): relay until the
+                # backend closes it, which also ends this client connection.
+                while True:
+                    chunk = await backend_reader.read(4096)
+                    if not chunk:
+                        break
+                    client_writer.write(chunk)
+                    await client_writer.drain()
+                break
+            client_writer.write(response_body)
+            await client_writer.drain()
 
-    for task in pending:
-        task.cancel()
+            if headers.get('connection', 'keep-alive').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        await backends.close()
+        client_writer.close()
+        try:
+            await client_writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
 
 async def main():
     print(f"[LB-async] Starting server on port {LISTEN_PORT}")
-    
+
     server = await asyncio.start_server(
         handle_client, HOST, LISTEN_PORT)
 
@@ -82,4 +314,4 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("[LB-async] Server shutting down.")
\ No newline at end of file
+        print("[LB-async] Server shutting down.")